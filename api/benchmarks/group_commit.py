@@ -0,0 +1,106 @@
+"""Order intake throughput vs latency at different group-commit windows
+
+    python -m api.benchmarks.group_commit --orders 5000 --concurrency 32 --windows 0 0.5 1 2 5
+
+Threads call controllers.orders.create directly (the same code POST /orders/
+runs) against a SQLite file, so the numbers are about commits, not HTTP.
+Window 0 is the default one-commit-per-order path.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from ..controllers import orders as order_controller
+from ..dependencies.group_commit import committer
+from ..dependencies.snowflake import generator
+from ..models import model_loader
+from ..schemas.orders import OrderCreate
+from .load_test import percentile
+from .seed import sqlite_engine
+
+ORDER = OrderCreate(customer_name="Intake Bench", phone="555-0300", order_type="takeout")
+
+
+def run_window(engine, window_ms, orders=2000, concurrency=32):
+    """Create `orders` orders from `concurrency` threads; returns throughput and latency"""
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    generator.lease.bind = engine  # Tracking numbers lease their node id in the benchmark database
+    generator.start()
+    commits = []
+    count_commit = lambda connection: commits.append(1)
+    event.listen(engine, "commit", count_commit)
+
+    previous_window = committer.window_seconds
+    committer.window_seconds = window_ms / 1000
+    latencies = []
+    remaining = [orders]
+    lock = threading.Lock()
+
+    def worker():
+        db = Session()
+        try:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                order_controller.create(db, ORDER)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        committer.window_seconds = previous_window
+        event.remove(engine, "commit", count_commit)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "window_ms": window_ms,
+        "orders": len(latencies),
+        "commits": len(commits),
+        "orders_per_commit": round(len(latencies) / len(commits), 1) if commits else None,
+        "orders_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def run(engine, windows=(0, 0.5, 1, 2, 5), orders=2000, concurrency=32):
+    return [run_window(engine, window_ms, orders, concurrency) for window_ms in windows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark group commit of order inserts")
+    parser.add_argument("--db", default="bench_intake.db")
+    parser.add_argument("--orders", type=int, default=5000, help="Orders per window size")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 0.5, 1, 2, 5], help="Window sizes in ms")
+    parser.add_argument("--synchronous", default=None, help="SQLite synchronous pragma, e.g. FULL to fsync every commit")
+    args = parser.parse_args(argv)
+
+    if args.synchronous:
+        from ..dependencies.config import conf
+        conf.sqlite_synchronous = args.synchronous
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = sqlite_engine(args.db)
+    model_loader.upgrade(engine)
+    print(json.dumps(run(engine, args.windows, args.orders, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
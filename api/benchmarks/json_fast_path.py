@@ -0,0 +1,77 @@
+"""Default response_model path vs the fast JSON path on a large list response
+
+    python -m api.benchmarks.json_fast_path --orders 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from ..dependencies.database import get_db, get_read_db
+from .seed import seed, sqlite_engine
+
+ENDPOINTS = ["/orders/", "/orderdetails/", "/sandwiches/", "/reviews/"]
+
+
+def time_request(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return statistics.median(timings), response
+
+
+def run(engine, repeat=5, endpoints=ENDPOINTS):
+    from ..main import app
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def bench_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = bench_get_db
+    app.dependency_overrides[get_read_db] = bench_get_db
+    report = {}
+    try:
+        client = TestClient(app)
+        for url in endpoints:
+            default_seconds, default_response = time_request(client, url, repeat)
+            fast_seconds, fast_response = time_request(client, f"{url}?fast=true", repeat)
+            report[url] = {
+                "rows": len(default_response.json()),
+                "bytes": len(default_response.content),
+                "same_json": default_response.json() == fast_response.json(),
+                "default_ms": round(default_seconds * 1000, 1),
+                "fast_ms": round(fast_seconds * 1000, 1),
+                "speedup": round(default_seconds / fast_seconds, 2),
+            }
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fast JSON path on large list endpoints")
+    parser.add_argument("--db", default="bench_json.db")
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = sqlite_engine(args.db)
+    seed(engine, orders=args.orders)
+    print(json.dumps(run(engine, repeat=args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""End-to-end load test: seed a SQLite database, drive the app with a weighted mix
+
+    python -m api.benchmarks.load_test --orders 1000000 --requests 20000 --output bench.json
+    python -m api.benchmarks.load_test --reuse-db --baseline bench.json
+
+Requests go through the real ASGI app (routers, controllers, ORM, SQLite) with
+async httpx, or to a running server with --url. The JSON report has req/s and
+p50/p95/p99 latency per endpoint, so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta
+import httpx
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from ..dependencies.database import get_db, get_read_db
+from ..models.orders import Order
+from ..models.sandwiches import Sandwich
+from .seed import seed, sqlite_engine
+
+
+class Workload:
+    """Weighted request mix: menu browsing, tracking polls, checkouts and staff reports"""
+
+    def __init__(self, sandwich_count, tracking_numbers, rng):
+        self.sandwich_count = sandwich_count
+        self.tracking_numbers = tracking_numbers
+        self.rng = rng
+        # (endpoint name, weight, request coroutine)
+        self.mix = [
+            ("GET /sandwiches/", 25, self.menu),
+            ("GET /sandwiches/{item_id}", 10, self.menu_item),
+            ("GET /orders/track/{tracking_number}", 30, self.track),
+            ("POST /orders/ + POST /orderdetails/", 10, self.checkout),
+            ("GET /reviews/queues/unanswered", 8, self.unanswered_queue),
+            ("GET /reviews/low-rated/", 5, self.low_rated),
+            ("GET /recipes/margins/", 5, self.margins),
+            ("GET /orders/date-range/", 7, self.date_range),
+        ]
+        self.weights = [weight for _, weight, _ in self.mix]
+
+    def pick(self):
+        return self.rng.choices(self.mix, weights=self.weights)[0]
+
+    async def menu(self, client):
+        return await client.get("/sandwiches/")
+
+    async def menu_item(self, client):
+        return await client.get(f"/sandwiches/{self.rng.randint(1, self.sandwich_count)}")
+
+    async def track(self, client):
+        return await client.get(f"/orders/track/{self.rng.choice(self.tracking_numbers)}")
+
+    async def checkout(self, client):
+        response = await client.post("/orders/", json={
+            "customer_name": "Load Test",
+            "phone": "555-0199",
+            "order_type": "takeout"
+        })
+        if response.status_code != 200:
+            return response
+        sandwich_id = self.rng.randint(1, self.sandwich_count)
+        return await client.post("/orderdetails/", json={
+            "order_id": response.json()["id"],
+            "sandwich_id": sandwich_id,
+            "amount": self.rng.randint(1, 3),
+            "unit_price": 9.5
+        })
+
+    async def unanswered_queue(self, client):
+        return await client.get("/reviews/queues/unanswered", params={"limit": 50})
+
+    async def low_rated(self, client):
+        return await client.get("/reviews/low-rated/")
+
+    async def margins(self, client):
+        return await client.get("/recipes/margins/")
+
+    async def date_range(self, client):
+        # One day of orders, like a daily revenue check
+        end = datetime.now() - timedelta(days=self.rng.randint(0, 300))
+        return await client.get("/orders/date-range/", params={
+            "start_date": (end - timedelta(days=1)).isoformat(),
+            "end_date": end.isoformat()
+        })
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    def stats(values, error_count):
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "errors": error_count,
+            "req_per_s": round(len(values) / elapsed, 1) if elapsed else None,
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3) if values else None,
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3) if values else None,
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3) if values else None,
+        }
+
+    every_latency = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": stats(every_latency, sum(errors.values())),
+        "endpoints": {name: stats(values, errors.get(name, 0)) for name, values in sorted(latencies.items())}
+    }
+
+
+async def drive(client, workload, total_requests, concurrency, warmup=0):
+    latencies = {}
+    errors = {}
+    remaining = total_requests + warmup
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            measured = remaining < total_requests
+            name, _, request = workload.pick()
+            started = time.perf_counter()
+            try:
+                response = await request(client)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if not measured:
+                continue
+            latencies.setdefault(name, []).append(time.perf_counter() - started)
+            if failed:
+                errors[name] = errors.get(name, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(engine, tracking_numbers, total_requests=2000, concurrency=16, url=None, warmup=50, random_seed=0):
+    """Run the workload against the app (in-process) or a server at url; returns the report"""
+    with engine.connect() as connection:
+        sandwich_count = connection.execute(select(func.count(Sandwich.id))).scalar()
+    workload = Workload(sandwich_count, tracking_numbers, random.Random(random_seed))
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+        overrides = None
+    else:
+        from ..main import app
+        from ..dependencies.snowflake import generator
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        generator.lease.bind = engine  # Checkouts lease their tracking-number node id here too
+        generator.start()
+
+        def bench_get_db():
+            db = Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = bench_get_db
+        app.dependency_overrides[get_read_db] = bench_get_db
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async def main():
+        async with client:
+            return await drive(client, workload, total_requests, concurrency, warmup)
+
+    try:
+        latencies, errors, elapsed = asyncio.run(main())
+    finally:
+        if overrides is not None:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+    report = summarize(latencies, errors, elapsed)
+    report["config"] = {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "target": url or "in-process",
+        "database": str(engine.url),
+    }
+    return report
+
+
+def compare(report, baseline):
+    """Per-endpoint req/s and p95 change against an earlier report"""
+    lines = []
+    for name, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before.get("p95_ms") or not current.get("p95_ms"):
+            continue
+        lines.append(
+            f"{name:45} p95 {before['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms "
+            f"({(current['p95_ms'] / before['p95_ms'] - 1) * 100:+6.1f}%)   "
+            f"req/s {before['req_per_s']:8.1f} -> {current['req_per_s']:8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a SQLite database and load-test the sandwich API")
+    parser.add_argument("--db", default="bench.db", help="SQLite file to seed and test against")
+    parser.add_argument("--reuse-db", action="store_true", help="Skip seeding and reuse an existing --db")
+    parser.add_argument("--sandwiches", type=int, default=50)
+    parser.add_argument("--resources", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--review-ratio", type=float, default=0.3, help="Share of order lines that get a review")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--url", help="Test a running server instead of the in-process app")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    if not args.reuse_db and os.path.exists(args.db):
+        os.remove(args.db)
+    engine = sqlite_engine(args.db)
+
+    if args.reuse_db:
+        with engine.connect() as connection:
+            tracking_numbers = list(connection.execute(select(Order.tracking_number).limit(100000)).scalars())
+    else:
+        started = time.perf_counter()
+        tracking_numbers = seed(
+            engine, sandwiches=args.sandwiches, resources=args.resources,
+            orders=args.orders, review_ratio=args.review_ratio
+        )
+        print(f"Seeded {args.orders} orders in {time.perf_counter() - started:.1f}s")
+
+    report = run(engine, tracking_numbers, total_requests=args.requests, concurrency=args.concurrency, url=args.url)
+    report["git_revision"] = _git_revision()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            print(compare(report, json.load(file)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import random
+from datetime import datetime, timedelta
+from ..dependencies.database import create_db_engine
+from ..models import model_loader
+from ..models.orders import Order
+from ..models.order_details import OrderDetail
+from ..models.sandwiches import Sandwich
+from ..models.resources import Resource
+from ..models.recipes import Recipe
+from ..models.reviews import Review
+from ..models.promocodes import PromoCode
+
+BATCH_SIZE = 10000
+CATEGORIES = ["vegetarian", "spicy", "kids", "low-fat", "vegan", "classic"]
+COMPLAINTS = ["Too salty", "Cold when it arrived", "Bread was stale", "Missing sauce", None]
+
+
+def _insert_batches(connection, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            connection.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+
+
+def seed(engine, sandwiches=50, resources=100, ingredients_per_sandwich=5, orders=100000,
+         lines_per_order=3, review_ratio=0.3, days=365, random_seed=0):
+    """Create the schema and fill it with a realistic, reproducible dataset
+
+    Returns the tracking numbers of the seeded orders, for tracking-poll traffic.
+    """
+    rng = random.Random(random_seed)
+    model_loader.upgrade(engine)
+    now = datetime.now()
+    start = now - timedelta(days=days)
+
+    with engine.begin() as connection:
+        _insert_batches(connection, Resource.__table__, (
+            {
+                "id": resource_id,
+                "item": f"ingredient-{resource_id}",
+                "amount": rng.randint(0, 500),
+                "unit": rng.choice(["piece", "oz", "slice", "cup"]),
+                "minimum_stock": 20,
+                "cost_per_unit": round(rng.uniform(0.05, 2.5), 2)
+            } for resource_id in range(1, resources + 1)
+        ))
+
+        prices = {}
+        sandwich_rows = []
+        for sandwich_id in range(1, sandwiches + 1):
+            prices[sandwich_id] = round(rng.uniform(4, 14), 2)
+            sandwich_rows.append({
+                "id": sandwich_id,
+                "sandwich_name": f"Sandwich {sandwich_id}",
+                "description": "Benchmark sandwich",
+                "price": prices[sandwich_id],
+                "calories": rng.randint(250, 1200),
+                "category": ",".join(rng.sample(CATEGORIES, 2)),
+                "is_available": rng.random() > 0.1,
+                "created_date": start
+            })
+        _insert_batches(connection, Sandwich.__table__, sandwich_rows)
+
+        _insert_batches(connection, Recipe.__table__, (
+            {"sandwich_id": sandwich_id, "resource_id": resource_id, "amount": rng.randint(1, 4), "unit": "piece"}
+            for sandwich_id in range(1, sandwiches + 1)
+            for resource_id in rng.sample(range(1, resources + 1), min(ingredients_per_sandwich, resources))
+        ))
+
+        _insert_batches(connection, PromoCode.__table__, [{
+            "code": "BENCH5",
+            "discount_amount": 5,
+            "expiration_date": now + timedelta(days=30),
+            "is_active": True,
+            "usage_limit": 10 ** 9,
+            "times_used": 0,
+            "minimum_order_amount": 10,
+            "created_date": start
+        }])
+
+        tracking_numbers = [f"ORD-B{order_id:09d}" for order_id in range(1, orders + 1)]
+        order_rows = []
+        detail_rows = []
+        review_rows = []
+        for order_id, tracking_number in enumerate(tracking_numbers, start=1):
+            order_date = start + timedelta(seconds=rng.randint(0, days * 86400))
+            order_type = rng.choice(["takeout", "delivery"])
+            total = 0.0
+            for sandwich_id in rng.sample(range(1, sandwiches + 1), min(rng.randint(1, lines_per_order), sandwiches)):
+                amount = rng.randint(1, 3)
+                subtotal = round(amount * prices[sandwich_id], 2)
+                total += subtotal
+                detail_rows.append({
+                    "order_id": order_id,
+                    "sandwich_id": sandwich_id,
+                    "amount": amount,
+                    "unit_price": prices[sandwich_id],
+                    "subtotal": subtotal
+                })
+                if rng.random() < review_ratio:
+                    rating = rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 4])[0]
+                    review_rows.append({
+                        "order_id": order_id,
+                        "sandwich_id": sandwich_id,
+                        "customer_name": f"Customer {order_id}",
+                        "rating": rating,
+                        "comment": rng.choice(COMPLAINTS) if rating <= 2 else None,
+                        "review_date": order_date + timedelta(hours=2)
+                    })
+            order_rows.append({
+                "id": order_id,
+                "customer_name": f"Customer {order_id}",
+                "phone": "555-0100",
+                "address": "1 Bench St" if order_type == "delivery" else None,
+                "order_date": order_date,
+                "order_type": order_type,
+                "status": "completed",
+                "total_amount": round(total, 2),
+                "tracking_number": tracking_number,
+                "payment_status": "paid"
+            })
+
+            if len(order_rows) == BATCH_SIZE:
+                _insert_batches(connection, Order.__table__, order_rows)
+                _insert_batches(connection, OrderDetail.__table__, detail_rows)
+                _insert_batches(connection, Review.__table__, review_rows)
+                order_rows, detail_rows, review_rows = [], [], []
+
+        _insert_batches(connection, Order.__table__, order_rows)
+        _insert_batches(connection, OrderDetail.__table__, detail_rows)
+        _insert_batches(connection, Review.__table__, review_rows)
+
+    return tracking_numbers
+
+
+def sqlite_engine(path):
+    return create_db_engine(f"sqlite:///{path}")
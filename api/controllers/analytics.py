@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from ..dependencies.sales_cube import GROUP_BYS, cube
+
+
+def _cube():
+    if cube is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sales analytics needs numpy (pip install numpy)"
+        )
+    return cube
+
+
+def get_sales(db: Session, group_by: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+              sandwich_ids: Optional[list[int]] = None, order_type: Optional[str] = None,
+              category: Optional[str] = None, session_factory=None):
+    """Staff function: Order lines, quantity sold and revenue per group, filtered by date, sandwich, type or category
+
+    Answered from the in-memory sales cube, which is first brought up to date
+    with the order lines added since it was last synced (its periodic full
+    rebuild runs in the background, on a session from session_factory).
+    """
+    sales_cube = _cube()
+    if group_by not in GROUP_BYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"group_by must be one of {', '.join(GROUP_BYS)}")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be before end_date")
+    sales_cube.sync(db, session_factory=session_factory)
+    try:
+        groups = sales_cube.query(group_by, start=start_date, end=end_date, sandwich_ids=sandwich_ids,
+                                  order_type=order_type, category=category)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"group_by": group_by, "groups": groups, **sales_cube.stats()}
+
+
+def rebuild(db: Session):
+    """Staff function: Reload the sales cube from scratch, to pick up edited or deleted order lines now"""
+    sales_cube = _cube()
+    sales_cube.rebuild(db)
+    return sales_cube.stats()
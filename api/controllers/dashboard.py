@@ -0,0 +1,39 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, time
+from . import orders, resources, reviews, sandwiches
+from ..schemas.reviews import ReviewQueuePage
+from ..dependencies.dashboard import Dashboard, Section
+
+DASHBOARD_REVIEW_LIMIT = 10
+DASHBOARD_POPULAR_LIMIT = 5
+
+
+def todays_revenue(db: Session):
+    now = datetime.now()
+    return orders.get_revenue_summary(db, datetime.combine(now.date(), time.min), now)
+
+
+def unanswered_reviews(db: Session):
+    # Validated here, while the session is open: cached sections outlive it
+    page = reviews.get_unanswered_reviews(db, limit=DASHBOARD_REVIEW_LIMIT)
+    return ReviewQueuePage.model_validate(page, from_attributes=True)
+
+
+# Numbers staff act on right away are kept fresh; slow-moving reports are cached longer
+dashboard = Dashboard([
+    Section("todays_revenue", todays_revenue, ttl_seconds=10),
+    Section("low_stock_items", resources.get_low_stock_items, ttl_seconds=30),
+    Section("unanswered_reviews", unanswered_reviews, ttl_seconds=30),
+    Section("inventory_summary", resources.get_inventory_summary, ttl_seconds=60),
+    Section("low_rated_dishes", reviews.get_low_rated_dishes, ttl_seconds=300),
+    Section("popular_items", lambda db: sandwiches.get_popular_items(db, limit=DASHBOARD_POPULAR_LIMIT), ttl_seconds=300),
+])
+
+
+def get_dashboard(session_factory, refresh: bool = False):
+    """Staff function: Everything the staff home screen shows, in one request
+
+    The sections run concurrently, each on its own session (and pooled
+    connection), and each is cached for its own TTL; refresh=True skips the cache.
+    """
+    return dashboard.render(session_factory, refresh=refresh)
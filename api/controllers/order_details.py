@@ -1,83 +1,102 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response, Depends
 from ..models import order_details as model
+from ..schemas import order_details as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
+from ..dependencies.fast_json import FastJSONResponse, serializer_for
 from sqlalchemy.exc import SQLAlchemyError
 
+crud = CRUD(model.OrderDetail, schema.OrderDetail)
+
 
 def create(db: Session, request):
     # Calculate subtotal automatically
     subtotal = request.amount * request.unit_price
 
-    new_item = model.OrderDetail(
-        order_id=request.order_id,
-        sandwich_id=request.sandwich_id,
-        amount=request.amount,
-        unit_price=request.unit_price,
-        subtotal=subtotal,
-        special_instructions=request.special_instructions
-    )
-
     try:
-        db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        new_item = crud.create(db, dict(
+            order_id=request.order_id,
+            sandwich_id=request.sandwich_id,
+            amount=request.amount,
+            unit_price=request.unit_price,
+            subtotal=subtotal,
+            special_instructions=request.special_instructions
+        ))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
     return new_item
 
 
-def read_all(db: Session):
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.OrderDetail, schema.OrderDetail)
+
+
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.OrderDetail, schema.OrderDetail, fields, expand)
     try:
-        result = db.query(model.OrderDetail).all()
+        result = db.query(model.OrderDetail).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return fieldset.render(result) if fieldset else result
 
 
-def read_one(db: Session, item_id):
+def read_all_fast(db: Session):
+    """Same JSON as read_all + schema.OrderDetail, built from column tuples without per-row models"""
     try:
-        item = db.query(model.OrderDetail).filter(model.OrderDetail.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        result = serializer_for(model.OrderDetail, schema.OrderDetail).load(db)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return FastJSONResponse(result)
 
 
-def update(db: Session, item_id, request):
+def read_one(db: Session, item_id, fields=None, expand=None):
+    fieldset = parse_fieldset(model.OrderDetail, schema.OrderDetail, fields, expand)
     try:
-        item = db.query(model.OrderDetail).filter(model.OrderDetail.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render(item) if fieldset else item
+
 
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several order details by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.OrderDetail, schema.OrderDetail, fields, expand)
+    try:
+        items, missing = fetch_by_ids(db, model.OrderDetail, ids, _loader_options(fieldset))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
+
+
+def update(db: Session, item_id, request):
+    try:
         update_data = request.dict(exclude_unset=True)
 
-        # Recalculate subtotal if amount or unit_price changed
-        current_item = item.first()
-        new_amount = update_data.get('amount', current_item.amount)
-        new_unit_price = update_data.get('unit_price', current_item.unit_price)
+        # Recalculate subtotal in the same UPDATE; unchanged amount/unit_price come from the row
+        new_amount = update_data.get('amount', model.OrderDetail.amount)
+        new_unit_price = update_data.get('unit_price', model.OrderDetail.unit_price)
         update_data['subtotal'] = new_amount * new_unit_price
 
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+    return item
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.OrderDetail).filter(model.OrderDetail.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        crud.delete(db, item_id)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,14 +1,32 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import HTTPException, status, Response, Depends
 from ..models import orders as model
+from ..schemas import orders as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.etags import with_etag
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
+from ..models import order_details as order_detail_model
+from ..dependencies.fast_json import FastJSONResponse, serializer_for, dumps
+from ..dependencies.group_commit import committer
+from ..dependencies.snowflake import tracking_number as next_tracking_number
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import SQLAlchemyError
-import uuid
+from sqlalchemy import func
+import csv
+import io
 from datetime import datetime
 
+crud = CRUD(model.Order, schema.Order)
+
 
 def create(db: Session, request):
-    # Generate unique tracking number for customer
-    tracking_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+    # Unique, time-ordered tracking number for customer (appends to the unique index)
+    try:
+        tracking_number = next_tracking_number()
+    except RuntimeError as e:  # This worker's node id lease ran out and is being claimed again
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"{e}; try again shortly")
 
     new_item = model.Order(
         customer_name=request.customer_name,
@@ -24,45 +42,107 @@ def create(db: Session, request):
         # promo_code_id will be None by default (no promo code)
     )
 
+    if committer.enabled:
+        return _create_group_committed(db, new_item)
+
     try:
         db.add(new_item)
         db.commit()
         db.refresh(new_item)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
     return new_item
 
 
-def read_all(db: Session):
+def _create_group_committed(db: Session, new_item):
+    """Insert through the group committer: one transaction for every order in the window
+
+    The batch commits on its own connection, so the row it returns (defaults
+    such as the version included) is put into the request session as if it had
+    been loaded there; no refresh query is made.
+    """
+    table = model.Order.__table__
+    values = {
+        column.key: getattr(new_item, column.key) for column in table.columns
+        # Unset columns with a default (the row version) are left to it
+        if column.key != "id" and not (getattr(new_item, column.key) is None and column.default is not None)
+    }
+    try:
+        row = committer.insert(db.get_bind(), table, values)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    item = model.Order(**{column.key: row[column.name] for column in table.columns})
+    make_transient_to_detached(item)
+    db.add(item)
+    set_committed_value(item, "order_details", [])  # A new order has no lines yet
+    return item
+
+
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.Order, schema.Order)
+
+
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Order, schema.Order, fields, expand)
     try:
-        result = db.query(model.Order).all()
+        result = db.query(model.Order).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="A database error occurred while retrieving orders."
         )
-    return result
+    return fieldset.render(result) if fieldset else result
 
 
-def read_one(db: Session, item_id):
+def read_all_fast(db: Session):
+    """Same JSON as read_all + schema.Order, built from column tuples without per-row models"""
     try:
-        item = db.query(model.Order).filter(model.Order.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        return item
+        result = serializer_for(model.Order, schema.Order).load(db)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="A database error occurred while retrieving orders."
+        )
+    return FastJSONResponse(result)
+
+
+def read_one(db: Session, item_id, fields=None, expand=None, response: Response = None):
+    fieldset = parse_fieldset(model.Order, schema.Order, fields, expand)
+    try:
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
+        return with_etag(item, response, fieldset.render(item) if fieldset else None)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="A database error occurred."
+        )
+
+
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several orders by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.Order, schema.Order, fields, expand)
+    try:
+        items, missing = fetch_by_ids(db, model.Order, ids, _loader_options(fieldset))
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="A database error occurred."
         )
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
 
 
-def read_by_tracking_number(db: Session, tracking_number: str):
+def read_by_tracking_number(db: Session, tracking_number: str, fields=None, expand=None):
     """Allow customers to track orders by tracking number"""
+    fieldset = parse_fieldset(model.Order, schema.Order, fields, expand)
     try:
-        item = db.query(model.Order).filter(model.Order.tracking_number == tracking_number).first()
+        item = db.query(model.Order).options(*_loader_options(fieldset)).filter(
+            model.Order.tracking_number == tracking_number
+        ).first()
         if not item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tracking number not found!")
     except SQLAlchemyError:
@@ -70,23 +150,19 @@ def read_by_tracking_number(db: Session, tracking_number: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="A database error occurred."
         )
-    return item
+    return fieldset.render(item) if fieldset else item
 
 
-def update(db: Session, item_id, request):
+def update(db: Session, item_id, request, if_match=None, response: Response = None):
     try:
-        item = db.query(model.Order).filter(model.Order.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
         update_data = request.dict(exclude_unset=True)
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data, if_match)
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A database error occurred during the update."
         )
-    return item.first()
+    return with_etag(item, response)
 
 
 def update_status(db: Session, item_id, new_status: str):
@@ -99,33 +175,25 @@ def update_status(db: Session, item_id, new_status: str):
         )
 
     try:
-        item = db.query(model.Order).filter(model.Order.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.update({"status": new_status}, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, {"status": new_status})
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A database error occurred while updating the status."
         )
-    return item.first()
+    return item
 
 
 def update_total_amount(db: Session, order_id: int, total_amount: float):
     """Update order total when order details are added/modified"""
     try:
-        item = db.query(model.Order).filter(model.Order.id == order_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found!")
-        item.update({"total_amount": total_amount}, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, order_id, {"total_amount": total_amount}, not_found="Order not found!")
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A database error occurred while updating the total amount."
         )
-    return item.first()
+    return item
 
 
 def get_orders_by_date_range(db: Session, start_date: datetime, end_date: datetime):
@@ -143,13 +211,129 @@ def get_orders_by_date_range(db: Session, start_date: datetime, end_date: dateti
     return result
 
 
+def get_orders_by_date_range_fast(db: Session, start_date: datetime, end_date: datetime):
+    """Same JSON as get_orders_by_date_range + schema.Order, built from column tuples"""
+    try:
+        result = serializer_for(model.Order, schema.Order).load(
+            db,
+            model.Order.order_date >= start_date,
+            model.Order.order_date <= end_date
+        )
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="A database error occurred while retrieving orders by date range."
+        )
+    return FastJSONResponse(result)
+
+
+
+def get_revenue_summary(db: Session, start_date: datetime, end_date: datetime):
+    """Staff function: Order count and revenue within a date range, in one aggregate query"""
+    try:
+        row = db.query(
+            func.count(model.Order.id).label("order_count"),
+            func.coalesce(func.sum(model.Order.total_amount), 0).label("revenue")
+        ).filter(
+            model.Order.order_date >= start_date,
+            model.Order.order_date <= end_date
+        ).one()
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="A database error occurred while summarizing revenue."
+        )
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "order_count": row.order_count,
+        "revenue": round(float(row.revenue), 2)
+    }
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_ORDER_COLUMNS = [
+    "id", "customer_name", "phone", "address", "order_date", "order_type", "status",
+    "total_amount", "tracking_number", "payment_status", "description", "promo_code_id"
+]
+EXPORT_DETAIL_COLUMNS = ["id", "sandwich_id", "amount", "unit_price", "subtotal", "special_instructions"]
+
+
+def _export_rows(db: Session, start_date: datetime, end_date: datetime, include_details: bool):
+    """One streaming query (yield_per) over the range; lines come joined to their order"""
+    columns = [getattr(model.Order, name) for name in EXPORT_ORDER_COLUMNS]
+    query = db.query(*columns)
+    if include_details:
+        query = db.query(*columns, *[
+            getattr(order_detail_model.OrderDetail, name).label(f"detail_{name}") for name in EXPORT_DETAIL_COLUMNS
+        ]).outerjoin(
+            order_detail_model.OrderDetail, order_detail_model.OrderDetail.order_id == model.Order.id
+        ).order_by(model.Order.id, order_detail_model.OrderDetail.id)
+    else:
+        query = query.order_by(model.Order.id)
+
+    return query.filter(
+        model.Order.order_date >= start_date,
+        model.Order.order_date <= end_date
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _export_ndjson(rows, include_details: bool):
+    order_width = len(EXPORT_ORDER_COLUMNS)
+    buffer = []
+    current = None
+    for row in rows:
+        if current is None or current["id"] != row[0]:
+            if current is not None:
+                buffer.append(dumps(current))
+                if len(buffer) >= EXPORT_BATCH_SIZE:
+                    yield b"\n".join(buffer) + b"\n"
+                    buffer = []
+            current = dict(zip(EXPORT_ORDER_COLUMNS, row[:order_width]))
+            if include_details:
+                current["order_details"] = []
+        if include_details and row[order_width] is not None:
+            current["order_details"].append(dict(zip(EXPORT_DETAIL_COLUMNS, row[order_width:])))
+    if current is not None:
+        buffer.append(dumps(current))
+    if buffer:
+        yield b"\n".join(buffer) + b"\n"
+
+
+def _export_csv(rows, include_details: bool):
+    header = EXPORT_ORDER_COLUMNS + ([f"detail_{name}" for name in EXPORT_DETAIL_COLUMNS] if include_details else [])
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    yield output.getvalue()
+
+
+def export_orders(db: Session, start_date: datetime, end_date: datetime, format: str = "ndjson",
+                  include_details: bool = False):
+    """Staff function: stream every order in the range (optionally with its lines) as NDJSON or CSV
+
+    Rows are read with yield_per and written out batch by batch, so memory use does
+    not depend on the size of the range. With order lines, CSV has one row per line.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Format must be ndjson or csv")
+
+    rows = _export_rows(db, start_date, end_date, include_details)
+    filename = f"orders_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "csv":
+        return StreamingResponse(_export_csv(rows, include_details), media_type="text/csv", headers=headers)
+    return StreamingResponse(_export_ndjson(rows, include_details), media_type="application/x-ndjson", headers=headers)
+
+
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.Order).filter(model.Order.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        crud.delete(db, item_id)
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
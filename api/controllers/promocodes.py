@@ -1,37 +1,109 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response, Depends
 from ..models import promocodes as model
+from ..dependencies.crud import CRUD
+from ..dependencies.etags import with_etag
+from ..dependencies.promo_cache import cache as promo_cache
+from ..dependencies.batch import fetch_by_ids
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
+import secrets
+
+crud = CRUD(model.PromoCode)
 
 
 def create(db: Session, request):
-    new_item = model.PromoCode(
-        code=request.code.upper(),  # Store codes in uppercase for consistency
-        discount_amount=request.discount_amount,
-        expiration_date=request.expiration_date,
-        usage_limit=request.usage_limit,
-        minimum_order_amount=request.minimum_order_amount,
-        description=request.description,
-        is_active=request.is_active
-    )
+    try:
+        new_item = crud.create(db, dict(
+            code=request.code.upper(),  # Store codes in uppercase for consistency
+            discount_amount=request.discount_amount,
+            expiration_date=request.expiration_date,
+            usage_limit=request.usage_limit,
+            minimum_order_amount=request.minimum_order_amount,
+            description=request.description,
+            is_active=request.is_active
+        ))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    promo_cache.invalidate(new_item.code)
+    return new_item
+
+
+# 32 characters with no 0/O or 1/I, so printed codes can't be misread. 256 random
+# byte values map evenly onto 32 characters, so translating random bytes is uniform.
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+_BYTE_TO_CODE_CHAR = bytes(ord(CODE_ALPHABET[b % len(CODE_ALPHABET)]) for b in range(256))
+BULK_INSERT_BATCH_SIZE = 5000
+
+
+def _random_code(prefix: str, suffix_length: int):
+    return prefix + secrets.token_bytes(suffix_length).translate(_BYTE_TO_CODE_CHAR).decode()
+
+
+def bulk_generate(db: Session, request):
+    """Staff function: generate many unique codes (e.g. single-use campaign codes) at once
+
+    Collisions are checked in memory against the existing codes with the same prefix,
+    and rows are written with batched multi-row INSERTs in a single transaction.
+    """
+    prefix = request.prefix.upper()
+    suffix_length = request.length - len(prefix)
+    if suffix_length < 6:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Code length must leave at least 6 random characters after the prefix"
+        )
+
+    try:
+        taken = {
+            row.code for row in db.query(model.PromoCode.code).filter(
+                model.PromoCode.code.startswith(prefix, autoescape=True)
+            )
+        }
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
+    codes = []
+    while len(codes) < request.count:
+        code = _random_code(prefix, suffix_length)
+        if code not in taken:
+            taken.add(code)
+            codes.append(code)
+
+    now = datetime.now()
+    shared_fields = {
+        "discount_amount": request.discount_amount,
+        "expiration_date": request.expiration_date,
+        "is_active": True,
+        "usage_limit": request.usage_limit,
+        "times_used": 0,
+        "minimum_order_amount": request.minimum_order_amount,
+        "created_date": now,
+        "description": request.description
+    }
     try:
-        db.add(new_item)
+        for start in range(0, len(codes), BULK_INSERT_BATCH_SIZE):
+            batch = codes[start:start + BULK_INSERT_BATCH_SIZE]
+            db.execute(model.PromoCode.__table__.insert(), [dict(shared_fields, code=code) for code in batch])
         db.commit()
-        db.refresh(new_item)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        db.rollback()
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
-    return new_item
+    # Any of these may have been looked up (and cached as unknown) before
+    promo_cache.invalidate(*codes)
+    return {"created": len(codes), "codes": codes}
 
 
 def read_all(db: Session):
     try:
         result = db.query(model.PromoCode).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -45,20 +117,28 @@ def read_active_codes(db: Session):
             model.PromoCode.times_used < model.PromoCode.usage_limit
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
 
-def read_one(db: Session, item_id):
+def read_one(db: Session, item_id, response: Response = None):
     try:
-        item = db.query(model.PromoCode).filter(model.PromoCode.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        item = crud.read_one(db, item_id)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return with_etag(item, response)
+
+
+def read_many(db: Session, ids):
+    """Staff function: Several promo codes by id in one query, in the order asked for"""
+    try:
+        items, missing = fetch_by_ids(db, model.PromoCode, ids)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return {"items": items, "missing": missing}
 
 
 def read_by_code(db: Session, promo_code: str):
@@ -70,132 +150,135 @@ def read_by_code(db: Session, promo_code: str):
         if not item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Promo code not found!")
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return item
 
 
 def validate_promo_code(db: Session, promo_code: str, order_total: float):
-    """Validate if promo code can be applied to an order"""
+    """Validate if promo code can be applied to an order
+
+    Rules come from the in-memory promo cache. The usage limit is not checked here;
+    redemption enforces it against the database (see redeem_promo_code).
+    """
     try:
-        code = db.query(model.PromoCode).filter(
-            model.PromoCode.code == promo_code.upper()
-        ).first()
+        code = promo_cache.get(db, promo_code)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
-        if not code:
-            return {
-                "is_valid": False,
-                "discount_amount": 0.0,
-                "message": "Promo code not found"
-            }
-
-        # Check if code is active
-        if not code.is_active:
-            return {
-                "is_valid": False,
-                "discount_amount": 0.0,
-                "message": "Promo code is no longer active"
-            }
-
-        # Check expiration
-        if code.expiration_date <= datetime.now():
-            return {
-                "is_valid": False,
-                "discount_amount": 0.0,
-                "message": "Promo code has expired"
-            }
-
-        # Check usage limit
-        if code.times_used >= code.usage_limit:
-            return {
-                "is_valid": False,
-                "discount_amount": 0.0,
-                "message": "Promo code usage limit reached"
-            }
-
-        # Check minimum order amount
-        if order_total < code.minimum_order_amount:
-            return {
-                "is_valid": False,
-                "discount_amount": 0.0,
-                "message": f"Minimum order amount of ${code.minimum_order_amount} required"
-            }
-
-        # Code is valid!
+    if not code:
         return {
-            "is_valid": True,
-            "discount_amount": float(code.discount_amount),
-            "message": f"Promo code applied! ${float(code.discount_amount)} off"
+            "is_valid": False,
+            "discount_amount": 0.0,
+            "message": "Promo code not found"
         }
 
-    except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    # Check if code is active
+    if not code.is_active:
+        return {
+            "is_valid": False,
+            "discount_amount": 0.0,
+            "message": "Promo code is no longer active"
+        }
 
+    # Check expiration
+    if code.expiration_date <= datetime.now():
+        return {
+            "is_valid": False,
+            "discount_amount": 0.0,
+            "message": "Promo code has expired"
+        }
 
-def apply_promo_code(db: Session, promo_code: str):
-    """Increment usage count when promo code is used"""
-    try:
-        code = db.query(model.PromoCode).filter(
-            model.PromoCode.code == promo_code.upper()
-        ).first()
+    # Check minimum order amount
+    if order_total < code.minimum_order_amount:
+        return {
+            "is_valid": False,
+            "discount_amount": 0.0,
+            "message": f"Minimum order amount of ${code.minimum_order_amount} required"
+        }
 
-        if not code:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Promo code not found!")
+    # Code is valid!
+    return {
+        "is_valid": True,
+        "discount_amount": code.discount_amount,
+        "message": f"Promo code applied! ${code.discount_amount} off"
+    }
 
-        # Increment usage count
-        code.times_used += 1
-        db.commit()
-        db.refresh(code)
 
+def redeem_promo_code(db: Session, promo_code: str):
+    """Atomically use up one redemption of a promo code; returns True if it was redeemed
+
+    The usage check and the increment happen in one guarded UPDATE, so concurrent
+    checkouts can never push times_used past usage_limit or lose increments.
+    """
+    try:
+        redeemed = db.query(model.PromoCode).filter(
+            model.PromoCode.code == promo_code.upper(),
+            model.PromoCode.is_active == True,
+            model.PromoCode.expiration_date > datetime.now(),
+            model.PromoCode.times_used < model.PromoCode.usage_limit
+        ).update(
+            {model.PromoCode.times_used: model.PromoCode.times_used + 1},
+            synchronize_session=False
+        )
+        db.commit()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        db.rollback()
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return redeemed == 1
 
-    return code
 
+def apply_promo_code(db: Session, promo_code: str):
+    """Increment usage count when promo code is used"""
+    if not redeem_promo_code(db, promo_code):
+        # Only the failure path pays for a second lookup to explain why
+        code = read_by_code(db, promo_code)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Promo code {code.code} cannot be redeemed (inactive, expired or usage limit reached)"
+        )
+    return read_by_code(db, promo_code)
 
-def update(db: Session, item_id, request):
-    try:
-        item = db.query(model.PromoCode).filter(model.PromoCode.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
 
+def update(db: Session, item_id, request, if_match=None, response: Response = None):
+    try:
         update_data = request.dict(exclude_unset=True)
         # Ensure code is uppercase if being updated
         if 'code' in update_data:
             update_data['code'] = update_data['code'].upper()
 
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data, if_match)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+
+    if 'code' in update_data:
+        # The old code is not known without reading the row first; renames are rare
+        promo_cache.clear()
+    promo_cache.invalidate(item.code)
+    return with_etag(item, response)
 
 
 def deactivate_code(db: Session, item_id):
     """Staff function to quickly deactivate a promo code"""
     try:
-        item = db.query(model.PromoCode).filter(model.PromoCode.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.update({"is_active": False}, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, {"is_active": False})
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+
+    promo_cache.invalidate(item.code)
+    return item
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.PromoCode).filter(model.PromoCode.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        code = crud.delete(db, item_id, returning=(model.PromoCode.code,)).code
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    promo_cache.invalidate(code)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,10 +1,17 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response, Depends
 from ..models import recipes as model
+from ..schemas import recipes as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
 from ..models import sandwiches as sandwich_model
 from ..models import resources as resource_model
+from ..dependencies.recipe_graph import graph
 from sqlalchemy.exc import SQLAlchemyError
 
+crud = CRUD(model.Recipe, schema.Recipe)
+
 
 def create(db: Session, request):
     # Verify that sandwich and resource exist
@@ -20,42 +27,55 @@ def create(db: Session, request):
     if not resource_exists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found!")
 
-    new_item = model.Recipe(
-        sandwich_id=request.sandwich_id,
-        resource_id=request.resource_id,
-        amount=request.amount,
-        unit=request.unit
-    )
-
     try:
-        db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        new_item = crud.create(db, dict(
+            sandwich_id=request.sandwich_id,
+            resource_id=request.resource_id,
+            amount=request.amount,
+            unit=request.unit
+        ))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
+    graph.invalidate_sandwich(new_item.sandwich_id)
     return new_item
 
 
-def read_all(db: Session):
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.Recipe, schema.Recipe)
+
+
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Recipe, schema.Recipe, fields, expand)
     try:
-        result = db.query(model.Recipe).all()
+        result = db.query(model.Recipe).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return fieldset.render(result) if fieldset else result
 
 
-def read_one(db: Session, item_id):
+def read_one(db: Session, item_id, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Recipe, schema.Recipe, fields, expand)
     try:
-        item = db.query(model.Recipe).filter(model.Recipe.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return fieldset.render(item) if fieldset else item
+
+
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several recipes by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.Recipe, schema.Recipe, fields, expand)
+    try:
+        items, missing = fetch_by_ids(db, model.Recipe, ids, _loader_options(fieldset))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
 
 
 def read_by_sandwich(db: Session, sandwich_id: int):
@@ -65,7 +85,7 @@ def read_by_sandwich(db: Session, sandwich_id: int):
             model.Recipe.sandwich_id == sandwich_id
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -77,7 +97,7 @@ def read_by_resource(db: Session, resource_id: int):
             model.Recipe.resource_id == resource_id
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -85,36 +105,38 @@ def read_by_resource(db: Session, resource_id: int):
 def check_ingredient_availability(db: Session, sandwich_id: int, quantity_needed: int = 1):
     """Check if enough ingredients are available to make a sandwich"""
     try:
-        # Get all ingredients needed for this sandwich
-        recipes = db.query(model.Recipe).filter(
+        # All ingredients needed for this sandwich with their current stock, in one query
+        rows = db.query(
+            model.Recipe.amount.label('recipe_amount'),
+            model.Recipe.unit,
+            resource_model.Resource.item,
+            resource_model.Resource.amount.label('available')
+        ).outerjoin(
+            resource_model.Resource, model.Recipe.resource_id == resource_model.Resource.id
+        ).filter(
             model.Recipe.sandwich_id == sandwich_id
         ).all()
 
         insufficient_ingredients = []
 
-        for recipe in recipes:
-            # Get current stock of this ingredient
-            resource = db.query(resource_model.Resource).filter(
-                resource_model.Resource.id == recipe.resource_id
-            ).first()
+        for row in rows:
+            total_needed = row.recipe_amount * quantity_needed
 
-            if not resource:
+            if row.item is None:
                 insufficient_ingredients.append({
                     "ingredient": "Unknown",
-                    "needed": recipe.amount * quantity_needed,
+                    "needed": total_needed,
                     "available": 0,
-                    "unit": recipe.unit
+                    "unit": row.unit
                 })
                 continue
 
-            total_needed = recipe.amount * quantity_needed
-
-            if resource.amount < total_needed:
+            if row.available < total_needed:
                 insufficient_ingredients.append({
-                    "ingredient": resource.item,
+                    "ingredient": row.item,
                     "needed": total_needed,
-                    "available": resource.amount,
-                    "unit": recipe.unit
+                    "available": row.available,
+                    "unit": row.unit
                 })
 
         return {
@@ -123,50 +145,89 @@ def check_ingredient_availability(db: Session, sandwich_id: int, quantity_needed
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def get_recipe_with_details(db: Session, sandwich_id: int):
     """Get complete recipe with sandwich and ingredient details"""
     try:
-        recipes = db.query(model.Recipe).filter(
+        # One joined query instead of one Resource lookup per recipe row
+        rows = db.query(
+            model.Recipe.id,
+            model.Recipe.amount,
+            model.Recipe.unit,
+            resource_model.Resource.item,
+            resource_model.Resource.amount.label('available_stock')
+        ).outerjoin(
+            resource_model.Resource, model.Recipe.resource_id == resource_model.Resource.id
+        ).filter(
             model.Recipe.sandwich_id == sandwich_id
         ).all()
 
-        if not recipes:
+        if not rows:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No recipe found for this sandwich!")
 
-        recipe_details = []
-        for recipe in recipes:
-            # Get resource details
-            resource = db.query(resource_model.Resource).filter(
-                resource_model.Resource.id == recipe.resource_id
-            ).first()
+        return [
+            {
+                "recipe_id": row.id,
+                "amount": row.amount,
+                "unit": row.unit,
+                "ingredient_name": row.item if row.item is not None else "Unknown",
+                "available_stock": row.available_stock if row.available_stock is not None else 0
+            } for row in rows
+        ]
 
-            recipe_details.append({
-                "recipe_id": recipe.id,
-                "amount": recipe.amount,
-                "unit": recipe.unit,
-                "ingredient_name": resource.item if resource else "Unknown",
-                "available_stock": resource.amount if resource else 0
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+
+def get_margin_report(db: Session):
+    """Staff function: ingredient cost, price and margin for every sandwich on the menu"""
+    try:
+        sandwiches = db.query(
+            sandwich_model.Sandwich.id,
+            sandwich_model.Sandwich.sandwich_name,
+            sandwich_model.Sandwich.price,
+            sandwich_model.Sandwich.is_available
+        ).order_by(sandwich_model.Sandwich.id).all()
+
+        # Costs come from the compiled recipe graph, not from per-sandwich queries
+        costs = graph.ingredient_costs(db, [sandwich.id for sandwich in sandwiches])
+
+        report = []
+        for sandwich in sandwiches:
+            price = float(sandwich.price)
+            ingredient_cost, unpriced = costs[sandwich.id]
+            margin = round(price - ingredient_cost, 2)
+            report.append({
+                "sandwich_id": sandwich.id,
+                "sandwich_name": sandwich.sandwich_name,
+                "is_available": sandwich.is_available,
+                "price": price,
+                "ingredient_cost": ingredient_cost,
+                "margin": margin,
+                "margin_percent": round(margin / price * 100, 1) if price else None,
+                "has_unpriced_ingredients": unpriced
             })
 
-        return recipe_details
+        return report
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def update(db: Session, item_id, request):
     try:
-        item = db.query(model.Recipe).filter(model.Recipe.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-
         update_data = request.dict(exclude_unset=True)
 
+        # Moving an ingredient to another sandwich changes both sandwiches' costs
+        old_sandwich_id = None
+        if 'sandwich_id' in update_data:
+            old_sandwich_id = db.query(model.Recipe.sandwich_id).filter(model.Recipe.id == item_id).scalar()
+
         # Verify sandwich and resource exist if they're being updated
         if 'sandwich_id' in update_data:
             sandwich_exists = db.query(sandwich_model.Sandwich).filter(
@@ -182,22 +243,23 @@ def update(db: Session, item_id, request):
             if not resource_exists:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found!")
 
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+
+    graph.invalidate_sandwich(item.sandwich_id)
+    if old_sandwich_id is not None and old_sandwich_id != item.sandwich_id:
+        graph.invalidate_sandwich(old_sandwich_id)
+    return item
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.Recipe).filter(model.Recipe.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        sandwich_id = crud.delete(db, item_id, returning=(model.Recipe.sandwich_id,)).sandwich_id
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    graph.invalidate_sandwich(sandwich_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
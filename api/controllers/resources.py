@@ -1,48 +1,86 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response, Depends
 from ..models import resources as model
+from ..schemas import resources as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.etags import with_etag
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
+from ..dependencies.recipe_graph import graph
+from ..dependencies.jobs import queue
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List
+import logging
 
+logger = logging.getLogger(__name__)
+crud = CRUD(model.Resource, schema.Resource)
 
-def create(db: Session, request):
-    new_item = model.Resource(
-        item=request.item,
-        amount=request.amount,
-        unit=request.unit,
-        minimum_stock=request.minimum_stock,
-        cost_per_unit=request.cost_per_unit
+
+@queue.job("resources.low_stock_alert")
+def low_stock_alert(db: Session, item: str, amount: int, unit: str, minimum_stock: int):
+    """Background job: notify staff that a resource is at or below its minimum stock"""
+    logger.warning("LOW STOCK ALERT: %s is at %s %s (minimum: %s)", item, amount, unit, minimum_stock)
+
+
+def _alert_low_stock(resource):
+    # Everything the alert needs is passed along, so the job does not read the row again
+    queue.enqueue(
+        "resources.low_stock_alert",
+        item=resource.item, amount=resource.amount, unit=resource.unit, minimum_stock=resource.minimum_stock
     )
 
+
+def create(db: Session, request):
     try:
-        db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        new_item = crud.create(db, dict(
+            item=request.item,
+            amount=request.amount,
+            unit=request.unit,
+            minimum_stock=request.minimum_stock,
+            cost_per_unit=request.cost_per_unit
+        ))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
+    graph.invalidate_resource(new_item.id)
     return new_item
 
 
-def read_all(db: Session):
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.Resource, schema.Resource)
+
+
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Resource, schema.Resource, fields, expand)
     try:
-        result = db.query(model.Resource).all()
+        result = db.query(model.Resource).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return fieldset.render(result) if fieldset else result
 
 
-def read_one(db: Session, item_id):
+def read_one(db: Session, item_id, fields=None, expand=None, response: Response = None):
+    fieldset = parse_fieldset(model.Resource, schema.Resource, fields, expand)
     try:
-        item = db.query(model.Resource).filter(model.Resource.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return with_etag(item, response, fieldset.render(item) if fieldset else None)
+
+
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several resources by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.Resource, schema.Resource, fields, expand)
+    try:
+        items, missing = fetch_by_ids(db, model.Resource, ids, _loader_options(fieldset))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
 
 
 def read_by_item_name(db: Session, item_name: str):
@@ -52,7 +90,7 @@ def read_by_item_name(db: Session, item_name: str):
             model.Resource.item.ilike(f"%{item_name}%")
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return item
 
@@ -79,7 +117,7 @@ def get_low_stock_items(db: Session):
         return low_stock_alerts
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -90,7 +128,7 @@ def get_out_of_stock_items(db: Session):
             model.Resource.amount <= 0
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -115,23 +153,18 @@ def check_sufficient_stock(db: Session, resource_id: int, required_amount: int):
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def update_stock(db: Session, resource_id: int, new_amount: int):
     """Update stock amount for a resource"""
     try:
-        item = db.query(model.Resource).filter(model.Resource.id == resource_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found!")
-
-        item.update({"amount": new_amount}, synchronize_session=False)
-        db.commit()
+        updated_item = crud.update(db, resource_id, {"amount": new_amount}, not_found="Resource not found!")
 
         # Check if this update puts item below minimum stock
-        updated_item = item.first()
         if updated_item.amount <= updated_item.minimum_stock:
+            _alert_low_stock(updated_item)
             return {
                 "resource": updated_item,
                 "warning": f"Stock level for {updated_item.item} is now below minimum ({updated_item.minimum_stock})"
@@ -140,62 +173,52 @@ def update_stock(db: Session, resource_id: int, new_amount: int):
         return {"resource": updated_item, "warning": None}
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def consume_stock(db: Session, resource_id: int, amount_used: int):
-    """Reduce stock when ingredients are used (for order fulfillment)"""
-    try:
-        resource = db.query(model.Resource).filter(
-            model.Resource.id == resource_id
-        ).first()
+    """Reduce stock when ingredients are used (for order fulfillment)
 
-        if not resource:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found!")
-
-        if resource.amount < amount_used:
+    One guarded UPDATE (amount = amount - n WHERE amount >= n), so concurrent
+    consumers can neither overdraw the stock nor lose each other's decrements.
+    """
+    try:
+        resource = crud.update(
+            db, resource_id, {"amount": model.Resource.amount - amount_used},
+            where=(model.Resource.amount >= amount_used,), not_found="Resource not found!"
+        )
+        if resource is None:
+            available = db.query(model.Resource.amount).filter(model.Resource.id == resource_id).scalar()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient stock! Available: {resource.amount}, Required: {amount_used}"
+                detail=f"Insufficient stock! Available: {available}, Required: {amount_used}"
             )
 
-        new_amount = resource.amount - amount_used
-        resource.amount = new_amount
-        db.commit()
-        db.refresh(resource)
-
         # Return warning if now below minimum
         warning = None
-        if new_amount <= resource.minimum_stock:
-            warning = f"LOW STOCK ALERT: {resource.item} is now at {new_amount} {resource.unit} (minimum: {resource.minimum_stock})"
+        if resource.amount <= resource.minimum_stock:
+            _alert_low_stock(resource)
+            warning = f"LOW STOCK ALERT: {resource.item} is now at {resource.amount} {resource.unit} (minimum: {resource.minimum_stock})"
 
         return {
             "resource": resource,
             "amount_consumed": amount_used,
-            "remaining_stock": new_amount,
+            "remaining_stock": resource.amount,
             "warning": warning
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def restock_item(db: Session, resource_id: int, amount_added: int):
-    """Add stock when ingredients are restocked"""
+    """Add stock when ingredients are restocked (amount = amount + n, in one UPDATE)"""
     try:
-        resource = db.query(model.Resource).filter(
-            model.Resource.id == resource_id
-        ).first()
-
-        if not resource:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found!")
-
-        resource.amount += amount_added
-        db.commit()
-        db.refresh(resource)
-
+        resource = crud.update(
+            db, resource_id, {"amount": model.Resource.amount + amount_added}, not_found="Resource not found!"
+        )
         return {
             "resource": resource,
             "amount_added": amount_added,
@@ -203,7 +226,7 @@ def restock_item(db: Session, resource_id: int, amount_added: int):
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -235,32 +258,29 @@ def get_inventory_summary(db: Session):
         return summary
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
-def update(db: Session, item_id, request):
+def update(db: Session, item_id, request, if_match=None, response: Response = None):
     try:
-        item = db.query(model.Resource).filter(model.Resource.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
         update_data = request.dict(exclude_unset=True)
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data, if_match)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+
+    if 'cost_per_unit' in update_data:
+        graph.invalidate_resource(item_id)
+    return with_etag(item, response)
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.Resource).filter(model.Resource.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        crud.delete(db, item_id)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    graph.invalidate_resource(item_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,88 +1,151 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from fastapi import HTTPException, status, Response, Depends
 from ..models import reviews as model
+from ..schemas import reviews as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.etags import with_etag
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
+from ..dependencies.fast_json import FastJSONResponse, serializer_for
+from ..dependencies.jobs import queue
+from ..dependencies.database import unique_violation
 from ..models import orders as order_model
+from ..models import sandwich_ratings as rating_model
 from ..models import sandwiches as sandwich_model
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy import func, exists, and_, or_
 from datetime import datetime
+import base64
+
+crud = CRUD(model.Review, schema.Review)
+STAR_COUNTS = {5: "five_star_count", 4: "four_star_count", 3: "three_star_count", 2: "two_star_count", 1: "one_star_count"}
+
+
+@queue.job("reviews.refresh_rating_summary")
+def refresh_rating_summary(db: Session, sandwich_id: int):
+    """Background job: recompute one sandwich's rating breakdown from its reviews
+
+    Recomputed from scratch, so a late or repeated run still ends up right.
+    """
+    counts = dict(db.query(model.Review.rating, func.count(model.Review.id)).filter(
+        model.Review.sandwich_id == sandwich_id
+    ).group_by(model.Review.rating).all())
+    db.query(rating_model.SandwichRating).filter(
+        rating_model.SandwichRating.sandwich_id == sandwich_id
+    ).delete(synchronize_session=False)
+    if counts:
+        db.add(rating_model.SandwichRating(
+            sandwich_id=sandwich_id,
+            total_reviews=sum(counts.values()),
+            rating_sum=sum(rating * count for rating, count in counts.items()),
+            updated_at=datetime.now(),
+            **{column: counts.get(rating, 0) for rating, column in STAR_COUNTS.items()}
+        ))
+    db.commit()
 
 
 def create(db: Session, request):
-    # Verify that the order exists and get customer name from it
-    order = db.query(order_model.Order).filter(
-        order_model.Order.id == request.order_id
-    ).first()
-    if not order:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found!")
+    from ..models import order_details as order_detail_model
 
-    # Verify that the sandwich exists
-    sandwich = db.query(sandwich_model.Sandwich).filter(
-        sandwich_model.Sandwich.id == request.sandwich_id
-    ).first()
-    if not sandwich:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sandwich not found!")
+    # One round trip: the order (for the customer name), whether the sandwich exists,
+    # and whether this order actually contains this sandwich (review verification)
+    try:
+        verification = db.query(
+            order_model.Order.customer_name,
+            sandwich_model.Sandwich.id.label('sandwich_id'),
+            exists().where(
+                order_detail_model.OrderDetail.order_id == order_model.Order.id,
+                order_detail_model.OrderDetail.sandwich_id == sandwich_model.Sandwich.id
+            ).label('order_contains_sandwich')
+        ).outerjoin(
+            sandwich_model.Sandwich, sandwich_model.Sandwich.id == request.sandwich_id
+        ).filter(
+            order_model.Order.id == request.order_id
+        ).first()
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
-    # Verify that this order actually contains this sandwich (review verification)
-    from ..models import order_details as order_detail_model
-    order_contains_sandwich = db.query(order_detail_model.OrderDetail).filter(
-        order_detail_model.OrderDetail.order_id == request.order_id,
-        order_detail_model.OrderDetail.sandwich_id == request.sandwich_id
-    ).first()
-    if not order_contains_sandwich:
+    if not verification:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found!")
+    if verification.sandwich_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sandwich not found!")
+    if not verification.order_contains_sandwich:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You can only review sandwiches that you actually ordered!"
         )
 
-    # Check if customer already reviewed this sandwich from this order
-    existing_review = db.query(model.Review).filter(
-        model.Review.order_id == request.order_id,
-        model.Review.sandwich_id == request.sandwich_id
-    ).first()
-    if existing_review:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have already reviewed this sandwich from this order!"
-        )
+    try:
+        new_item = crud.create(db, dict(
+            order_id=request.order_id,
+            sandwich_id=request.sandwich_id,
+            customer_name=verification.customer_name,  # Pull from verified order
+            rating=request.rating,
+            comment=request.comment
+        ))
+    except IntegrityError as e:
+        db.rollback()
+        # The (order_id, sandwich_id) unique constraint rejects duplicates, even concurrent ones
+        if unique_violation(e, model.Review.__table__, "uq_reviews_order_sandwich"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You have already reviewed this sandwich from this order!"
+            )
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    queue.enqueue("reviews.refresh_rating_summary", sandwich_id=new_item.sandwich_id)
+    return new_item
+
+
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.Review, schema.Review)
 
-    new_item = model.Review(
-        order_id=request.order_id,
-        sandwich_id=request.sandwich_id,
-        customer_name=order.customer_name,  # Pull from verified order
-        rating=request.rating,
-        comment=request.comment
-    )
 
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Review, schema.Review, fields, expand)
     try:
-        db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        result = db.query(model.Review).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render(result) if fieldset else result
 
-    return new_item
+
+def read_all_fast(db: Session):
+    """Same JSON as read_all + schema.Review, built from column tuples without per-row models"""
+    try:
+        result = serializer_for(model.Review, schema.Review).load(db)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return FastJSONResponse(result)
 
 
-def read_all(db: Session):
+def read_one(db: Session, item_id, fields=None, expand=None, response: Response = None):
+    fieldset = parse_fieldset(model.Review, schema.Review, fields, expand)
     try:
-        result = db.query(model.Review).all()
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return with_etag(item, response, fieldset.render(item) if fieldset else None)
 
 
-def read_one(db: Session, item_id):
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several reviews by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.Review, schema.Review, fields, expand)
     try:
-        item = db.query(model.Review).filter(model.Review.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        items, missing = fetch_by_ids(db, model.Review, ids, _loader_options(fieldset))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
 
 
 def read_by_sandwich(db: Session, sandwich_id: int):
@@ -92,7 +155,7 @@ def read_by_sandwich(db: Session, sandwich_id: int):
             model.Review.sandwich_id == sandwich_id
         ).order_by(model.Review.review_date.desc()).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -104,7 +167,7 @@ def read_by_customer(db: Session, customer_name: str):
             model.Review.customer_name.ilike(f"%{customer_name}%")
         ).order_by(model.Review.review_date.desc()).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -112,165 +175,199 @@ def read_by_customer(db: Session, customer_name: str):
 def get_low_rated_dishes(db: Session, max_rating: int = 2):
     """CRITICAL: Staff function to identify dishes with complaints/low ratings"""
     try:
-        # Get sandwiches with average rating <= max_rating
+        # Sandwiches with average rating <= max_rating
         low_rated = db.query(
-            sandwich_model.Sandwich.id,
-            sandwich_model.Sandwich.sandwich_name,
+            model.Review.sandwich_id,
             func.avg(model.Review.rating).label('avg_rating'),
             func.count(model.Review.id).label('review_count')
-        ).join(
-            model.Review, sandwich_model.Sandwich.id == model.Review.sandwich_id
         ).group_by(
-            sandwich_model.Sandwich.id, sandwich_model.Sandwich.sandwich_name
+            model.Review.sandwich_id
         ).having(
             func.avg(model.Review.rating) <= max_rating
-        ).order_by(func.avg(model.Review.rating)).all()
-
-        problem_dishes = []
-        for dish in low_rated:
-            # Get recent complaints for this dish
-            recent_complaints = db.query(model.Review).filter(
-                model.Review.sandwich_id == dish.id,
-                model.Review.rating <= max_rating,
-                model.Review.comment.isnot(None)
-            ).order_by(model.Review.review_date.desc()).limit(3).all()
-
-            problem_dishes.append({
-                "sandwich_id": dish.id,
-                "sandwich_name": dish.sandwich_name,
-                "average_rating": round(float(dish.avg_rating), 2),
-                "total_reviews": dish.review_count,
-                "recent_complaints": [
-                    {
-                        "rating": complaint.rating,
-                        "comment": complaint.comment,
-                        "customer": complaint.customer_name,
-                        "date": complaint.review_date
-                    } for complaint in recent_complaints
-                ]
-            })
-
-        return problem_dishes
+        ).subquery()
+
+        # Complaints numbered newest-first within each sandwich
+        ranked_complaints = db.query(
+            model.Review.sandwich_id,
+            model.Review.rating,
+            model.Review.comment,
+            model.Review.customer_name,
+            model.Review.review_date,
+            func.row_number().over(
+                partition_by=model.Review.sandwich_id,
+                order_by=model.Review.review_date.desc()
+            ).label('complaint_rank')
+        ).filter(
+            model.Review.rating <= max_rating,
+            model.Review.comment.isnot(None)
+        ).subquery()
+
+        # One query for the whole report: each problem dish with its 3 most recent complaints
+        rows = db.query(
+            sandwich_model.Sandwich.id,
+            sandwich_model.Sandwich.sandwich_name,
+            low_rated.c.avg_rating,
+            low_rated.c.review_count,
+            ranked_complaints.c.rating,
+            ranked_complaints.c.comment,
+            ranked_complaints.c.customer_name,
+            ranked_complaints.c.review_date
+        ).join(
+            low_rated, sandwich_model.Sandwich.id == low_rated.c.sandwich_id
+        ).outerjoin(
+            ranked_complaints,
+            and_(
+                ranked_complaints.c.sandwich_id == sandwich_model.Sandwich.id,
+                ranked_complaints.c.complaint_rank <= 3
+            )
+        ).order_by(
+            low_rated.c.avg_rating, sandwich_model.Sandwich.id, ranked_complaints.c.complaint_rank
+        ).all()
+
+        problem_dishes = {}
+        for row in rows:
+            dish = problem_dishes.get(row.id)
+            if dish is None:
+                dish = problem_dishes[row.id] = {
+                    "sandwich_id": row.id,
+                    "sandwich_name": row.sandwich_name,
+                    "average_rating": round(float(row.avg_rating), 2),
+                    "total_reviews": row.review_count,
+                    "recent_complaints": []
+                }
+            if row.rating is not None:
+                dish["recent_complaints"].append({
+                    "rating": row.rating,
+                    "comment": row.comment,
+                    "customer": row.customer_name,
+                    "date": row.review_date
+                })
+
+        return list(problem_dishes.values())
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def get_sandwich_rating_summary(db: Session, sandwich_id: int):
-    """Get detailed rating breakdown for a specific sandwich"""
-    try:
-        # Get rating distribution
-        rating_counts = db.query(
-            model.Review.rating,
-            func.count(model.Review.rating).label('count')
-        ).filter(
-            model.Review.sandwich_id == sandwich_id
-        ).group_by(model.Review.rating).all()
+    """Get detailed rating breakdown for a specific sandwich
 
-        # Get overall stats
-        overall_stats = db.query(
-            func.avg(model.Review.rating).label('avg_rating'),
-            func.count(model.Review.id).label('total_reviews')
+    Read from sandwich_ratings, which a background job refreshes after every
+    review write, so a new review shows up here a moment after it is saved.
+    """
+    try:
+        summary = db.query(
+            sandwich_model.Sandwich.sandwich_name,
+            rating_model.SandwichRating
+        ).outerjoin(
+            rating_model.SandwichRating, rating_model.SandwichRating.sandwich_id == sandwich_model.Sandwich.id
         ).filter(
-            model.Review.sandwich_id == sandwich_id
-        ).first()
-
-        # Get sandwich name
-        sandwich = db.query(sandwich_model.Sandwich).filter(
             sandwich_model.Sandwich.id == sandwich_id
         ).first()
-        if not sandwich:
+        if not summary:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sandwich not found!")
 
-        # Format response
-        rating_breakdown = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        for rating, count in rating_counts:
-            rating_breakdown[rating] = count
-
+        ratings = summary.SandwichRating  # None: no reviews yet
         return {
             "sandwich_id": sandwich_id,
-            "sandwich_name": sandwich.sandwich_name,
-            "average_rating": round(float(overall_stats.avg_rating), 2) if overall_stats.avg_rating else 0,
-            "total_reviews": overall_stats.total_reviews,
-            "five_star_count": rating_breakdown[5],
-            "four_star_count": rating_breakdown[4],
-            "three_star_count": rating_breakdown[3],
-            "two_star_count": rating_breakdown[2],
-            "one_star_count": rating_breakdown[1]
+            "sandwich_name": summary.sandwich_name,
+            "average_rating": round(ratings.rating_sum / ratings.total_reviews, 2) if ratings else 0,
+            "total_reviews": ratings.total_reviews if ratings else 0,
+            **{column: getattr(ratings, column) if ratings else 0 for column in STAR_COUNTS.values()}
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def add_staff_response(db: Session, review_id: int, staff_response: str):
     """Staff function to respond to customer reviews"""
     try:
-        review = db.query(model.Review).filter(model.Review.id == review_id).first()
-        if not review:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found!")
-
-        review.staff_response = staff_response
-        review.response_date = datetime.now()
-        db.commit()
-        db.refresh(review)
-
+        # Setting response_date takes the review out of both staff queues
+        review = crud.update(
+            db, review_id, {"staff_response": staff_response, "response_date": datetime.now()},
+            not_found="Review not found!"
+        )
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
     return review
 
 
-def get_unanswered_reviews(db: Session):
-    """Staff function to find reviews that need responses"""
+def _encode_cursor(review):
+    raw = f"{review.review_date.isoformat()}|{review.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
     try:
-        result = db.query(model.Review).filter(
-            model.Review.staff_response.is_(None)
-        ).order_by(model.Review.review_date.desc()).all()
+        review_date, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(review_date), int(review_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor!")
+
+
+def _review_queue(db: Session, filters, cursor: str = None, limit: int = 50):
+    """Newest-first page of unanswered reviews, keyset-paginated on (review_date, id)"""
+    # The response includes each review's sandwich; load them all in one extra query
+    query = db.query(model.Review).options(selectinload(model.Review.sandwich)).filter(
+        model.Review.response_date.is_(None),
+        model.Review.staff_response.is_(None),
+        *filters
+    )
+    if cursor:
+        review_date, review_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            model.Review.review_date < review_date,
+            and_(model.Review.review_date == review_date, model.Review.id < review_id)
+        ))
+
+    try:
+        # Fetch one extra row to know whether there is a next page
+        rows = query.order_by(
+            model.Review.review_date.desc(), model.Review.id.desc()
+        ).limit(limit + 1).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+
+    items = rows[:limit]
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(items[-1]) if len(rows) > limit else None
+    }
 
 
-def get_reviews_needing_attention(db: Session):
+def get_unanswered_reviews(db: Session, cursor: str = None, limit: int = 50):
+    """Staff function to find reviews that need responses"""
+    return _review_queue(db, [], cursor=cursor, limit=limit)
+
+
+def get_reviews_needing_attention(db: Session, cursor: str = None, limit: int = 50):
     """Staff function to get low-rated reviews that need immediate attention"""
-    try:
-        result = db.query(model.Review).filter(
-            model.Review.rating <= 2,
-            model.Review.staff_response.is_(None)
-        ).order_by(model.Review.review_date.desc()).all()
-    except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return _review_queue(db, [model.Review.rating <= 2], cursor=cursor, limit=limit)
 
 
-def update(db: Session, item_id, request):
+def update(db: Session, item_id, request, if_match=None, response: Response = None):
     try:
-        item = db.query(model.Review).filter(model.Review.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
         update_data = request.dict(exclude_unset=True)
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data, if_match)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+    if "rating" in update_data:
+        queue.enqueue("reviews.refresh_rating_summary", sandwich_id=item.sandwich_id)
+    return with_etag(item, response)
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.Review).filter(model.Review.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        deleted = crud.delete(db, item_id, returning=(model.Review.sandwich_id,))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    queue.enqueue("reviews.refresh_rating_summary", sandwich_id=deleted.sandwich_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
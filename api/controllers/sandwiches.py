@@ -1,40 +1,61 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response, Depends
 from ..models import sandwiches as model
+from ..schemas import sandwiches as schema
+from ..dependencies.crud import CRUD
+from ..dependencies.etags import with_etag
+from ..dependencies.fieldsets import eager_options, parse_fieldset
+from ..dependencies.batch import fetch_by_ids
+from ..dependencies.fast_json import FastJSONResponse, serializer_for
 from ..models import reviews as review_model
+from ..dependencies.recipe_graph import graph
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func
+from sqlalchemy import func, not_
 from typing import List, Optional
 
+crud = CRUD(model.Sandwich, schema.Sandwich)
 
-def create(db: Session, request):
-    new_item = model.Sandwich(
-        sandwich_name=request.sandwich_name,
-        description=request.description,
-        price=request.price,
-        calories=request.calories,
-        category=request.category,
-        is_available=request.is_available
-    )
 
+def create(db: Session, request):
     try:
-        db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
+        new_item = crud.create(db, dict(
+            sandwich_name=request.sandwich_name,
+            description=request.description,
+            price=request.price,
+            calories=request.calories,
+            category=request.category,
+            is_available=request.is_available
+        ))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
     return new_item
 
 
-def read_all(db: Session):
+def _loader_options(fieldset):
+    # Only what ?fields=/?expand= asked for; otherwise everything the schema nests, in one query per relationship
+    return fieldset.options() if fieldset else eager_options(model.Sandwich, schema.Sandwich)
+
+
+def read_all(db: Session, fields=None, expand=None):
+    fieldset = parse_fieldset(model.Sandwich, schema.Sandwich, fields, expand)
     try:
-        result = db.query(model.Sandwich).all()
+        result = db.query(model.Sandwich).options(*_loader_options(fieldset)).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return result
+    return fieldset.render(result) if fieldset else result
+
+
+def read_all_fast(db: Session):
+    """Same JSON as read_all + schema.Sandwich, built from column tuples without per-row models"""
+    try:
+        result = serializer_for(model.Sandwich, schema.Sandwich).load(db)
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return FastJSONResponse(result)
 
 
 def read_available_only(db: Session):
@@ -44,20 +65,30 @@ def read_available_only(db: Session):
             model.Sandwich.is_available == True
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
 
-def read_one(db: Session, item_id):
+def read_one(db: Session, item_id, fields=None, expand=None, response: Response = None):
+    fieldset = parse_fieldset(model.Sandwich, schema.Sandwich, fields, expand)
     try:
-        item = db.query(model.Sandwich).filter(model.Sandwich.id == item_id).first()
-        if not item:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
+        item = crud.read_one(db, item_id, _loader_options(fieldset))
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item
+    return with_etag(item, response, fieldset.render(item) if fieldset else None)
+
+
+def read_many(db: Session, ids, fields=None, expand=None):
+    """Staff function: Several sandwiches by id in one query, in the order asked for"""
+    fieldset = parse_fieldset(model.Sandwich, schema.Sandwich, fields, expand)
+    try:
+        items, missing = fetch_by_ids(db, model.Sandwich, ids, _loader_options(fieldset))
+    except SQLAlchemyError as e:
+        error = str(e.__dict__.get('orig', e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    return fieldset.render_batch(items, missing) if fieldset else {"items": items, "missing": missing}
 
 
 def search_by_category(db: Session, category: str):
@@ -69,7 +100,7 @@ def search_by_category(db: Session, category: str):
             model.Sandwich.is_available == True  # Only show available items
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -82,7 +113,7 @@ def search_by_name(db: Session, name: str):
             model.Sandwich.is_available == True
         ).all()
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
     return result
 
@@ -118,7 +149,7 @@ def get_menu_with_ratings(db: Session):
         return menu_with_ratings
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -158,7 +189,7 @@ def get_popular_items(db: Session, limit: int = 10):
         return popular_list
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -202,21 +233,17 @@ def get_unpopular_items(db: Session):
         return unpopular_list
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
 def toggle_availability(db: Session, sandwich_id: int):
     """Staff function: Quick toggle availability on/off"""
     try:
-        sandwich = db.query(model.Sandwich).filter(model.Sandwich.id == sandwich_id).first()
-        if not sandwich:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sandwich not found!")
-
-        # Toggle availability
-        sandwich.is_available = not sandwich.is_available
-        db.commit()
-        db.refresh(sandwich)
+        # Toggled in the UPDATE itself, so two staff toggling at once can't both "turn it off"
+        sandwich = crud.update(
+            db, sandwich_id, {"is_available": not_(model.Sandwich.is_available)}, not_found="Sandwich not found!"
+        )
 
         status_text = "available" if sandwich.is_available else "unavailable"
         return {
@@ -225,7 +252,7 @@ def toggle_availability(db: Session, sandwich_id: int):
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -248,7 +275,7 @@ def get_category_list(db: Session):
         return sorted(list(all_categories))
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
@@ -278,32 +305,26 @@ def get_sandwich_with_details(db: Session, sandwich_id: int):
         }
 
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
 
-def update(db: Session, item_id, request):
+def update(db: Session, item_id, request, if_match=None, response: Response = None):
     try:
-        item = db.query(model.Sandwich).filter(model.Sandwich.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
         update_data = request.dict(exclude_unset=True)
-        item.update(update_data, synchronize_session=False)
-        db.commit()
+        item = crud.update(db, item_id, update_data, if_match)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
-    return item.first()
+    return with_etag(item, response)
 
 
 def delete(db: Session, item_id):
     try:
-        item = db.query(model.Sandwich).filter(model.Sandwich.id == item_id)
-        if not item.first():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Id not found!")
-        item.delete(synchronize_session=False)
-        db.commit()
+        crud.delete(db, item_id)
     except SQLAlchemyError as e:
-        error = str(e.__dict__['orig'])
+        error = str(e.__dict__.get('orig', e))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    graph.invalidate_sandwich(item_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
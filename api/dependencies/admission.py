@@ -0,0 +1,166 @@
+import math
+import re
+import time
+from collections import OrderedDict, namedtuple
+from .config import conf
+from .database import engine
+from .fast_json import dumps
+
+# rate/burst: tokens per second and bucket size, per client.
+# shed_at: load (0-1) from which the class gets 503s; None means never shed.
+RouteClass = namedtuple("RouteClass", ["name", "rate", "burst", "shed_at"])
+
+CHECKOUT = RouteClass("checkout", rate=5, burst=20, shed_at=None)
+KITCHEN = RouteClass("kitchen", rate=20, burst=50, shed_at=None)
+WRITE = RouteClass("write", rate=5, burst=20, shed_at=1.0)
+READ = RouteClass("read", rate=10, burst=30, shed_at=0.75)
+REPORT = RouteClass("report", rate=0.5, burst=5, shed_at=0.5)
+
+# (methods, path pattern, class); first match wins, ops routes are never limited
+ROUTE_RULES = [
+    (None, re.compile(r"^/(metrics|system/|docs|redoc|openapi\.json)"), None),
+    ({"POST"}, re.compile(r"^/(orders|orderdetails)/$"), CHECKOUT),
+    ({"POST"}, re.compile(r"^/promocodes/(validate|redeem/[^/]+)$"), CHECKOUT),
+    ({"PUT"}, re.compile(r"^/orders/\d+/status$"), KITCHEN),
+    ({"GET"}, re.compile(
+        r"^/(orders/(date-range/|export)|dashboard/|analytics/|recipes/margins/|reviews/(low-rated/|queues/)|sandwiches/(popular|unpopular)/)"
+    ), REPORT),
+    ({"GET", "HEAD"}, re.compile(r"^/"), READ),
+    (None, re.compile(r"^/"), WRITE),
+]
+
+
+# Requests that hold several pooled connections at once count that many times toward load
+FAN_OUT = [
+    (re.compile(r"^/dashboard/"), conf.dashboard_max_connections),
+]
+
+
+def fan_out(path):
+    for pattern, connections in FAN_OUT:
+        if pattern.match(path):
+            return connections
+    return 1
+
+
+def classify(method, path):
+    for methods, pattern, route_class in ROUTE_RULES:
+        if (methods is None or method in methods) and pattern.match(path):
+            return route_class
+    return None
+
+
+def pool_utilization(bind=None):
+    """Share of the pool's connections (overflow included) checked out right now"""
+    pool = (bind or engine).pool
+    if not hasattr(pool, "checkedout"):
+        return 0.0
+    capacity = pool.size() + max(conf.db_max_overflow, 0)
+    return pool.checkedout() / capacity if capacity else 0.0
+
+
+class AdmissionController:
+    """Token buckets per (client, route class) plus priority-aware load shedding
+
+    Load is the larger of in-flight requests over max_in_flight and primary pool
+    utilization. Cheap reads and staff reports are turned away first, while
+    checkout and kitchen status updates are never shed. Like the metrics
+    registry, this is only touched from the event loop, so no locks.
+    """
+
+    def __init__(self, max_in_flight=64, max_clients=100000):
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.buckets = OrderedDict()  # (client, class name) -> [tokens, last refill]
+        self.rejected = {}  # (class name, status code) -> count
+
+    def load(self):
+        return max(self.in_flight / self.max_in_flight, pool_utilization())
+
+    def take_token(self, client, route_class, now=None):
+        """0 if the request may go ahead, else the seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        key = (client, route_class.name)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(route_class.burst), now]
+            if len(self.buckets) > self.max_clients:
+                # Idle clients go first; a dropped bucket just comes back full
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(route_class.burst, bucket[0] + (now - bucket[1]) * route_class.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / route_class.rate
+
+    def admit(self, client, route_class):
+        """(status code, Retry-After seconds) to reject with, or None to admit"""
+        if route_class.shed_at is not None and self.load() >= route_class.shed_at:
+            return 503, conf.shed_retry_after_seconds
+        wait = self.take_token(client, route_class)
+        if wait:
+            return 429, wait
+        return None
+
+    def reset(self):
+        self.in_flight = 0
+        self.buckets.clear()
+        self.rejected = {}
+
+
+admission = AdmissionController(max_in_flight=conf.admission_max_in_flight)
+
+
+def client_id(scope):
+    if conf.trust_forwarded_for:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """Answers 429/503 with Retry-After before any DB work is done (ADMISSION_CONTROL=true)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not conf.admission_control:
+            return await self.app(scope, receive, send)
+
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            return await self.app(scope, receive, send)
+
+        rejection = admission.admit(client_id(scope), route_class)
+        if rejection is not None:
+            status_code, retry_after = rejection
+            key = (route_class.name, status_code)
+            admission.rejected[key] = admission.rejected.get(key, 0) + 1
+            detail = "Too many requests" if status_code == 429 else "Server busy, try again shortly"
+            body = dumps({"detail": detail})
+            await send({
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        weight = fan_out(scope["path"])
+        admission.in_flight += weight
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.in_flight -= weight
@@ -0,0 +1,32 @@
+from fastapi import HTTPException, Query, status
+from sqlalchemy import inspect
+from .config import conf
+from .fast_json import IN_CHUNK_SIZE
+
+
+def batch_ids(ids: str = Query(..., description="Comma-separated ids, e.g. 3,1,2")):
+    """Dependency parsing ?ids= into a list of ints, duplicates dropped, request order kept"""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    parsed = list(dict.fromkeys(parsed))
+    if not parsed:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No ids given")
+    if len(parsed) > conf.batch_max_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {conf.batch_max_ids} ids per request"
+        )
+    return parsed
+
+
+def fetch_by_ids(db, model, ids, options=()):
+    """(rows in the order of ids, ids with no row), one IN query per IN_CHUNK_SIZE ids"""
+    primary_key = inspect(model).primary_key[0]
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[start:start + IN_CHUNK_SIZE]
+        for item in db.query(model).options(*options).filter(primary_key.in_(chunk)):
+            found[getattr(item, primary_key.key)] = item
+    return [found[item_id] for item_id in ids if item_id in found], [item_id for item_id in ids if item_id not in found]
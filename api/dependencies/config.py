@@ -1,8 +1,88 @@
+import os
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
 class conf:
-    db_host = "localhost"
-    db_name = "sandwich_maker_api"
-    db_port = 3306
-    db_user = "root"
-    db_password = "root"
-    app_host = "localhost"
-    app_port = 8000
\ No newline at end of file
+    db_host = os.getenv("DB_HOST", "localhost")
+    db_name = os.getenv("DB_NAME", "sandwich_maker_api")
+    db_port = int(os.getenv("DB_PORT", "3306"))
+    db_user = os.getenv("DB_USER", "root")
+    db_password = os.getenv("DB_PASSWORD", "root")
+    # Full SQLAlchemy URL; overrides the MySQL settings above (e.g. "sqlite:///./sandwich.db")
+    database_url = os.getenv("DATABASE_URL")
+
+    # Read replica for GET routes and staff reports; unset means reads use the primary too
+    replica_database_url = os.getenv("REPLICA_DATABASE_URL")
+    # After a write, that client reads from the primary for this long (covers replication lag)
+    read_your_writes_seconds = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+    # Connection pool (ignored for SQLite in-memory databases)
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+    db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds; stays under MySQL wait_timeout
+    db_pool_pre_ping = _env_bool("DB_POOL_PRE_PING", True)
+
+    # SQLite mode (single-node stores)
+    sqlite_wal = _env_bool("SQLITE_WAL", True)
+    sqlite_synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    sqlite_busy_timeout_ms = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # Workers check the schema version on startup; migrate with `python -m api.models.model_loader`
+    verify_schema_on_startup = _env_bool("VERIFY_SCHEMA_ON_STARTUP", True)
+
+    # Debug mode adds an X-Query-Count header and logs statements repeated this many times per request
+    debug = _env_bool("DEBUG", False)
+    n_plus_one_threshold = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+    # Token-bucket rate limits per client and route class, and load shedding of reads/reports
+    admission_control = _env_bool("ADMISSION_CONTROL", False)
+    admission_max_in_flight = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))  # Requests per worker at full load
+    shed_retry_after_seconds = int(os.getenv("SHED_RETRY_AFTER_SECONDS", "1"))
+    trust_forwarded_for = _env_bool("TRUST_FORWARDED_FOR", False)  # Identify clients by X-Forwarded-For (behind a proxy)
+
+    # Background jobs (low-stock alerts, cache refreshes): "memory", or "sqlite" to keep them across restarts
+    jobs_backend = os.getenv("JOBS_BACKEND", "memory")
+    jobs_sqlite_path = os.getenv("JOBS_SQLITE_PATH", "jobs.db")
+    jobs_workers = int(os.getenv("JOBS_WORKERS", "2"))
+    jobs_max_queue = int(os.getenv("JOBS_MAX_QUEUE", "1000"))
+    jobs_max_attempts = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+    jobs_retry_delay_seconds = float(os.getenv("JOBS_RETRY_DELAY_SECONDS", "1"))
+    # sqlite backend: a running job whose worker stopped renewing it for this long is run again elsewhere
+    jobs_lease_seconds = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+
+    # Group commit for POST /orders/: orders arriving within this window share one transaction (0 = off)
+    group_commit_window_ms = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))
+    group_commit_max_batch = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "100"))
+
+    # Tracking-number node id (0-1023) for this process; every process needs its own. Unset: leased, see below
+    node_id = int(os.environ["NODE_ID"]) if os.getenv("NODE_ID") else None
+    # Each worker process leases a tracking-number node id (0-1023) in the database for this long, renewing it at half
+    node_lease_seconds = float(os.getenv("NODE_LEASE_SECONDS", "600"))
+
+    # Pooled connections the staff dashboard may hold at once (per worker), however many are open
+    dashboard_max_connections = int(os.getenv("DASHBOARD_MAX_CONNECTIONS", "3"))
+
+    # Most ids a GET /<resource>/batch?ids= request may ask for
+    batch_max_ids = int(os.getenv("BATCH_MAX_IDS", "1000"))
+
+    # GET /analytics/sales answers from an in-memory copy of the order lines (needs numpy):
+    # new lines are appended at most this often, and the copy is rebuilt (to pick up edits) this often
+    sales_cube_refresh_seconds = float(os.getenv("SALES_CUBE_REFRESH_SECONDS", "5"))
+    sales_cube_rebuild_seconds = float(os.getenv("SALES_CUBE_REBUILD_SECONDS", "3600"))
+    # Ids skipped below the newest line (commits landing out of id order, replica lag) are looked for this long
+    sales_cube_gap_seconds = float(os.getenv("SALES_CUBE_GAP_SECONDS", "300"))
+
+    app_host = os.getenv("APP_HOST", "localhost")
+    app_port = int(os.getenv("APP_PORT", "8000"))
+    promo_cache_ttl_seconds = float(os.getenv("PROMO_CACHE_TTL_SECONDS", "60"))
+    # Recipe costs and margins are reloaded this often, to pick up edits made through other workers
+    recipe_graph_ttl_seconds = float(os.getenv("RECIPE_GRAPH_TTL_SECONDS", "60"))
+
+    # Responses to POSTs with an Idempotency-Key are replayed for this long (from the database, so by every worker)
+    idempotency_ttl_seconds = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # A request still running after this long is presumed dead, and a retry may run the endpoint again
+    idempotency_lock_seconds = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
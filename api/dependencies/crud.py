@@ -0,0 +1,164 @@
+"""Create/read/update/delete of one row by id, in one statement each
+
+    crud = CRUD(model.Sandwich, schema.Sandwich)
+
+    crud.create(db, {"sandwich_name": "Club", "price": 8.5})   # INSERT ... RETURNING
+    crud.read_one(db, 3)                                       # SELECT
+    crud.update(db, 3, {"price": 9}, if_match='"4"')           # UPDATE ... WHERE id AND version RETURNING
+    crud.delete(db, 3)                                         # DELETE, rowcount for the 404
+
+Rows come back from the write itself, so nothing is read before or after it;
+relationships the response schema nests are loaded like on the read routes
+(one query each). On databases without RETURNING (MySQL), create and update
+read the row back once after writing instead.
+
+Missing rows raise 404 and a stale If-Match raises 412. Database errors are
+left to the controller, which reports them its own way.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, inspect, select, update
+from .etags import etag, parse_if_match
+from .fieldsets import eager_options
+
+NOT_FOUND = "Id not found!"
+
+
+def _commit(db):
+    # Rows returned by the statement are exactly what is being committed, so
+    # don't let the commit expire them (that would reload each one on access)
+    expire_on_commit, db.expire_on_commit = db.expire_on_commit, False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
+
+class CRUD:
+    def __init__(self, model, schema=None):
+        self.model = model
+        self.schema = schema
+        mapper = inspect(model)
+        self.primary_key = mapper.primary_key[0]
+        self.version = mapper.version_id_col  # None for models without a row version
+
+    def _options(self, options):
+        if options is not None:
+            return options
+        return eager_options(self.model, self.schema) if self.schema is not None else ()
+
+    def _returning(self, db, statement, options):
+        """Run INSERT/UPDATE ... RETURNING as ORM objects, with the schema's relationships loaded"""
+        query = select(self.model).from_statement(statement.returning(self.model)).options(*options)
+        return db.execute(query, execution_options={"populate_existing": True}).scalars().one_or_none()
+
+    def _select(self, db, item_id, options):
+        return db.query(self.model).options(*options).filter(self.primary_key == item_id).first()
+
+    @staticmethod
+    def _not_found(detail):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+    @staticmethod
+    def _precondition_failed(current_version):
+        return HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Changed since it was read; the current ETag is {etag(current_version)}"
+        )
+
+    def create(self, db, values, options=None):
+        """Insert a row and commit; returns it with its defaults filled in"""
+        columns = self.model.__table__.columns
+        # None for a column with a default means "use the default", as with the ORM
+        values = {
+            key: value for key, value in values.items()
+            if not (value is None and (columns[key].default is not None or columns[key].server_default is not None))
+        }
+        options = self._options(options)
+        statement = insert(self.model).values(**values)
+        if db.get_bind().dialect.insert_returning:
+            item = self._returning(db, statement, options)
+        else:
+            item_id = db.execute(statement).inserted_primary_key[0]
+            item = self._select(db, item_id, options)
+        _commit(db)
+        return item
+
+    def read_one(self, db, item_id, options=None, not_found=NOT_FOUND):
+        item = self._select(db, item_id, self._options(options))
+        if item is None:
+            raise self._not_found(not_found)
+        return item
+
+    def update(self, db, item_id, values, if_match=None, options=None, not_found=NOT_FOUND, where=()):
+        """Update the row (and bump its version) and commit; returns it as updated
+
+        With if_match, only a row still at one of those versions is updated.
+        where adds conditions of its own (e.g. Resource.amount >= 3, for a guarded
+        decrement); if the row exists but fails them, nothing is written and None
+        is returned.
+        """
+        if not values:
+            # Nothing to write, so no UPDATE: the version (and so the ETag) stays as it is
+            item = self.read_one(db, item_id, options, not_found)
+            versions = parse_if_match(if_match) if self.version is not None else None
+            if versions is not None and getattr(item, self.version.key) not in versions:
+                raise self._precondition_failed(getattr(item, self.version.key))
+            return item
+
+        statement = update(self.model).where(self.primary_key == item_id, *where).values(**values)
+        versions = None
+        if self.version is not None:
+            statement = statement.values({self.version: self.version + 1})
+            versions = parse_if_match(if_match)
+            if versions is not None:
+                statement = statement.where(
+                    self.version == versions[0] if len(versions) == 1 else self.version.in_(versions)
+                )
+
+        options = self._options(options)
+        if db.get_bind().dialect.update_returning:
+            item = self._returning(db, statement, options)
+        else:
+            matched = db.execute(statement, execution_options={"synchronize_session": False}).rowcount
+            item = self._select(db, item_id, options) if matched else None
+
+        if item is None:
+            return self._missed_update(db, item_id, versions, where, not_found)
+        _commit(db)
+        return item
+
+    def _missed_update(self, db, item_id, versions, where, not_found):
+        # Only now is the row looked up, to tell a missing row from a stale If-Match or a failed where
+        current = None
+        if versions is not None or where:
+            column = self.version if self.version is not None else self.primary_key
+            current = db.query(column).filter(self.primary_key == item_id).scalar()
+        db.rollback()
+        if current is None:
+            raise self._not_found(not_found)
+        if versions is not None and current not in versions:
+            raise self._precondition_failed(current)
+        return None
+
+    def delete(self, db, item_id, returning=(), not_found=NOT_FOUND):
+        """Delete the row and commit; returns the `returning` columns of the deleted row
+
+        (e.g. returning=(model.PromoCode.code,) to invalidate a cache keyed by code)
+        """
+        statement = delete(self.model).where(self.primary_key == item_id)
+        if not returning:
+            if not db.execute(statement, execution_options={"synchronize_session": False}).rowcount:
+                raise self._not_found(not_found)
+            _commit(db)
+            return None
+
+        if db.get_bind().dialect.delete_returning:
+            row = db.execute(statement.returning(*returning), execution_options={"synchronize_session": False}).first()
+        else:
+            row = db.query(*returning).filter(self.primary_key == item_id).first()
+            if row is not None:
+                db.execute(statement, execution_options={"synchronize_session": False})
+        if row is None:
+            raise self._not_found(not_found)
+        _commit(db)
+        return row
@@ -0,0 +1,94 @@
+"""Runs independent report sections concurrently and caches each for its own TTL
+
+    dashboard = Dashboard([
+        Section("todays_revenue", todays_revenue, ttl_seconds=10),
+        Section("low_stock_items", resources.get_low_stock_items, ttl_seconds=30),
+    ])
+    dashboard.render(session_factory)
+
+Each stale section runs in a worker thread with its own session (so its own
+pooled connection); fresh ones come from the cache. The worker pool is shared by
+every request and capped at DASHBOARD_MAX_CONNECTIONS, so however many
+dashboards are open, they never hold more pooled connections than that. A
+section already being loaded for another request is waited for, not run again.
+A section that fails is reported under "errors" instead of failing the whole
+document.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from fastapi import HTTPException
+from .config import conf
+
+Section = namedtuple("Section", ["name", "load", "ttl_seconds"])
+
+
+class Dashboard:
+    def __init__(self, sections, max_workers=None):
+        self.sections = list(sections)
+        self._executor = ThreadPoolExecutor(
+            max_workers=min(max_workers or conf.dashboard_max_connections, len(self.sections)),
+            thread_name_prefix="dashboard"
+        )
+        self._lock = threading.RLock()  # Reentrant: a done callback can run inside add_done_callback
+        self._cache = {}  # section name -> (expires_at, computed_at, value)
+        self._loading = {}  # section name -> future of the load in progress
+
+    def _run(self, section, session_factory):
+        db = session_factory()
+        try:
+            value = section.load(db)
+        finally:
+            db.close()
+        finished = time.monotonic()
+        with self._lock:
+            self._cache[section.name] = (finished + section.ttl_seconds, finished, value)
+        return value
+
+    def _finished(self, name, future):
+        with self._lock:
+            if self._loading.get(name) is future:
+                del self._loading[name]
+
+    def render(self, session_factory, refresh=False):
+        """{"sections": {name: value}, "cached": {name: age in seconds}, "errors": {name: detail}}"""
+        now = time.monotonic()
+        futures = {}
+        with self._lock:
+            cached = {} if refresh else {
+                name: entry for name, entry in self._cache.items() if entry[0] > now
+            }
+            for section in self.sections:
+                if section.name in cached:
+                    continue
+                # One load per section at a time; concurrent requests share it
+                future = self._loading.get(section.name)
+                if future is None or future.done():  # Done but its callback hasn't cleared it yet: stale
+                    future = self._executor.submit(self._run, section, session_factory)
+                    self._loading[section.name] = future
+                    future.add_done_callback(partial(self._finished, section.name))
+                futures[section.name] = future
+
+        document = {"generated_at": datetime.now(), "sections": {}, "cached": {}, "errors": {}}
+        for section in self.sections:
+            if section.name in cached:
+                _, computed_at, value = cached[section.name]
+                document["cached"][section.name] = round(now - computed_at, 3)
+            else:
+                try:
+                    value = futures[section.name].result()
+                except HTTPException as error:
+                    value = None
+                    document["errors"][section.name] = error.detail
+                except Exception as error:
+                    value = None
+                    document["errors"][section.name] = f"{type(error).__name__}: {error}"
+            document["sections"][section.name] = value
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
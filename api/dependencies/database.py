@@ -1,20 +1,214 @@
-from sqlalchemy import create_engine
+import math
+import time
+from functools import partial
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
 from .config import conf
 from urllib.parse import quote_plus
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{conf.db_user}:{quote_plus(conf.db_password)}@{conf.db_host}:{conf.db_port}/{conf.db_name}?charset=utf8mb4"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-)
+
+def database_url():
+    if conf.database_url:
+        return conf.database_url
+    return f"mysql+pymysql://{conf.db_user}:{quote_plus(conf.db_password)}@{conf.db_host}:{conf.db_port}/{conf.db_name}?charset=utf8mb4"
+
+
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _sqlite_pragmas():
+    """PRAGMA statements for new SQLite connections; PRAGMA takes no bound parameters, so values are checked"""
+    synchronous = str(conf.sqlite_synchronous).strip().upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS_MODES)}")
+    pragmas = [f"PRAGMA synchronous={synchronous}", f"PRAGMA busy_timeout={int(conf.sqlite_busy_timeout_ms)}"]
+    if conf.sqlite_wal:
+        # No-op for in-memory databases, which always use the "memory" journal
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    return pragmas
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def create_db_engine(url=None, **kwargs):
+    """Create an engine from configuration; keyword arguments override the pool settings"""
+    url = make_url(url or database_url())
+
+    if url.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if url.database in (None, "", ":memory:"):
+            # Every session has to share the one in-memory database
+            options["poolclass"] = StaticPool
+        else:
+            options.update(
+                pool_size=conf.db_pool_size,
+                max_overflow=conf.db_max_overflow,
+                pool_timeout=conf.db_pool_timeout
+            )
+        options.update(kwargs)
+        pragmas = _sqlite_pragmas()
+        new_engine = create_engine(url, **options)
+        event.listen(new_engine, "connect", partial(_set_sqlite_pragmas, pragmas))
+        return new_engine
+
+    options = {
+        "pool_size": conf.db_pool_size,
+        "max_overflow": conf.db_max_overflow,
+        "pool_timeout": conf.db_pool_timeout,
+        "pool_recycle": conf.db_pool_recycle,
+        "pool_pre_ping": conf.db_pool_pre_ping
+    }
+    options.update(kwargs)
+    return create_engine(url, **options)
+
+
+def unique_violation(error, table, constraint_name):
+    """True if an IntegrityError was raised by this unique constraint (not another one, or a foreign key)
+
+    MySQL and PostgreSQL name the constraint in the message; SQLite lists its columns instead.
+    """
+    message = str(error.__dict__.get('orig', error))
+    if constraint_name in message:
+        return True
+    constraint = next(
+        (constraint for constraint in table.constraints if getattr(constraint, "name", None) == constraint_name), None
+    )
+    if constraint is None:
+        return False
+    columns = ", ".join(f"{table.name}.{column.name}" for column in constraint.columns)
+    return f"UNIQUE constraint failed: {columns}" in message
+
+
+def pool_stats(bind=None):
+    """Current connection pool usage, for sizing pools against the worker count"""
+    pool = (bind or engine).pool
+    stats = {"pool_class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            pool_size=pool.size(),
+            max_overflow=conf.db_max_overflow,
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow()
+        )
+    return stats
+
+
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+
+class SessionRouter:
+    """Hands out primary sessions for writes and replica sessions for reads
+
+    A commit on a write session marks the request; ReadYourWritesMiddleware
+    then answers with the time of the write, both as a short-lived cookie and
+    as an X-Last-Write header. While it is fresh, that client's reads go to
+    the primary as well, so e.g. tracking an order right after creating it
+    never hits a lagging replica. Browsers send the cookie back by themselves;
+    other clients (mobile apps, services) echo the header on their next
+    requests instead.
+    """
+
+    def __init__(self, primary, replica=None, read_your_writes_seconds=None):
+        self.primary = primary
+        self.replica = replica if replica is not None else primary
+        self.read_your_writes_seconds = (
+            conf.read_your_writes_seconds if read_your_writes_seconds is None else read_your_writes_seconds
+        )
+        self.primary_sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.primary)
+        self.replica_sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.replica)
+
+    @property
+    def has_replica(self):
+        return self.replica is not self.primary
+
+    def _wrote_recently(self, request):
+        last_write = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+        if last_write is None:
+            return False
+        try:
+            return time.time() - float(last_write) < self.read_your_writes_seconds
+        except ValueError:
+            return False
+
+    def write(self, request: Request):
+        db = self.primary_sessions()
+        if self.has_replica:
+            @event.listens_for(db, "after_commit")
+            def _remember_write(session):
+                # Kept on the request rather than an injected Response, which routes
+                # that return their own Response would drop
+                request.state.last_write = (f"{time.time():.3f}", math.ceil(self.read_your_writes_seconds))
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def read_sessions(self, request: Request):
+        """Session factory for reads, for routes that open several sessions (e.g. one per thread)"""
+        return self.primary_sessions if self._wrote_recently(request) else self.replica_sessions
+
+    def read(self, request: Request):
+        db = self.read_sessions(request)()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+class ReadYourWritesMiddleware:
+    """Adds the last-write cookie and X-Last-Write header to responses of requests that committed"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            last_write = scope.get("state", {}).get("last_write")
+            if message["type"] == "http.response.start" and last_write is not None:
+                written_at, max_age = last_write
+                cookie = Response()
+                cookie.set_cookie(LAST_WRITE_COOKIE, written_at, max_age=max_age, httponly=True, samesite="lax")
+                message["headers"] = list(message.get("headers", [])) + [
+                    *(header for header in cookie.raw_headers if header[0] == b"set-cookie"),
+                    (LAST_WRITE_HEADER.lower().encode(), written_at.encode()),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+SQLALCHEMY_DATABASE_URL = database_url()
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+replica_engine = create_db_engine(conf.replica_database_url) if conf.replica_database_url else engine
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+sessions = SessionRouter(engine, replica_engine)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def get_db(request: Request):
+    """Write session on the primary; use for every route that changes data"""
+    yield from sessions.write(request)
+
+
+def get_read_db(request: Request):
+    """Read session on the replica (the primary right after this client wrote)"""
+    yield from sessions.read(request)
+
+
+def get_read_sessions(request: Request):
+    """Factory for read sessions, like get_read_db, for routes that query on several threads"""
+    return sessions.read_sessions(request)
@@ -0,0 +1,47 @@
+"""ETags from row versions, and conditional updates with If-Match
+
+GET /sandwiches/3 answers with ETag: "7" (the row's version column). Sending
+that back as If-Match on PUT /sandwiches/3 makes the update a single
+
+    UPDATE sandwiches SET ..., version = version + 1 WHERE id = 3 AND version = 7
+
+so a concurrent edit in between is answered with 412 instead of being
+overwritten, without a SELECT first and without row locks (see CRUD.update).
+Without If-Match (or with If-Match: *) the update is unconditional, as before.
+"""
+from fastapi import HTTPException, Response, status
+
+
+def etag(version) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(value):
+    """Versions listed in an If-Match header, or None if any version will do"""
+    if value is None or value.strip() == "*":
+        return None
+    versions = []
+    for tag in value.split(","):
+        tag = tag.strip()
+        # Weak tags never match for If-Match (RFC 9110 13.1.1)
+        if tag.startswith("W/"):
+            continue
+        try:
+            versions.append(int(tag.strip('"')))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid If-Match header: {value}")
+    return versions
+
+
+def with_etag(item, response: Response = None, rendered=None):
+    """rendered (default: item) with item's version as the ETag header
+
+    The header goes on rendered itself if it is already a Response (fieldsets),
+    otherwise on the route's response.
+    """
+    result = item if rendered is None else rendered
+    target = result if isinstance(result, Response) else response
+    if target is not None:
+        target.headers["ETag"] = etag(item.version)
+    return result
+
@@ -0,0 +1,136 @@
+import json
+import typing
+from functools import lru_cache
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import RelationshipDirection
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+IN_CHUNK_SIZE = 500
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _nested_schema(annotation):
+    """The pydantic model inside Optional[X] / list[X] / Optional[list[X]]"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for argument in typing.get_args(annotation):
+        schema = _nested_schema(argument)
+        if schema is not None:
+            return schema
+    return None
+
+
+class RowSerializer:
+    """Builds the same JSON documents as a response_model, straight from column tuples
+
+    Only the columns the schema exposes are selected, nested relationships are
+    loaded with one IN query per relationship, and no ORM objects or pydantic
+    models are created per row.
+    """
+
+    def __init__(self, model, schema):
+        self.model = model
+        mapper = inspect(model)
+        columns = mapper.columns
+        self.fields = []  # (name, relationship or None for a plain column, nested RowSerializer)
+        selected = []
+        for name, field in schema.model_fields.items():
+            if name in columns:
+                self.fields.append((name, None, None))
+                if name not in selected:
+                    selected.append(name)
+            elif name in mapper.relationships:
+                relationship = mapper.relationships[name]
+                nested = RowSerializer(relationship.mapper.class_, _nested_schema(field.annotation))
+                self.fields.append((name, relationship, nested))
+                # Both sides of the join are needed even if the schemas don't expose them
+                local_column, remote_column = relationship.local_remote_pairs[0]
+                if local_column.key not in selected:
+                    selected.append(local_column.key)
+                if remote_column.key not in nested.selected:
+                    nested.selected.append(remote_column.key)
+        self.selected = selected
+        self.field_names = [name for name, _, _ in self.fields]
+
+    def _select(self, db):
+        return db.query(*[getattr(self.model, name) for name in self.selected])
+
+    def load(self, db, *criteria, order_by=None, query=None):
+        """List of JSON-ready dicts for every row matching the criteria"""
+        query = query if query is not None else self._select(db)
+        if criteria:
+            query = query.filter(*criteria)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        return [self._shape(record) for record in self._build(db, query.all())]
+
+    def _load_by(self, db, column_name, keys):
+        """(key, document) pairs for the rows whose column_name is in keys"""
+        rows = []
+        keys = list(keys)
+        column = getattr(self.model, column_name)
+        for start in range(0, len(keys), IN_CHUNK_SIZE):
+            rows += self._select(db).filter(column.in_(keys[start:start + IN_CHUNK_SIZE])).all()
+        return [(record[column_name], self._shape(record)) for record in self._build(db, rows)]
+
+    def _shape(self, record):
+        # Same keys, in the same order, as the pydantic schema
+        return {name: record[name] for name in self.field_names}
+
+    def _build(self, db, rows):
+        names = self.selected
+        records = [dict(zip(names, row)) for row in rows]
+
+        for name, relationship, nested in self.fields:
+            if relationship is None:
+                continue
+            local_column, remote_column = relationship.local_remote_pairs[0]
+            keys = {record[local_column.key] for record in records if record[local_column.key] is not None}
+            children = nested._load_by(db, remote_column.key, keys) if keys else []
+
+            if relationship.direction is RelationshipDirection.MANYTOONE:
+                by_key = dict(children)
+                for record in records:
+                    record[name] = by_key.get(record[local_column.key])
+            else:
+                grouped = {}
+                for key, child in children:
+                    grouped.setdefault(key, []).append(child)
+                for record in records:
+                    record[name] = grouped.get(record[local_column.key], [])
+
+        return records
+
+
+@lru_cache(maxsize=None)
+def serializer_for(model, schema):
+    """Shared RowSerializer per (model, schema); built on first use, once mappers are configured"""
+    return RowSerializer(model, schema)
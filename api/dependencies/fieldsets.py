@@ -0,0 +1,151 @@
+"""Sparse fieldsets for read routes: ?fields=id,status,tracking_number&expand=order_details.sandwich
+
+fields picks top-level columns from the route's schema (default: all of them),
+expand picks relationships to include, dotted for nested ones. Without either
+parameter the route answers as before. With them, only the chosen columns are
+loaded (load_only), each expanded relationship costs one selectinload query,
+and the response is validated against a schema trimmed to the same fields.
+"""
+import typing
+from functools import lru_cache
+from fastapi import HTTPException, Response, status
+from pydantic import ConfigDict, TypeAdapter, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+from .fast_json import _nested_schema, dumps
+
+
+def _names(value):
+    return tuple(sorted({part.strip() for part in value.split(",") if part.strip()})) if value else ()
+
+
+def _split_schema(model, schema):
+    """(column field names, {relationship field name: nested schema}) in schema order"""
+    mapper = inspect(model)
+    columns, relationships = [], {}
+    for name, field in schema.model_fields.items():
+        if name in mapper.relationships:
+            relationships[name] = _nested_schema(field.annotation)
+        elif name in mapper.columns:
+            columns.append(name)
+    return columns, relationships
+
+
+def _expand_tree(model, schema, paths):
+    """{"order_details": {"sandwich": {}}} from ("order_details.sandwich",), validated against the schemas"""
+    tree = {}
+    for path in paths:
+        current_model, current_schema, node = model, schema, tree
+        for name in path.split("."):
+            _, relationships = _split_schema(current_model, current_schema)
+            if name not in relationships:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Cannot expand '{path}'. Expandable: {', '.join(relationships) or 'nothing'}"
+                )
+            current_model = inspect(current_model).relationships[name].mapper.class_
+            current_schema = relationships[name]
+            node = node.setdefault(name, {})
+    return tree
+
+
+def _freeze(tree):
+    return tuple(sorted((name, _freeze(children)) for name, children in tree.items()))
+
+
+class Fieldset:
+    def __init__(self, model, schema, fields, expand):
+        self.model = model
+        self.schema = schema
+        self.fields = fields  # column names, in schema order
+        self.expand = expand  # frozen tree of relationship names
+        self.response_model = _trimmed_model(model, schema, fields, expand)
+        self._list_adapter = TypeAdapter(list[self.response_model])
+
+    def options(self, only_fields=True):
+        """Loader options: load_only the chosen columns, selectinload every expanded relationship"""
+        return _loader_options(self.model, self.fields if only_fields else None, self.expand)
+
+    def render_batch(self, items, missing):
+        """JSON response for a batch fetch: {"items": [...] in the trimmed schema, "missing": [...]}"""
+        rows = self._list_adapter.dump_python(self._list_adapter.validate_python(items, from_attributes=True), mode="json")
+        return Response(content=dumps({"items": rows, "missing": missing}), media_type="application/json")
+
+    def render(self, content):
+        """JSON response for one ORM object or a list of them, in the trimmed schema"""
+        if isinstance(content, list):
+            body = self._list_adapter.dump_json(self._list_adapter.validate_python(content, from_attributes=True))
+        else:
+            body = self.response_model.model_validate(content, from_attributes=True).model_dump_json().encode()
+        return Response(content=body, media_type="application/json")
+
+
+def _loader_options(model, fields, expand):
+    mapper = inspect(model)
+    options = []
+    if fields is not None:
+        # Primary key, row version and the columns the expanded relationships join on are always needed
+        needed = {column.key for column in mapper.primary_key} | set(fields)
+        if mapper.version_id_col is not None:
+            needed.add(mapper.version_id_col.key)  # for the ETag
+        for name, _ in expand:
+            needed |= {local.key for local, _ in mapper.relationships[name].local_remote_pairs if local.table is mapper.local_table}
+        options.append(load_only(*[getattr(model, name) for name in mapper.columns.keys() if name in needed]))
+    for name, children in expand:
+        loader = selectinload(getattr(model, name))
+        nested = _loader_options(mapper.relationships[name].mapper.class_, None, children)
+        options.append(loader.options(*nested) if nested else loader)
+    return options
+
+
+@lru_cache(maxsize=256)
+def _trimmed_model(model, schema, fields, expand):
+    definitions = {}
+    mapper = inspect(model)
+    _, relationships = _split_schema(model, schema)
+    expanded = dict(expand)
+    for name, field in schema.model_fields.items():
+        if name in fields:
+            definitions[name] = (field.annotation, field)
+        elif name in expanded:
+            nested_model = mapper.relationships[name].mapper.class_
+            nested_schema = relationships[name]
+            nested_columns, _ = _split_schema(nested_model, nested_schema)
+            nested = _trimmed_model(nested_model, nested_schema, tuple(nested_columns), expanded[name])
+            annotation = list[nested] if mapper.relationships[name].uselist else nested
+            definitions[name] = (typing.Optional[annotation], None)
+    return create_model(f"{schema.__name__}Fields", __config__=ConfigDict(from_attributes=True), **definitions)
+
+
+@lru_cache(maxsize=256)
+def _cached_fieldset(model, schema, fields, expand):
+    return Fieldset(model, schema, fields, expand)
+
+
+def parse_fieldset(model, schema, fields=None, expand=None):
+    """Fieldset for the ?fields= / ?expand= query parameters, or None if neither was given"""
+    if fields is None and expand is None:
+        return None
+    columns, _ = _split_schema(model, schema)
+    requested = _names(fields)
+    unknown = [name for name in requested if name not in columns]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(columns)}"
+        )
+    chosen = tuple(name for name in columns if name in requested) if requested else tuple(columns)
+    return _cached_fieldset(model, schema, chosen, _freeze(_expand_tree(model, schema, _names(expand))))
+
+
+@lru_cache(maxsize=None)
+def eager_options(model, schema):
+    """selectinload for every relationship the full schema nests, so the default response has no N+1"""
+    def full_tree(current_model, current_schema):
+        _, relationships = _split_schema(current_model, current_schema)
+        mapper = inspect(current_model)
+        return {
+            name: full_tree(mapper.relationships[name].mapper.class_, nested_schema)
+            for name, nested_schema in relationships.items()
+        }
+    return tuple(_loader_options(model, None, _freeze(full_tree(model, schema))))
@@ -0,0 +1,103 @@
+import threading
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from .config import conf
+
+
+class _Batch:
+    __slots__ = ("rows", "results", "errors", "full", "done")
+
+    def __init__(self):
+        self.rows = []
+        self.results = []
+        self.errors = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """Writes inserts from concurrent requests in one transaction (one fsync)
+
+    The first caller opens a batch and waits up to window_seconds (less if the
+    batch fills up); callers arriving meanwhile join it. The first caller then
+    inserts every row and commits once, and each caller gets back its own row
+    as stored (defaults filled in), from INSERT ... RETURNING where the database
+    supports it. If the batch transaction fails, its rows are retried one
+    per transaction so a bad row only fails its own caller.
+    """
+
+    def __init__(self, window_seconds=0.0, max_batch=100):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._open = {}  # (engine, table) -> _Batch still accepting rows
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    def insert(self, bind, table, values):
+        """Insert one row as part of the current batch; returns {column name: value} as stored"""
+        key = (bind, table)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            index = len(batch.rows)
+            batch.rows.append(values)
+            if len(batch.rows) >= self.max_batch:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._flush(bind, table, batch)
+        else:
+            batch.done.wait()
+
+        error = batch.errors[index]
+        if error is not None:
+            raise error
+        return batch.results[index]
+
+    @staticmethod
+    def _insert(connection, table, row):
+        if connection.dialect.insert_returning:
+            return dict(connection.execute(table.insert().returning(*table.columns), row).one()._mapping)
+        # No RETURNING (MySQL): read the row back in the same transaction
+        primary_key = connection.execute(table.insert(), row).inserted_primary_key
+        return dict(connection.execute(select(table).where(
+            *(column == value for column, value in zip(table.primary_key.columns, primary_key))
+        )).one()._mapping)
+
+    def _flush(self, bind, table, batch):
+        try:
+            try:
+                with bind.begin() as connection:
+                    batch.results = [self._insert(connection, table, row) for row in batch.rows]
+                batch.errors = [None] * len(batch.rows)
+            except SQLAlchemyError:
+                batch.results, batch.errors = [], []
+                for row in batch.rows:
+                    try:
+                        with bind.begin() as connection:
+                            batch.results.append(self._insert(connection, table, row))
+                        batch.errors.append(None)
+                    except SQLAlchemyError as error:
+                        batch.results.append(None)
+                        batch.errors.append(error)
+        finally:
+            # Never leave the other callers waiting, whatever happened
+            missing = len(batch.rows) - len(batch.errors)
+            if missing:
+                batch.results += [None] * missing
+                batch.errors += [RuntimeError("Group commit failed")] * missing
+            batch.done.set()
+
+
+# GROUP_COMMIT_WINDOW_MS=0 (the default) keeps one commit per order
+committer = GroupCommitter(conf.group_commit_window_ms / 1000, conf.group_commit_max_batch)
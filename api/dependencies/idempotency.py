@@ -0,0 +1,190 @@
+"""Idempotency-Key support for POST routes, shared by every worker through the database
+
+A request with a key first claims (route, key) by inserting a row into
+idempotency_keys; only the request whose INSERT succeeds runs the endpoint, so a
+retry that lands on another worker, or arrives after a restart, is replayed
+rather than run twice. The client's address is deliberately not part of the
+scope: a phone retrying over another network must still find its response.
+Keys are meant to be random (UUIDs); a key reused with a different body is
+rejected by the fingerprint check rather than answered with someone else's
+response.
+"""
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from .config import conf
+from ..models.idempotency_keys import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+CLEANUP_INTERVAL_SECONDS = 60
+
+_table = IdempotencyKey.__table__
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class IdempotencyStore:
+    """POST responses by (scope, Idempotency-Key) in the idempotency_keys table
+
+    Only a digest of the request body and the rendered response are kept. While
+    the first request runs, its row holds a claim for lock_seconds; copies of it
+    (on any worker) poll until the response is stored. A claim whose request
+    died is taken over once it runs out, and a claim whose request failed is
+    deleted, so the next retry runs the endpoint again. Expired rows are
+    removed every CLEANUP_INTERVAL_SECONDS.
+
+    bind defaults to the app's primary engine.
+    """
+
+    def __init__(self, ttl_seconds: float, lock_seconds: float = 60, bind=None, poll_seconds: float = 0.05):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.bind = bind
+        self.poll_seconds = poll_seconds
+        self._cleaned_at = 0.0
+
+    def _engine(self):
+        if self.bind is None:
+            from .database import engine
+            return engine
+        return self.bind
+
+    def _claim(self, scope, key, fingerprint, token):
+        """None if this request has to run the endpoint, else the row that already holds the key"""
+        engine = self._engine()
+        while True:
+            now = _utcnow()
+            self._cleanup(engine, now)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(_table).values(
+                        scope=scope, key=key, claim=token, fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=self.lock_seconds)
+                    ))
+                return None
+            except IntegrityError:
+                pass
+            with engine.begin() as connection:
+                row = connection.execute(
+                    select(_table).where(_table.c.scope == scope, _table.c.key == key)
+                ).first()
+                if row is not None and row.expires_at > now:
+                    return row
+                # Gone, expired, or a dead request's claim: remove it (unless someone renewed it) and insert again
+                connection.execute(delete(_table).where(
+                    _table.c.scope == scope, _table.c.key == key, _table.c.expires_at <= now
+                ))
+
+    def _cleanup(self, engine, now):
+        if time.monotonic() - self._cleaned_at < CLEANUP_INTERVAL_SECONDS:
+            return
+        self._cleaned_at = time.monotonic()
+        with engine.begin() as connection:
+            connection.execute(delete(_table).where(_table.c.expires_at <= now))
+
+    def _store(self, scope, key, token, response):
+        headers = [
+            [name.decode("latin-1"), value.decode("latin-1")]
+            for name, value in response.raw_headers if name != b"set-cookie"
+        ]
+        with self._engine().begin() as connection:
+            connection.execute(update(_table).where(
+                _table.c.scope == scope, _table.c.key == key, _table.c.claim == token
+            ).values(
+                status_code=response.status_code, headers=json.dumps(headers), body=response.body,
+                expires_at=_utcnow() + timedelta(seconds=self.ttl_seconds)
+            ))
+
+    def _forget(self, scope, key, token):
+        with self._engine().begin() as connection:
+            connection.execute(delete(_table).where(
+                _table.c.scope == scope, _table.c.key == key, _table.c.claim == token
+            ))
+
+    async def run(self, scope, key, fingerprint, call_endpoint):
+        token = secrets.token_hex(16)
+        while True:
+            row = await run_in_threadpool(self._claim, scope, key, fingerprint, token)
+            if row is None:
+                break
+            if row.fingerprint != fingerprint:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": f"{IDEMPOTENCY_HEADER} was already used with a different request"}
+                )
+            if row.status_code is not None:
+                return self._replay(row)
+            # The first request is still running, here or on another worker
+            await asyncio.sleep(self.poll_seconds)
+
+        try:
+            response = await call_endpoint()
+        except BaseException:
+            await run_in_threadpool(self._forget, scope, key, token)
+            raise
+
+        body = getattr(response, "body", None)
+        if response.status_code < 500 and isinstance(body, bytes):
+            await run_in_threadpool(self._store, scope, key, token, response)
+        else:
+            # Server errors and streamed bodies are not stored; a retry runs the endpoint again
+            await run_in_threadpool(self._forget, scope, key, token)
+        return response
+
+    @staticmethod
+    def _replay(row):
+        response = Response(content=row.body, status_code=row.status_code)
+        response.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.headers)
+        ] + [(REPLAYED_HEADER.lower().encode(), b"true")]
+        return response
+
+    def clear(self):
+        with self._engine().begin() as connection:
+            connection.execute(delete(_table))
+
+
+store = IdempotencyStore(ttl_seconds=conf.idempotency_ttl_seconds, lock_seconds=conf.idempotency_lock_seconds)
+
+
+class IdempotentRoute(APIRoute):
+    """Route class honouring the Idempotency-Key header on POST
+
+        router = APIRouter(prefix="/orders", route_class=IdempotentRoute)
+
+    A retried POST with the same key and body gets the stored response (with an Idempotent-Replayed header) without running the
+    endpoint again.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if request.method != "POST" or key is None:
+                return await handler(request)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return JSONResponse(
+                    status_code=400,
+                    content={"detail": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}
+                )
+
+            # The body is cached on the request, so the endpoint does not read it again
+            fingerprint = hashlib.sha256(await request.body()).hexdigest()
+            scope = f"POST {self.path_format}"[:200]
+            return await store.run(scope, key, fingerprint, lambda: handler(request))
+
+        return idempotent_handler
@@ -0,0 +1,337 @@
+"""In-process background jobs for work that does not have to finish before the response
+
+Controllers commit first, then enqueue by name; a small pool of worker threads
+runs the job with its own session and retries failures with backoff:
+
+    @queue.job("reviews.refresh_rating_summary")
+    def refresh_rating_summary(db, sandwich_id):
+        ...
+
+    db.commit()
+    queue.enqueue("reviews.refresh_rating_summary", sandwich_id=review.sandwich_id)
+
+Arguments must be JSON-serializable so the SQLite backend can store them.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from .config import conf
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+Job = namedtuple("Job", ["id", "name", "kwargs", "attempts"])
+
+
+class MemoryBackend:
+    """Pending jobs in a heap ordered by run time; lost when the process exits"""
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._heap = []  # (run_at, job id, Job)
+        self._ids = itertools.count(1)
+        self._in_progress = 0
+        self._condition = threading.Condition()
+
+    def put(self, name, kwargs):
+        with self._condition:
+            if len(self._heap) >= self.max_size:
+                return False
+            job_id = next(self._ids)
+            heapq.heappush(self._heap, (time.monotonic(), job_id, Job(job_id, name, kwargs, 0)))
+            self._condition.notify()
+            return True
+
+    def get(self, timeout):
+        """Next due job, or None if none came up within timeout seconds (or on wake)"""
+        with self._condition:
+            for attempt in range(2):
+                if self._heap and self._heap[0][0] <= time.monotonic():
+                    self._in_progress += 1
+                    return heapq.heappop(self._heap)[2]
+                if attempt == 0:
+                    wait = timeout if not self._heap else min(timeout, self._heap[0][0] - time.monotonic())
+                    self._condition.wait(wait)
+            return None
+
+    def retry(self, job, delay, error):
+        # Retries may go over max_size: the job was already accepted once
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, job.id, job._replace(attempts=job.attempts + 1)))
+            self._in_progress -= 1
+            self._condition.notify()
+
+    def done(self, job):
+        with self._condition:
+            self._in_progress -= 1
+
+    def fail(self, job, error):
+        self.done(job)
+
+    def depth(self):
+        return len(self._heap)
+
+    def unfinished(self):
+        with self._condition:
+            return len(self._heap) + self._in_progress
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+class SQLiteBackend:
+    """Jobs in a SQLite table, for tests and single-node deployments
+
+    Pending jobs survive a restart. A running job is leased to the process that
+    claimed it (owner, lease_until), which renews the lease from a heartbeat
+    thread; once a lease runs out, because that process died, the job is picked
+    up again by whichever worker, sharing the file, asks next. Finished jobs are
+    deleted; failed ones are kept with their last error for inspection.
+    """
+
+    POLL_SECONDS = 0.5
+
+    def __init__(self, path, max_size=1000, lease_seconds=None, clock=None):
+        self.max_size = max_size
+        self.lease_seconds = conf.jobs_lease_seconds if lease_seconds is None else lease_seconds
+        self._clock = clock or time.time
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, kwargs TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', error TEXT, owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:  # A jobs file from before leases
+                self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at, id)")
+
+    def put(self, name, kwargs):
+        with self._condition:
+            if self._count("'pending'") >= self.max_size:
+                return False
+            self._connection.execute(
+                "INSERT INTO jobs (name, kwargs, run_at) VALUES (?, ?, ?)", (name, json.dumps(kwargs), self._clock())
+            )
+            self._condition.notify()
+            return True
+
+    def get(self, timeout):
+        with self._condition:
+            for attempt in range(2):
+                now = self._clock()
+                # Jobs whose lease ran out (lease_until is NULL for ones left running by a pre-lease version)
+                # were claimed by a worker that is gone: run them again, in their turn
+                row = self._connection.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_until = ? WHERE id = ("
+                    "SELECT id FROM jobs WHERE (status = 'pending' AND run_at <= ?) "
+                    "OR (status = 'running' AND (lease_until IS NULL OR lease_until <= ?)) ORDER BY run_at, id LIMIT 1"
+                    ") RETURNING id, name, kwargs, attempts", (self._owner, now + self.lease_seconds, now, now)
+                ).fetchone()
+                if row is not None:
+                    self._start_heartbeat()
+                    return Job(row[0], row[1], json.loads(row[2]), row[3])
+                if attempt == 0:
+                    # Retries become due without a notify, so poll as well
+                    self._condition.wait(min(timeout, self.POLL_SECONDS))
+            return None
+
+    def heartbeat(self):
+        """Extend the lease on every job this process is running"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (self._clock() + self.lease_seconds, self._owner)
+            )
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._keep_alive, name="job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _keep_alive(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self.heartbeat()
+            except sqlite3.Error:
+                logger.exception("Could not renew the job leases")
+
+    def retry(self, job, delay, error):
+        with self._condition:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'pending', attempts = ?, run_at = ?, error = ? WHERE id = ?",
+                (job.attempts + 1, self._clock() + delay, error, job.id)
+            )
+            self._condition.notify()
+
+    def done(self, job):
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def fail(self, job, error):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'failed', attempts = ?, error = ? WHERE id = ?",
+                (job.attempts + 1, error, job.id)
+            )
+
+    def _count(self, statuses):
+        return self._connection.execute(f"SELECT COUNT(*) FROM jobs WHERE status IN ({statuses})").fetchone()[0]
+
+    def depth(self):
+        with self._lock:
+            return self._count("'pending'")
+
+    def unfinished(self):
+        with self._lock:
+            return self._count("'pending', 'running'")
+
+    def failed(self):
+        """(name, kwargs, attempts, error) of every job that ran out of attempts"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, kwargs, attempts, error FROM jobs WHERE status = 'failed' ORDER BY id"
+            ).fetchall()
+        return [(name, json.loads(kwargs), attempts, error) for name, kwargs, attempts, error in rows]
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+class JobQueue:
+    """Bounded job queue drained by a pool of worker threads
+
+    Each job gets a fresh session from session_factory. A job that raises is
+    retried after retry_delay, 2 * retry_delay, ... up to max_attempts runs in
+    total. When the queue is full, new jobs are dropped (and counted): nothing
+    enqueued here may be needed for correctness.
+    """
+
+    def __init__(self, backend, workers=2, max_attempts=3, retry_delay=1.0, session_factory=SessionLocal):
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.session_factory = session_factory
+        self.handlers = {}
+        self.stats = {"enqueued": 0, "completed": 0, "retried": 0, "failed": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def job(self, name):
+        """Decorator registering fn(db, **kwargs) as the handler for name"""
+        def decorator(handler):
+            self.handlers[name] = handler
+            return handler
+        return decorator
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def enqueue(self, name, **kwargs):
+        """Queue a job to run after this request; returns False if it was dropped"""
+        if name not in self.handlers:
+            raise KeyError(f"No job registered as {name!r}")
+        if not self.backend.put(name, kwargs):
+            self._count("dropped")
+            logger.warning("Job queue full, dropped %s %s", name, kwargs)
+            return False
+        self._count("enqueued")
+        self.start()
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+                for number in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5.0):
+        """Give queued jobs up to timeout seconds to finish, then stop the workers"""
+        self.drain(timeout)
+        self._stopping.set()
+        self.backend.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._threads = []
+
+    def drain(self, timeout=5.0):
+        """Wait until nothing is queued or running; True if that happened within timeout"""
+        deadline = time.monotonic() + timeout
+        while self.backend.unfinished():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self.backend.get(timeout=0.5)
+            if job is not None:
+                self._run(job)
+
+    def _run(self, job):
+        db = self.session_factory()
+        try:
+            self.handlers[job.name](db, **job.kwargs)
+        except Exception as error:
+            db.rollback()
+            message = f"{type(error).__name__}: {error}"
+            if job.attempts + 1 < self.max_attempts:
+                self.backend.retry(job, self.retry_delay * 2 ** job.attempts, message)
+                self._count("retried")
+                logger.warning("Job %s %s failed (attempt %d), retrying: %s", job.name, job.kwargs, job.attempts + 1, message)
+            else:
+                self.backend.fail(job, message)
+                self._count("failed")
+                logger.exception("Job %s %s failed after %d attempts", job.name, job.kwargs, job.attempts + 1)
+        else:
+            self.backend.done(job)
+            self._count("completed")
+        finally:
+            db.close()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, queued=self.backend.depth())
+
+
+def create_backend():
+    if conf.jobs_backend == "sqlite":
+        return SQLiteBackend(conf.jobs_sqlite_path, max_size=conf.jobs_max_queue)
+    return MemoryBackend(max_size=conf.jobs_max_queue)
+
+
+queue = JobQueue(
+    create_backend(),
+    workers=conf.jobs_workers,
+    max_attempts=conf.jobs_max_attempts,
+    retry_delay=conf.jobs_retry_delay_seconds
+)
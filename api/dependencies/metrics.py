@@ -0,0 +1,187 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestStats:
+    """Per-request counters, filled in by the SQLAlchemy hooks below
+
+    statements is None unless something asked for the SQL text as well
+    (QueryCountMiddleware, in debug mode).
+    """
+    __slots__ = ("query_count", "db_seconds", "statements")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statements = None
+
+
+current_request = ContextVar("current_request", default=None)
+# Called with every statement any thread executes, request or not (query_counter.count_queries)
+statement_listeners = []
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "duration_sum", "count", "response_bytes", "query_count", "db_seconds", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.count = 0
+        self.response_bytes = 0
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statuses = {}
+
+
+class Registry:
+    """Metrics for every route template
+
+    Only the middleware writes here, and it always runs on the event loop thread,
+    so plain attribute updates are enough: no locks on the request path.
+    """
+
+    def __init__(self):
+        self.routes = {}  # (method, route template) -> RouteMetrics
+
+    def observe(self, method, route, status_code, seconds, response_bytes, stats):
+        key = (method, route)
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        metrics.duration_sum += seconds
+        metrics.count += 1
+        metrics.response_bytes += response_bytes
+        metrics.query_count += stats.query_count
+        metrics.db_seconds += stats.db_seconds
+        metrics.statuses[status_code] = metrics.statuses.get(status_code, 0) + 1
+
+    def reset(self):
+        self.routes = {}
+
+    def render(self, pool=None, rejections=None, jobs=None):
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP http_requests_total Requests by route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), metrics in routes:
+            for status_code, count in sorted(metrics.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by route template.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), metrics in routes:
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.duration_sum:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {metrics.count}")
+
+        for name, help_text, attribute in (
+            ("http_response_size_bytes_total", "Response body bytes by route template.", "response_bytes"),
+            ("http_request_db_queries_total", "SQL statements executed while serving the route.", "query_count"),
+            ("http_request_db_seconds_total", "Time spent in SQL statements while serving the route.", "db_seconds"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), metrics in routes:
+                value = getattr(metrics, attribute)
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {value}')
+
+        if pool:
+            lines += ["# HELP db_pool_connections Connection pool state for this worker.", "# TYPE db_pool_connections gauge"]
+            for state in ("pool_size", "checked_out", "checked_in", "overflow"):
+                if state in pool:
+                    lines.append(f'db_pool_connections{{state="{state}"}} {pool[state]}')
+
+        if rejections:
+            lines += [
+                "# HELP http_admission_rejections_total Requests rate limited (429) or shed (503) by route class.",
+                "# TYPE http_admission_rejections_total counter",
+            ]
+            for (route_class, status_code), count in sorted(rejections.items()):
+                lines.append(f'http_admission_rejections_total{{class="{route_class}",status="{status_code}"}} {count}')
+
+        if jobs:
+            lines += ["# HELP background_jobs_total Background jobs by outcome.", "# TYPE background_jobs_total counter"]
+            for outcome in ("enqueued", "completed", "retried", "failed", "dropped"):
+                lines.append(f'background_jobs_total{{outcome="{outcome}"}} {jobs[outcome]}')
+            lines += [
+                "# HELP background_jobs_queued Background jobs waiting to run.",
+                "# TYPE background_jobs_queued gauge",
+                f"background_jobs_queued {jobs['queued']}",
+            ]
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and attributing it to its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = scope.get("route")
+            registry.observe(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE),
+                status_code, elapsed, response_bytes, stats
+            )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.db_seconds += time.perf_counter() - getattr(context, "_metrics_started", time.perf_counter())
+        if stats.statements is not None:
+            stats.statements.append(statement)
+    for listener in statement_listeners:
+        listener(statement)
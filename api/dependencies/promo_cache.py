@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy.orm import Session
+from .config import conf
+from ..models import promocodes as model
+
+# Everything validate_promo_code needs except usage counts, which are only
+# trusted from the database at redemption time
+PromoRule = namedtuple("PromoRule", ["code", "discount_amount", "expiration_date", "is_active", "minimum_order_amount"])
+
+
+class PromoRuleCache:
+    """Per-process TTL cache of promo code rules, keyed by upper-case code
+
+    Unknown codes are cached too (as None), so repeated lookups of a bad code
+    don't hit the database either. Writes in this process invalidate entries
+    immediately; other workers pick changes up when the TTL runs out.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000, clock=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._entries = {}  # code -> (expires_at, PromoRule or None)
+
+    def get(self, db: Session, code: str):
+        code = code.upper()
+        now = self._clock()
+        entry = self._entries.get(code)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        row = db.query(
+            model.PromoCode.code,
+            model.PromoCode.discount_amount,
+            model.PromoCode.expiration_date,
+            model.PromoCode.is_active,
+            model.PromoCode.minimum_order_amount
+        ).filter(model.PromoCode.code == code).first()
+
+        rule = None
+        if row:
+            rule = PromoRule(
+                code=row.code,
+                discount_amount=float(row.discount_amount),
+                expiration_date=row.expiration_date,
+                is_active=bool(row.is_active),
+                minimum_order_amount=float(row.minimum_order_amount)
+            )
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop expired entries first; start over if that is not enough
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries = {}
+            self._entries[code] = (now + self.ttl_seconds, rule)
+        return rule
+
+    def invalidate(self, *codes):
+        with self._lock:
+            for code in codes:
+                if code:
+                    self._entries.pop(code.upper(), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = PromoRuleCache(ttl_seconds=conf.promo_cache_ttl_seconds)
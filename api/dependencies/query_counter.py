@@ -0,0 +1,120 @@
+import functools
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from .config import conf
+from .metrics import RequestStats, current_request, statement_listeners
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# "IN (?, ?, ?)", "IN (%s, %s)" and expanding "IN (__[POSTCOMPILE_x])" all have the same shape
+_IN_LIST = re.compile(r"\bIN \((?:[^()]*)\)", re.IGNORECASE)
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def statement_shape(statement: str):
+    """Normalize a SQL statement so the same query with different values compares equal"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _NUMBER.sub("N", shape)
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is active"""
+
+    def __init__(self, statements=None):
+        self.statements = [] if statements is None else statements
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold=2):
+        """Statement shapes run at least `threshold` times: the signature of an N+1"""
+        shapes = Counter(statement_shape(statement) for statement in self.statements)
+        return [(shape, times) for shape, times in shapes.most_common() if times >= threshold]
+
+    def report(self):
+        lines = [f"{self.count} queries:"]
+        lines += [f"  {index}. {_WHITESPACE.sub(' ', statement)}" for index, statement in enumerate(self.statements, start=1)]
+        repeated = self.repeated()
+        if repeated:
+            lines.append("Repeated statement shapes (possible N+1):")
+            lines += [f"  {times}x {shape}" for shape, times in repeated]
+        return "\n".join(lines)
+
+
+@contextmanager
+def count_queries():
+    """Count every statement executed in the block, in any thread"""
+    counter = QueryCounter()
+    listener = counter.statements.append
+    statement_listeners.append(listener)
+    try:
+        yield counter
+    finally:
+        statement_listeners.remove(listener)
+
+
+@contextmanager
+def assert_max_queries(budget: int):
+    """Fail with the list of statements if the block runs more than `budget` queries
+
+        with assert_max_queries(2):
+            client.get("/reviews/low-rated/")
+    """
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        raise AssertionError(f"Query budget of {budget} exceeded. {counter.report()}")
+
+
+def max_queries(budget: int):
+    """Test decorator: the whole test may run at most `budget` queries (fixtures excluded)"""
+    def decorator(test):
+        @functools.wraps(test)
+        def wrapper(*args, **kwargs):
+            with assert_max_queries(budget):
+                return test(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class QueryCountMiddleware:
+    """Debug mode only: X-Query-Count response header and a warning for repeated statements"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not conf.debug:
+            return await self.app(scope, receive, send)
+
+        # The statements come from the metrics hooks, which already count this request's queries
+        stats = current_request.get()
+        token = None
+        if stats is None:  # Not running inside MetricsMiddleware
+            stats = RequestStats()
+            token = current_request.set(stats)
+        stats.statements = []
+        counter = QueryCounter(stats.statements)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-query-count", str(counter.count).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                current_request.reset(token)
+
+        repeated = counter.repeated(threshold=conf.n_plus_one_threshold)
+        if repeated:
+            route = getattr(scope.get("route"), "path", scope["path"])
+            for shape, times in repeated:
+                logger.warning("Possible N+1 on %s %s: %d x %s", scope["method"], route, times, shape)
@@ -0,0 +1,149 @@
+import threading
+import time
+from sqlalchemy.orm import Session
+from .config import conf
+from ..models import recipes as recipe_model
+from ..models import resources as resource_model
+from .jobs import queue
+
+
+class RecipeGraph:
+    """Compiled, in-memory view of every recipe: sandwich -> [(resource_id, amount), ...]
+
+    The graph is loaded with two queries the first time it is used. After that,
+    controllers only mark the sandwiches/resources they changed as dirty, and a
+    background job reloads just those rows (or the next read does, if it comes
+    first). The cache is per process, so each worker keeps its own copy; edits
+    made through another worker only reach this one when the whole graph is
+    reloaded, every ttl_seconds (RECIPE_GRAPH_TTL_SECONDS).
+    """
+
+    def __init__(self, ttl_seconds=None, clock=None):
+        self.ttl_seconds = conf.recipe_graph_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._ingredients = {}  # sandwich_id -> tuple of (resource_id, amount)
+        self._costs = {}  # resource_id -> cost_per_unit (float) or None
+        self._dirty_sandwiches = set()
+        self._dirty_resources = set()
+
+    def invalidate_sandwich(self, sandwich_id: int):
+        """Call after a recipe row for this sandwich was created, updated or deleted"""
+        with self._lock:
+            self._dirty_sandwiches.add(sandwich_id)
+        self._schedule_refresh()
+
+    def invalidate_resource(self, resource_id: int):
+        """Call after a resource's cost changed or the resource was deleted"""
+        with self._lock:
+            self._dirty_resources.add(resource_id)
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        # Nothing to refresh until something has loaded the graph
+        if self._loaded:
+            queue.enqueue("recipe_graph.refresh")
+
+    def reset(self):
+        """Drop everything; the next read reloads the whole graph"""
+        with self._lock:
+            self._loaded = False
+            self._ingredients = {}
+            self._costs = {}
+            self._dirty_sandwiches.clear()
+            self._dirty_resources.clear()
+
+    def _sync(self, db: Session):
+        with self._lock:
+            if not self._loaded or self._clock() - self._loaded_at >= self.ttl_seconds:
+                self._ingredients = self._load_ingredients(db)
+                self._costs = self._load_costs(db)
+                self._dirty_sandwiches.clear()
+                self._dirty_resources.clear()
+                self._loaded = True
+                self._loaded_at = self._clock()
+                return
+
+            if self._dirty_sandwiches:
+                dirty = list(self._dirty_sandwiches)
+                fresh = self._load_ingredients(db, sandwich_ids=dirty)
+                for sandwich_id in dirty:
+                    if sandwich_id in fresh:
+                        self._ingredients[sandwich_id] = fresh[sandwich_id]
+                    else:
+                        self._ingredients.pop(sandwich_id, None)
+                self._dirty_sandwiches.clear()
+
+            if self._dirty_resources:
+                dirty = list(self._dirty_resources)
+                fresh = self._load_costs(db, resource_ids=dirty)
+                for resource_id in dirty:
+                    if resource_id in fresh:
+                        self._costs[resource_id] = fresh[resource_id]
+                    else:
+                        self._costs.pop(resource_id, None)
+                self._dirty_resources.clear()
+
+    @staticmethod
+    def _load_ingredients(db: Session, sandwich_ids=None):
+        query = db.query(
+            recipe_model.Recipe.sandwich_id,
+            recipe_model.Recipe.resource_id,
+            recipe_model.Recipe.amount
+        )
+        if sandwich_ids is not None:
+            query = query.filter(recipe_model.Recipe.sandwich_id.in_(sandwich_ids))
+
+        graph = {}
+        for sandwich_id, resource_id, amount in query.all():
+            graph.setdefault(sandwich_id, []).append((resource_id, amount))
+        return {sandwich_id: tuple(edges) for sandwich_id, edges in graph.items()}
+
+    @staticmethod
+    def _load_costs(db: Session, resource_ids=None):
+        query = db.query(resource_model.Resource.id, resource_model.Resource.cost_per_unit)
+        if resource_ids is not None:
+            query = query.filter(resource_model.Resource.id.in_(resource_ids))
+        return {
+            resource_id: float(cost) if cost is not None else None
+            for resource_id, cost in query.all()
+        }
+
+    def ingredients(self, db: Session, sandwich_id: int):
+        """(resource_id, amount) pairs needed to make one sandwich"""
+        self._sync(db)
+        return self._ingredients.get(sandwich_id, ())
+
+    def ingredient_costs(self, db: Session, sandwich_ids):
+        """Cost to make one of each sandwich, computed in a single pass over the graph
+
+        Returns {sandwich_id: (ingredient_cost, has_unpriced_ingredient)}. Ingredients
+        without a cost_per_unit (or whose resource no longer exists) count as 0.
+        A plain loop on purpose: a menu is a few hundred edges, and copying them
+        into NumPy arrays on every call costs more than the sums save.
+        """
+        self._sync(db)
+        costs = self._costs
+        result = {}
+        for sandwich_id in sandwich_ids:
+            total = 0.0
+            unpriced = False
+            for resource_id, amount in self._ingredients.get(sandwich_id, ()):
+                cost = costs.get(resource_id)
+                if cost is None:
+                    unpriced = True
+                    continue
+                total += cost * amount
+            result[sandwich_id] = (round(total, 2), unpriced)
+        return result
+
+
+graph = RecipeGraph()
+
+
+@queue.job("recipe_graph.refresh")
+def refresh(db: Session):
+    """Background job: reload dirty rows so the next margin report doesn't wait for them"""
+    graph._sync(db)
@@ -0,0 +1,340 @@
+"""In-memory columnar copy of every order line, for ad-hoc sales analytics
+
+    cube.sync(db)                                   # append lines added since the last sync
+    cube.query("hour", start=monday, order_type="delivery")
+    cube.query("category", sandwich_ids=[1, 2, 3])
+
+Each order line is one position in a set of NumPy arrays (timestamp, sandwich,
+quantity, revenue, order type), so a group-by is a masked np.bincount over
+them: milliseconds for millions of lines, and no GROUP BY on the database.
+Syncing reads the lines with an id above the last one seen, plus the skipped
+ids below it (lines that committed late), through whatever session it is given
+(the replica, from the analytics routes). Database reads never hold the lock
+queries take, so a sync or rebuild never holds up another request.
+
+Lines are appended, never edited: changes to existing lines (or deleted ones)
+show up after the next full rebuild, every SALES_CUBE_REBUILD_SECONDS. Given a
+session factory, sync runs that rebuild on a thread of its own and queries
+answer from the old lines until it is swapped in.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from .config import conf
+from ..models import order_details as order_detail_model
+from ..models import orders as order_model
+from ..models import sandwiches as sandwich_model
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # The analytics routes answer 503 without it
+    np = None
+
+GROUP_BYS = ("hour", "weekday", "date", "sandwich", "category", "order_type")
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+SYNC_BATCH_SIZE = 10000
+GAP_QUERY_CHUNK_SIZE = 500
+MAX_GAP_IDS = 1000  # Skipped ids remembered per jump; a bigger jump is a bulk delete, not late commits
+_DAY = 86400
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(value: datetime):
+    # Order dates are naive local times; keep them that way, as seconds since 1970-01-01
+    return int((value - _EPOCH).total_seconds())
+
+
+class _Lines:
+    """One generation of the cube's columns
+
+    Only the thread holding the cube's sync lock appends to it; readers see
+    the first `size` positions, published under the cube's lock.
+    """
+
+    def __init__(self, capacity):
+        self.size = 0
+        self.columns = {
+            "line_id": np.empty(capacity, dtype=np.int64),
+            "timestamp": np.empty(capacity, dtype=np.int64),  # seconds, see _seconds
+            "sandwich_id": np.empty(capacity, dtype=np.int32),
+            "quantity": np.empty(capacity, dtype=np.int32),
+            "revenue": np.empty(capacity, dtype=np.float64),
+            "order_type": np.empty(capacity, dtype=np.int8),  # index into order_types
+        }
+        self.order_types = []
+        self.last_line_id = 0
+        self.gaps = {}  # line id missing below last_line_id -> time it was first missed
+
+
+class SalesCube:
+    def __init__(self, refresh_seconds=5.0, rebuild_seconds=3600.0, gap_seconds=300.0, capacity=1024):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.gap_seconds = gap_seconds
+        self._initial_capacity = capacity
+        self._lock = threading.Lock()  # Publishing and snapshotting, never held during I/O
+        self._sync_lock = threading.Lock()  # One sync or rebuild at a time
+        self._lines = _Lines(capacity)
+        self._sandwiches = {}  # id -> (name, [categories])
+        self._synced_at = None
+        self._built_at = None
+        self._rebuilder = None  # Thread of the periodic rebuild, while it runs
+
+    def __len__(self):
+        return self._lines.size
+
+    def _append(self, lines, rows):
+        start = lines.size
+        end = start + len(rows)
+        columns = lines.columns
+        capacity = len(columns["timestamp"])
+        if end > capacity:
+            # Doubling keeps appends amortized O(1) per line; readers keep the old arrays
+            while capacity < end:
+                capacity *= 2
+            columns = {}
+            for name, column in lines.columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:start] = column[:start]
+                columns[name] = grown
+
+        order_types = list(lines.order_types)
+        codes = []
+        for row in rows:
+            if row.order_type not in order_types:
+                order_types.append(row.order_type)
+            codes.append(order_types.index(row.order_type))
+        # Past `size`, so no reader sees these positions until they are published below
+        columns["line_id"][start:end] = [row.id for row in rows]
+        columns["timestamp"][start:end] = [_seconds(row.order_date) for row in rows]
+        columns["sandwich_id"][start:end] = [row.sandwich_id for row in rows]
+        columns["quantity"][start:end] = [row.amount for row in rows]
+        columns["revenue"][start:end] = [float(row.subtotal) for row in rows]
+        columns["order_type"][start:end] = codes
+        with self._lock:
+            lines.columns, lines.order_types, lines.size = columns, order_types, end
+
+    @staticmethod
+    def _line_query(db: Session):
+        return db.query(
+            order_detail_model.OrderDetail.id,
+            order_detail_model.OrderDetail.sandwich_id,
+            order_detail_model.OrderDetail.amount,
+            order_detail_model.OrderDetail.subtotal,
+            order_model.Order.order_date,
+            order_model.Order.order_type
+        ).join(order_model.Order, order_model.Order.id == order_detail_model.OrderDetail.order_id)
+
+    def _load(self, db: Session, lines, now):
+        """Append the lines of `lines` not loaded yet; returns how many"""
+        appended = 0
+
+        # A line can commit after one with a higher id (concurrent inserts, replica lag),
+        # so ids skipped below the watermark are looked up again for gap_seconds
+        for line_id, missed_at in list(lines.gaps.items()):
+            if now - missed_at >= self.gap_seconds:
+                del lines.gaps[line_id]  # Rolled back or deleted, most likely; the rebuild has the final word
+        pending = sorted(lines.gaps)
+        for start in range(0, len(pending), GAP_QUERY_CHUNK_SIZE):
+            rows = self._line_query(db).filter(
+                order_detail_model.OrderDetail.id.in_(pending[start:start + GAP_QUERY_CHUNK_SIZE])
+            ).all()
+            if rows:
+                self._append(lines, rows)
+                appended += len(rows)
+                for row in rows:
+                    del lines.gaps[row.id]
+
+        while True:
+            rows = self._line_query(db).filter(
+                order_detail_model.OrderDetail.id > lines.last_line_id
+            ).order_by(order_detail_model.OrderDetail.id).limit(SYNC_BATCH_SIZE).all()
+            expected = lines.last_line_id + 1 if lines.last_line_id else None  # Nothing is missing before the first line
+            for row in rows:
+                if expected is not None and row.id > expected:
+                    for missing in range(expected, min(row.id, expected + MAX_GAP_IDS)):
+                        lines.gaps.setdefault(missing, now)
+                expected = row.id + 1
+            if rows:
+                self._append(lines, rows)
+                appended += len(rows)
+                lines.last_line_id = rows[-1].id
+            if len(rows) < SYNC_BATCH_SIZE:
+                return appended
+
+    @staticmethod
+    def _read_sandwiches(db: Session):
+        return {
+            row.id: (row.sandwich_name, [part.strip() for part in (row.category or "").split(",") if part.strip()])
+            for row in db.query(sandwich_model.Sandwich.id, sandwich_model.Sandwich.sandwich_name,
+                                sandwich_model.Sandwich.category)
+        }
+
+    def sync(self, db: Session, force=False, session_factory=None):
+        """Append order lines added since the last sync; rebuild from scratch when due
+
+        Does nothing if the last sync was less than refresh_seconds ago (unless
+        force), or if another request is syncing right now (it answers from what
+        is loaded instead of waiting; only before the first load does it wait).
+        A due rebuild runs on a background thread with a session from
+        session_factory; without one (scripts, tests) it runs here.
+        Returns the number of lines appended.
+        """
+        if not self._sync_lock.acquire(blocking=self._built_at is None):
+            return 0
+        try:
+            now = time.monotonic()
+            if self._built_at is None:
+                return self._rebuild(db)  # Nothing to answer from yet
+            if now - self._built_at >= self.rebuild_seconds:
+                if session_factory is None:
+                    return self._rebuild(db)
+                self._rebuild_in_background(session_factory)
+                return 0
+            if not force and self._synced_at is not None and now - self._synced_at < self.refresh_seconds:
+                return 0
+            appended = self._load(db, self._lines, now)
+            # Names and categories are few and can change, so they are reloaded every sync
+            sandwiches = self._read_sandwiches(db)
+            with self._lock:
+                self._sandwiches = sandwiches
+            self._synced_at = now
+            return appended
+        finally:
+            self._sync_lock.release()
+
+    def _rebuild_in_background(self, session_factory):
+        # Called holding the sync lock, which the thread waits for; syncs meanwhile answer from the old lines
+        if self._rebuilder is not None and self._rebuilder.is_alive():
+            return
+        self._rebuilder = threading.Thread(
+            target=self._run_rebuild, args=(session_factory,), name="sales-cube-rebuild", daemon=True
+        )
+        self._rebuilder.start()
+
+    def _run_rebuild(self, session_factory):
+        db = session_factory()
+        try:
+            self.rebuild(db)
+        except Exception:
+            logger.exception("Sales cube rebuild failed; the next sync tries again")
+        finally:
+            db.close()
+
+    def rebuild(self, db: Session):
+        """Reload every line, to pick up edits and deletions; queries keep answering meanwhile"""
+        with self._sync_lock:
+            return self._rebuild(db)
+
+    def _rebuild(self, db: Session):
+        # Built on the side and swapped in, so queries answer from the old lines until it is done
+        now = time.monotonic()
+        lines = _Lines(self._initial_capacity)
+        loaded = self._load(db, lines, now)
+        sandwiches = self._read_sandwiches(db)
+        with self._lock:
+            self._lines, self._sandwiches = lines, sandwiches
+        self._built_at = self._synced_at = now
+        return loaded
+
+    def _snapshot(self):
+        # Appends only write past size, so views up to it stay valid after the lock is released
+        with self._lock:
+            lines = self._lines
+            return (
+                {name: column[:lines.size] for name, column in lines.columns.items()},
+                lines.order_types,
+                self._sandwiches
+            )
+
+    def query(self, group_by, start=None, end=None, sandwich_ids=None, order_type=None, category=None):
+        """[{"key", "lines", "quantity", "revenue"}] per group, over the lines matching every filter"""
+        if group_by not in GROUP_BYS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BYS)}")
+        columns, order_types, sandwiches = self._snapshot()
+        timestamp = columns["timestamp"]
+
+        mask = np.ones(len(timestamp), dtype=bool)
+        if start is not None:
+            mask &= timestamp >= _seconds(start)
+        if end is not None:
+            mask &= timestamp <= _seconds(end)
+        if sandwich_ids:
+            mask &= np.isin(columns["sandwich_id"], list(sandwich_ids))
+        if order_type is not None:
+            code = order_types.index(order_type) if order_type in order_types else -1
+            mask &= columns["order_type"] == code
+        if category is not None:
+            mask &= np.isin(columns["sandwich_id"], [
+                sandwich_id for sandwich_id, (_, categories) in sandwiches.items() if category in categories
+            ])
+
+        quantity = columns["quantity"][mask]
+        revenue = columns["revenue"][mask]
+        if group_by == "category":
+            return self._by_category(columns["sandwich_id"][mask], quantity, revenue, sandwiches)
+
+        seconds = timestamp[mask]
+        if group_by == "hour":
+            keys, labels = (seconds // 3600) % 24, None
+        elif group_by == "weekday":
+            keys, labels = (seconds // _DAY + 3) % 7, WEEKDAYS  # 1970-01-01 was a Thursday
+        elif group_by == "date":
+            keys, labels = seconds // _DAY, None
+        elif group_by == "sandwich":
+            keys, labels = columns["sandwich_id"][mask], None
+        else:
+            keys, labels = columns["order_type"][mask], order_types
+
+        groups, inverse = np.unique(keys, return_inverse=True)
+        lines = np.bincount(inverse, minlength=len(groups))
+        quantities = np.bincount(inverse, weights=quantity, minlength=len(groups))
+        revenues = np.bincount(inverse, weights=revenue, minlength=len(groups))
+
+        result = []
+        for index, group in enumerate(groups.tolist()):
+            entry = {"key": labels[group] if labels else group}
+            if group_by == "date":
+                entry["key"] = (_EPOCH + timedelta(days=group)).date().isoformat()
+            elif group_by == "sandwich":
+                entry["sandwich_name"] = sandwiches.get(group, (None, []))[0]
+            entry.update(lines=int(lines[index]), quantity=int(quantities[index]), revenue=round(float(revenues[index]), 2))
+            result.append(entry)
+        return result
+
+    @staticmethod
+    def _by_category(sandwich_id, quantity, revenue, sandwiches):
+        # A sandwich can be in several categories, so each category is its own mask
+        by_category = {}
+        for sandwich, (_, categories) in sandwiches.items():
+            for category in categories:
+                by_category.setdefault(category, []).append(sandwich)
+        result = []
+        for category in sorted(by_category):
+            selected = np.isin(sandwich_id, by_category[category])
+            if selected.any():
+                result.append({
+                    "key": category,
+                    "lines": int(selected.sum()),
+                    "quantity": int(quantity[selected].sum()),
+                    "revenue": round(float(revenue[selected].sum()), 2)
+                })
+        return result
+
+    def stats(self):
+        with self._lock:
+            lines = self._lines
+            return {
+                "lines": lines.size,
+                "last_line_id": lines.last_line_id,
+                "bytes": int(sum(column[:lines.size].nbytes for column in lines.columns.values())),
+            }
+
+
+cube = SalesCube(
+    conf.sales_cube_refresh_seconds, conf.sales_cube_rebuild_seconds, conf.sales_cube_gap_seconds
+) if np is not None else None
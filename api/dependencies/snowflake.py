@@ -0,0 +1,262 @@
+"""k-sortable 64-bit ids: 41 bits of milliseconds, 10 bits of node id, 12 bits of sequence
+
+Ids from one generator strictly increase; ids from different nodes never collide
+because every worker process has its own node id (0-1023): NODE_ID if it is set,
+otherwise one leased from the node_leases table when the worker starts. A thread
+renews the lease at half its lifetime and it is released on shutdown; a crashed
+worker's node id is reused once its lease has expired. Generating an id only
+reads the node id held in memory, never the database.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from .config import conf
+
+logger = logging.getLogger(__name__)
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford base32: no I, L, O or U; 13 characters hold 64 bits and sort like the numbers
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ENCODED_LENGTH = 13
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+
+
+def default_node_id():
+    # Only where a process starts looking for a free node id, so workers rarely race for the same one
+    digest = hashlib.blake2b(f"{socket.gethostname()}:{os.getpid()}".encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big") & MAX_NODE_ID
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+class NodeIdLease:
+    """A node id held by this process in the node_leases table
+
+    start() claims it and starts the renewal thread; node_id() then only reads
+    it. If renewals keep failing until the lease runs out, node_id() raises
+    instead of handing out an id another worker may have taken over.
+
+    bind defaults to the app's primary engine (benchmarks point it at theirs).
+    """
+
+    def __init__(self, bind=None, lease_seconds=None, clock=None):
+        self.bind = bind
+        self.lease_seconds = conf.node_lease_seconds if lease_seconds is None else lease_seconds
+        self._clock = clock or time.monotonic
+        self._pid = None
+        self._owner = None
+        self._held = None  # (node id, clock time until which it is ours), replaced as a whole
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def _table(self):
+        from ..models.node_leases import NodeLease
+        return NodeLease.__table__
+
+    def _engine(self):
+        if self.bind is None:
+            from .database import engine
+            return engine
+        return self.bind
+
+    def _expires_at(self):
+        return _utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def start(self):
+        """Claim a node id and keep it renewed; call once per worker process, at startup"""
+        if self._pid == os.getpid() and self._held is not None:
+            return
+        # A forked worker must not keep its parent's lease (or count on its thread)
+        self._pid = os.getpid()
+        self._held = None
+        self._claim()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._keep_renewed, name="node-id-lease", daemon=True)
+        self._thread.start()
+
+    def node_id(self):
+        """This process's node id, from memory"""
+        held = self._held
+        if held is None or self._pid != os.getpid():
+            raise RuntimeError("No node id leased by this worker process")
+        node_id, valid_until = held
+        if self._clock() >= valid_until:
+            raise RuntimeError(f"The lease on node id {node_id} ran out before it could be renewed")
+        return node_id
+
+    def _keep_renewed(self):
+        interval = self.lease_seconds / 2
+        while not self._stop.wait(interval):
+            try:
+                self.renew()
+                interval = self.lease_seconds / 2
+            except Exception:
+                # Retried well before the lease runs out; node_id() refuses once it has
+                logger.exception("Could not renew the node id lease")
+                interval = min(self.lease_seconds / 10, 5)
+
+    def renew(self):
+        """Extend the lease; claim another node id if this one was taken over meanwhile"""
+        if self._held is None:
+            return self._claim()
+        if not self._renew():
+            self._held = None  # Someone else holds it now: stop using it before looking for another
+            return self._claim()
+        return self._held[0]
+
+    def _claim(self):
+        table = self._table
+        engine = self._engine()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"[:100]
+        started = self._clock()
+        now = _utcnow()
+        with engine.connect() as connection:
+            leased = dict(connection.execute(select(table.c.node_id, table.c.expires_at)).all())
+        start = default_node_id()
+        free = [(start + offset) & MAX_NODE_ID for offset in range(MAX_NODE_ID + 1)]
+        free = [node_id for node_id in free if node_id not in leased]
+        expired = sorted((node_id for node_id, expires_at in leased.items() if expires_at <= now), key=leased.get)
+
+        for node_id in free + expired:
+            try:
+                with engine.begin() as connection:
+                    if node_id in leased:
+                        claimed = connection.execute(
+                            update(table).where(table.c.node_id == node_id, table.c.expires_at <= now)
+                            .values(owner=owner, expires_at=self._expires_at())
+                        ).rowcount == 1
+                    else:
+                        connection.execute(insert(table).values(node_id=node_id, owner=owner, expires_at=self._expires_at()))
+                        claimed = True
+            except IntegrityError:
+                claimed = False  # Another worker inserted it first
+            if claimed:
+                self._pid, self._owner = os.getpid(), owner
+                self._held = (node_id, started + self.lease_seconds)
+                return node_id
+        raise RuntimeError(f"All {MAX_NODE_ID + 1} node ids are leased by running workers")
+
+    def _renew(self):
+        table = self._table
+        node_id = self._held[0]
+        started = self._clock()
+        with self._engine().begin() as connection:
+            renewed = connection.execute(
+                update(table).where(table.c.node_id == node_id, table.c.owner == self._owner)
+                .values(expires_at=self._expires_at())
+            ).rowcount == 1
+        if renewed:
+            self._held = (node_id, started + self.lease_seconds)
+        return renewed
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        held = self._held
+        if held is None or self._pid != os.getpid():
+            return
+        self._held = None
+        table = self._table
+        with self._engine().begin() as connection:
+            connection.execute(delete(table).where(table.c.node_id == held[0], table.c.owner == self._owner))
+
+
+class SnowflakeGenerator:
+    def __init__(self, node_id=None, clock=None, lease=None, sleep=None):
+        node_id = conf.node_id if node_id is None else node_id
+        if node_id is not None and not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"node_id must be between 0 and {MAX_NODE_ID}")
+        self._fixed_node_id = node_id  # NODE_ID, tests and single-process tools; otherwise a lease
+        self.lease = lease if lease is not None else NodeIdLease()
+        self._clock = clock or (lambda: time.time_ns() // 1_000_000)
+        self._sleep = sleep or time.sleep
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    @property
+    def node_id(self):
+        if self._fixed_node_id is not None:
+            return self._fixed_node_id
+        return self.lease.node_id()
+
+    def next_id(self):
+        with self._lock:
+            now = self._clock()
+            # A clock that steps back keeps using the last millisecond, so ids never go backwards
+            if now <= self._last_ms:
+                now = self._last_ms
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 ids in one millisecond (or the clock stepped back): sleep until it has passed
+                    now = self._clock()
+                    while now <= self._last_ms:
+                        self._sleep((self._last_ms - now + 1) / 1000)
+                        now = self._clock()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def start(self):
+        if self._fixed_node_id is None:
+            self.lease.start()
+
+    def release(self):
+        if self._fixed_node_id is None:
+            self.lease.release()
+
+
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def decode(text: str) -> int:
+    value = 0
+    for char in text.upper():
+        value = (value << 5) | _DECODE[char]
+    return value
+
+
+def timestamp_ms(value: int) -> int:
+    """Unix time in milliseconds at which the id was generated"""
+    return (value >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
+
+
+generator = SnowflakeGenerator()
+
+
+def tracking_number() -> str:
+    """ORD- plus 13 base32 characters; later orders sort after earlier ones"""
+    return f"ORD-{encode(generator.next_id())}"
+
+
+def claim_node_id():
+    """On startup: lease this worker's node id (unless NODE_ID is set), before any request needs one"""
+    generator.start()
+
+
+def release_node_id():
+    """On shutdown: give this worker's node id back, so it is free before its lease runs out"""
+    generator.release()
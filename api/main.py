@@ -1,12 +1,33 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from api.routers import index as indexRoute
-from api.models import model_loader
 from api.dependencies.config import conf
+from api.dependencies.jobs import queue
+from api.dependencies.snowflake import claim_node_id, release_node_id
+from api.dependencies.admission import AdmissionMiddleware
+from api.dependencies.database import ReadYourWritesMiddleware
+from api.dependencies.metrics import MetricsMiddleware
+from api.dependencies.query_counter import QueryCountMiddleware
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables are created by the migration step (python -m api.models.model_loader),
+    # workers only check that it has run
+    if conf.verify_schema_on_startup:
+        from api.models import model_loader
+        model_loader.verify()
+    claim_node_id()
+    queue.start()
+    yield
+    # Gives queued background jobs a few seconds to finish
+    queue.stop()
+    release_node_id()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -16,11 +37,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Last-Write"],  # Browsers may read them, to send back as If-Match / X-Last-Write
 )
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(AdmissionMiddleware)  # Inside metrics, so rejections are still counted and timed
+app.add_middleware(MetricsMiddleware)
 
-model_loader.index()
 indexRoute.load_routes(app)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=conf.app_host, port=conf.app_port)
\ No newline at end of file
+    uvicorn.run(app, host=conf.app_host, port=conf.app_port)
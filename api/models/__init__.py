@@ -1 +1 @@
-from . import orders, order_details, sandwiches, resources, recipes, reviews, promocodes
\ No newline at end of file
+from . import orders, order_details, sandwiches, resources, recipes, reviews, promocodes, node_leases, idempotency_keys, sandwich_ratings
\ No newline at end of file
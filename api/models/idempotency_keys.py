@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DATETIME, LargeBinary, Text
+from ..dependencies.database import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # "POST /orders/ 203.0.113.7": the route and the client that sent the key
+    scope = Column(String(200), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    claim = Column(String(32), nullable=False)  # Token of the request that ran (or is running) the endpoint
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the request body
+    expires_at = Column(DATETIME, nullable=False, index=True)  # UTC; short while running, the TTL once stored
+
+    # NULL while the first request is still running
+    status_code = Column(Integer, nullable=True)
+    headers = Column(Text, nullable=True)  # JSON [[name, value], ...]
+    body = Column(LargeBinary, nullable=True)
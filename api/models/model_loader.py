@@ -1,11 +1,265 @@
-from . import orders, order_details, recipes, sandwiches, resources, reviews, promocodes
+"""Versioned schema migrations
+
+Run once per deploy, before starting the workers:
+
+    python -m api.models.model_loader
+
+Workers never create tables themselves; on startup they only check that the
+database is at SCHEMA_VERSION (see verify). Every migration is idempotent, so
+databases created by the old create_all-at-import code upgrade cleanly.
+"""
+from datetime import datetime
+from sqlalchemy import (
+    DATETIME, DECIMAL, Boolean, Column, ForeignKey, Index, Integer, MetaData, String, Table, Text, inspect, select,
+    text
+)
+from . import orders, order_details, recipes, sandwiches, resources, reviews, promocodes, node_leases, idempotency_keys, sandwich_ratings
 from ..dependencies.database import engine
 
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", version_metadata,
+    Column("version", Integer, nullable=False)
+)
+
+
+def _create_missing_indexes(connection, *indexes):
+    """Create the indexes not in the database yet (by name; a unique constraint of that name counts too)"""
+    existing = {}
+    for index in indexes:
+        table = index.table.name
+        if table not in existing:
+            inspector = inspect(connection)
+            existing[table] = {found["name"] for found in inspector.get_indexes(table)}
+            existing[table] |= {constraint["name"] for constraint in inspector.get_unique_constraints(table)}
+        if index.name not in existing[table]:
+            index.create(connection)
+
+
+def _frozen(table_name):
+    """A copy of the initial table to declare a migration's indexes on (so migration 1 never creates them)"""
+    return initial_metadata.tables[table_name].to_metadata(MetaData())
+
+
+# The tables as the first release created them. Frozen: later model changes go
+# in their own migrations, so every database goes through the same steps.
+initial_metadata = MetaData()
+Table(
+    "promo_codes", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("code", String(50), unique=True, nullable=False, index=True),
+    Column("discount_amount", DECIMAL(6, 2), nullable=False),
+    Column("expiration_date", DATETIME, nullable=False),
+    Column("is_active", Boolean, nullable=False, server_default='1'),
+    Column("usage_limit", Integer, nullable=False),
+    Column("times_used", Integer, nullable=False, server_default='0'),
+    Column("minimum_order_amount", DECIMAL(8, 2), nullable=False),
+    Column("created_date", DATETIME, nullable=False, server_default=str(datetime.now())),
+    Column("description", String(300), nullable=True)
+)
+Table(
+    "orders", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("customer_name", String(100), nullable=False),
+    Column("phone", String(15), nullable=False),
+    Column("address", String(500)),
+    Column("order_date", DATETIME, nullable=False, server_default=str(datetime.now())),
+    Column("order_type", String(20), nullable=False),
+    Column("status", String(50), nullable=False, server_default="received"),
+    Column("total_amount", DECIMAL(10, 2), nullable=False),
+    Column("tracking_number", String(50), unique=True, nullable=False),
+    Column("payment_status", String(20), nullable=False, server_default="pending"),
+    Column("description", String(300)),
+    Column("promo_code_id", Integer, ForeignKey("promo_codes.id"))
+)
+Table(
+    "sandwiches", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("sandwich_name", String(100), unique=True, nullable=False),
+    Column("description", String(500), nullable=True),
+    Column("price", DECIMAL(6, 2), nullable=False, server_default='0.00'),
+    Column("calories", Integer, nullable=True),
+    Column("category", String(100), nullable=True),
+    Column("is_available", Boolean, nullable=False, server_default='1'),
+    Column("created_date", DATETIME, nullable=False, server_default=str(datetime.now()))
+)
+Table(
+    "resources", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("item", String(100), unique=True, nullable=False),
+    Column("amount", Integer, index=True, nullable=False, server_default='0'),
+    Column("unit", String(20), nullable=False, server_default="piece"),
+    Column("minimum_stock", Integer, nullable=False, server_default='10'),
+    Column("cost_per_unit", DECIMAL(8, 2), nullable=True)
+)
+Table(
+    "order_details", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("sandwich_id", Integer, ForeignKey("sandwiches.id"), nullable=False),
+    Column("amount", Integer, index=True, nullable=False, server_default='1'),
+    Column("unit_price", DECIMAL(6, 2), nullable=False),
+    Column("subtotal", DECIMAL(8, 2), nullable=False),
+    Column("special_instructions", String(300), nullable=True)
+)
+Table(
+    "recipes", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("sandwich_id", Integer, ForeignKey("sandwiches.id"), nullable=False),
+    Column("resource_id", Integer, ForeignKey("resources.id"), nullable=False),
+    Column("amount", Integer, index=True, nullable=False, server_default='1'),
+    Column("unit", String(20), nullable=False, server_default="piece")
+)
+Table(
+    "reviews", initial_metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("sandwich_id", Integer, ForeignKey("sandwiches.id"), nullable=False),
+    Column("customer_name", String(100), nullable=False),
+    Column("rating", Integer, nullable=False),
+    Column("comment", Text, nullable=True),
+    Column("review_date", DATETIME, nullable=False, server_default=str(datetime.now())),
+    Column("staff_response", Text, nullable=True),
+    Column("response_date", DATETIME, nullable=True)
+)
+
+
+def _initial_schema(connection):
+    initial_metadata.create_all(connection)
+
+
+def _review_constraints_and_indexes(connection):
+    # The unique index can't be created over reviews that repeat an (order, sandwich).
+    # They are customer data, so rather than pick one to keep, stop and list them
+    rows = connection.execute(text(
+        "SELECT reviews.order_id, reviews.sandwich_id, reviews.id FROM reviews JOIN "
+        "(SELECT order_id, sandwich_id FROM reviews GROUP BY order_id, sandwich_id HAVING COUNT(*) > 1) AS repeated "
+        "ON reviews.order_id = repeated.order_id AND reviews.sandwich_id = repeated.sandwich_id "
+        "ORDER BY reviews.order_id, reviews.sandwich_id, reviews.id"
+    )).all()
+    if rows:
+        duplicates = {}
+        for order_id, sandwich_id, review_id in rows:
+            duplicates.setdefault((order_id, sandwich_id), []).append(str(review_id))
+        listed = "; ".join(
+            f"order {order_id}, sandwich {sandwich_id}: review ids {', '.join(ids)}"
+            for (order_id, sandwich_id), ids in duplicates.items()
+        )
+        raise RuntimeError(
+            f"Migration 2 adds a unique (order_id, sandwich_id) constraint to reviews, but {len(duplicates)} "
+            f"order/sandwich pairs have several reviews ({listed}). Keep one review of each pair, "
+            f"then run the migration again; nothing was changed."
+        )
+    # As declared when this migration was written; the model may change later, this must not
+    table = _frozen("reviews")
+    _create_missing_indexes(
+        connection,
+        # A unique index rather than a constraint: not every database can add one to an existing table
+        Index("uq_reviews_order_sandwich", table.c.order_id, table.c.sandwich_id, unique=True),
+        Index("ix_reviews_sandwich_rating_date", table.c.sandwich_id, table.c.rating, table.c.review_date),
+        Index("ix_reviews_unanswered_queue", table.c.response_date, table.c.review_date, table.c.id),
+        Index(
+            "ix_reviews_attention_queue", table.c.review_date, table.c.id,
+            sqlite_where=text("rating <= 2 AND response_date IS NULL"),
+            postgresql_where=text("rating <= 2 AND response_date IS NULL")
+        ),
+    )
+
+
+def _order_date_and_order_line_indexes(connection):
+    order_table, order_detail_table = _frozen("orders"), _frozen("order_details")
+    _create_missing_indexes(
+        connection,
+        Index("ix_orders_order_date", order_table.c.order_date),
+        Index("ix_order_details_order_id", order_detail_table.c.order_id),
+    )
+
+
+def _row_version_columns(connection):
+    # Rows that already exist start at version 1, like new ones
+    inspector = inspect(connection)
+    for model in (orders.Order, sandwiches.Sandwich, resources.Resource, promocodes.PromoCode, reviews.Review):
+        table = model.__table__
+        if "version" not in {column["name"] for column in inspector.get_columns(table.name)}:
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _node_leases(connection):
+    node_leases.NodeLease.__table__.create(connection, checkfirst=True)
+
+
+def _idempotency_keys(connection):
+    idempotency_keys.IdempotencyKey.__table__.create(connection, checkfirst=True)
+
+
+def _sandwich_ratings(connection):
+    # Backfilled from the reviews already there; from now on a background job keeps it up to date
+    sandwich_ratings.SandwichRating.__table__.create(connection, checkfirst=True)
+    connection.execute(text(
+        "INSERT INTO sandwich_ratings (sandwich_id, total_reviews, rating_sum, five_star_count, four_star_count, "
+        "three_star_count, two_star_count, one_star_count, updated_at) "
+        "SELECT sandwich_id, COUNT(*), SUM(rating), "
+        "SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END), SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END), SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), CURRENT_TIMESTAMP "
+        "FROM reviews WHERE sandwich_id NOT IN (SELECT sandwich_id FROM sandwich_ratings) GROUP BY sandwich_id"
+    ))
+
+
+# (version, description, migration); append new migrations, never edit old ones
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "review uniqueness, low-rated report and staff queue indexes", _review_constraints_and_indexes),
+    (3, "orders.order_date and order_details.order_id indexes", _order_date_and_order_line_indexes),
+    (4, "row version columns for ETags and conditional updates", _row_version_columns),
+    (5, "node_leases table: a Snowflake node id per worker process", _node_leases),
+    (6, "idempotency_keys table: Idempotency-Key claims shared by every worker", _idempotency_keys),
+    (7, "sandwich_ratings table: rating breakdowns kept by a background job", _sandwich_ratings),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(bind):
+    """Schema version recorded in the database, or 0 if it was never migrated"""
+    with bind.connect() as connection:
+        if not inspect(connection).has_table(schema_version.name):
+            return 0
+        return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def upgrade(bind=engine):
+    """Apply every migration newer than the database's version; returns the new version"""
+    with bind.begin() as connection:
+        version_metadata.create_all(connection)
+        version = connection.execute(select(schema_version.c.version)).scalar()
+        if version is None:
+            connection.execute(schema_version.insert().values(version=0))
+            version = 0
+
+        for migration_version, description, migration in MIGRATIONS:
+            if migration_version > version:
+                migration(connection)
+                connection.execute(schema_version.update().values(version=migration_version))
+                version = migration_version
+
+    return version
+
+
+def verify(bind=engine):
+    """Startup check: one query, raises if the database needs migrating first"""
+    version = current_version(bind)
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {version}, this build needs {SCHEMA_VERSION}. "
+            f"Run `python -m api.models.model_loader` to migrate."
+        )
+    return version
+
+
 def index():
-    orders.Base.metadata.create_all(engine)
-    order_details.Base.metadata.create_all(engine)
-    recipes.Base.metadata.create_all(engine)
-    sandwiches.Base.metadata.create_all(engine)
-    resources.Base.metadata.create_all(engine)
-    reviews.Base.metadata.create_all(engine)          # NEW
-    promocodes.Base.metadata.create_all(engine)       # NEW
\ No newline at end of file
+    """Kept for old callers: create/upgrade the schema"""
+    return upgrade(engine)
+
+
+if __name__ == "__main__":
+    print(f"Database schema is at version {upgrade(engine)}")
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DATETIME
+from ..dependencies.database import Base
+
+
+class NodeLease(Base):
+    __tablename__ = "node_leases"
+
+    # One row per Snowflake node id (0-1023) held by a running worker process
+    node_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(100), nullable=False)  # "host:pid:random", so a restarted pid is a new owner
+    expires_at = Column(DATETIME, nullable=False)  # UTC; renewed by the owner at half its lease time
@@ -8,7 +8,7 @@ class OrderDetail(Base):
     __tablename__ = "order_details"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     sandwich_id = Column(Integer, ForeignKey("sandwiches.id"), nullable=False)
     amount = Column(Integer, index=True, nullable=False, server_default='1')
     unit_price = Column(DECIMAL(6, 2), nullable=False)  # Price at time of order
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME
+from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..dependencies.database import Base
@@ -12,7 +12,7 @@ class Order(Base):
     customer_name = Column(String(100), nullable=False)
     phone = Column(String(15), nullable=False)
     address = Column(String(500))  # For delivery orders
-    order_date = Column(DATETIME, nullable=False, server_default=str(datetime.now()))
+    order_date = Column(DATETIME, nullable=False, index=True, server_default=str(datetime.now()))
     order_type = Column(String(20), nullable=False)  # "takeout" or "delivery"
     status = Column(String(50), nullable=False, server_default="received")  # "received", "preparing", "ready", "completed"
     total_amount = Column(DECIMAL(10, 2), nullable=False)
@@ -20,6 +20,10 @@ class Order(Base):
     payment_status = Column(String(20), nullable=False, server_default="pending")  # "pending", "paid", "failed"
     description = Column(String(300))
 
+    # Row version: bumped by every UPDATE (ORM flushes check it, bulk updates increment it), sent as the ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    __mapper_args__ = {"version_id_col": version}
+
     # Testing
     promo_code_id = Column(Integer, ForeignKey("promo_codes.id"))
     promo_code = relationship("PromoCode", back_populates="orders")
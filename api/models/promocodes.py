@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Boolean, Text
+from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Boolean, Text, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..dependencies.database import Base
@@ -22,5 +22,9 @@ class PromoCode(Base):
     created_date = Column(DATETIME, nullable=False, server_default=str(datetime.now()))
     description = Column(String(300), nullable=True)  # "First time customer discount", "Holiday special"
 
+    # Row version for ETag / If-Match, as on Order
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    __mapper_args__ = {"version_id_col": version}
+
     # Relationships - track which orders used this code
     orders = relationship("Order", back_populates="promo_code")
\ No newline at end of file
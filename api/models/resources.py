@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME
+from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..dependencies.database import Base
@@ -14,4 +14,8 @@ class Resource(Base):
     minimum_stock = Column(Integer, nullable=False, server_default='10')  # Alert threshold
     cost_per_unit = Column(DECIMAL(8, 2), nullable=True)  # Optional: for cost tracking
 
+    # Row version for ETag / If-Match, as on Order
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    __mapper_args__ = {"version_id_col": version}
+
     recipes = relationship("Recipe", back_populates="resource")
\ No newline at end of file
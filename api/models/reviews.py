@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Text
+from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Text, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..dependencies.database import Base
@@ -7,6 +7,20 @@ from .sandwiches import Sandwich
 
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        # One review per sandwich per order, enforced by the database
+        UniqueConstraint("order_id", "sandwich_id", name="uq_reviews_order_sandwich"),
+        # Low-rated dishes report: per-sandwich rating filter and newest-first complaints
+        Index("ix_reviews_sandwich_rating_date", "sandwich_id", "rating", "review_date"),
+        # Staff queues: unanswered reviews (response_date IS NULL) newest-first
+        Index("ix_reviews_unanswered_queue", "response_date", "review_date", "id"),
+        # Low-rated unanswered reviews; partial where the database supports it
+        Index(
+            "ix_reviews_attention_queue", "review_date", "id",
+            sqlite_where=text("rating <= 2 AND response_date IS NULL"),
+            postgresql_where=text("rating <= 2 AND response_date IS NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
@@ -20,6 +34,10 @@ class Review(Base):
     staff_response = Column(Text, nullable=True)  # Restaurant can respond
     response_date = Column(DATETIME, nullable=True)  # When staff responded
 
+    # Row version for ETag / If-Match, as on Order
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    __mapper_args__ = {"version_id_col": version}
+
     # Relationships
     order = relationship("Order", back_populates="reviews")
     sandwich = relationship("Sandwich", back_populates="reviews")
\ No newline at end of file
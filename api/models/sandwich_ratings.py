@@ -0,0 +1,18 @@
+from sqlalchemy import Column, ForeignKey, Integer, DATETIME
+from ..dependencies.database import Base
+
+
+class SandwichRating(Base):
+    __tablename__ = "sandwich_ratings"
+
+    # Per-sandwich rating breakdown, recomputed by a background job after every review write;
+    # a sandwich without reviews has no row
+    sandwich_id = Column(Integer, ForeignKey("sandwiches.id"), primary_key=True, autoincrement=False)
+    total_reviews = Column(Integer, nullable=False)
+    rating_sum = Column(Integer, nullable=False)
+    five_star_count = Column(Integer, nullable=False)
+    four_star_count = Column(Integer, nullable=False)
+    three_star_count = Column(Integer, nullable=False)
+    two_star_count = Column(Integer, nullable=False)
+    one_star_count = Column(Integer, nullable=False)
+    updated_at = Column(DATETIME, nullable=False)
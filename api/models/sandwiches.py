@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Boolean
+from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, DATETIME, Boolean, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..dependencies.database import Base
@@ -17,6 +17,10 @@ class Sandwich(Base):
     is_available = Column(Boolean, nullable=False, server_default='1')  # Available/unavailable
     created_date = Column(DATETIME, nullable=False, server_default=str(datetime.now()))
 
+    # Row version for ETag / If-Match, as on Order
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    __mapper_args__ = {"version_id_col": version}
+
     recipes = relationship("Recipe", back_populates="sandwich")
     order_details = relationship("OrderDetail", back_populates="sandwich")
 
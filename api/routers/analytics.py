@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from ..controllers import analytics as controller
+from ..schemas import analytics as schema
+from ..dependencies.database import get_read_db, get_read_sessions
+
+router = APIRouter(
+    tags=['Analytics'],
+    prefix="/analytics"
+)
+
+
+@router.get("/sales", response_model=schema.SalesReport)
+def get_sales(group_by: str = "sandwich", start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+              sandwich_id: Optional[list[int]] = Query(None), order_type: Optional[str] = None,
+              category: Optional[str] = None, db: Session = Depends(get_read_db),
+              session_factory=Depends(get_read_sessions)):
+    """Staff function: Sales by hour, weekday, date, sandwich, category or order type, from memory"""
+    return controller.get_sales(db, group_by, start_date, end_date, sandwich_id, order_type, category,
+                                session_factory=session_factory)
+
+
+@router.post("/sales/rebuild", response_model=schema.SalesCubeStats)
+def rebuild(db: Session = Depends(get_read_db)):
+    """Staff function: Reload the in-memory sales data, to pick up edited or deleted orders now"""
+    return controller.rebuild(db)
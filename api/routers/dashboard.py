@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from ..controllers import dashboard as controller
+from ..schemas import dashboard as schema
+from ..dependencies.database import get_read_sessions
+
+router = APIRouter(
+    tags=['Dashboard'],
+    prefix="/dashboard"
+)
+
+
+@router.get("/", response_model=schema.Dashboard)
+def get_dashboard(refresh: bool = False, session_factory=Depends(get_read_sessions)):
+    """Staff function: Revenue today, low stock, unanswered reviews, inventory, complaints and best sellers at once"""
+    return controller.get_dashboard(session_factory, refresh=refresh)
@@ -1,10 +1,15 @@
-from . import orders, order_details, promocodes, recipes, resources, reviews, sandwiches
+from . import orders, order_details, promocodes, recipes, resources, reviews, sandwiches, dashboard, analytics, system, metrics
+
 
 def load_routes(app):
     app.include_router(orders.router)
     app.include_router(order_details.router)
-    app.include_router(promocodes.router)      # NEW
-    app.include_router(recipes.router)         # NEW
-    app.include_router(resources.router)       # NEW
-    app.include_router(reviews.router)         # NEW
-    app.include_router(sandwiches.router)      # NEW
\ No newline at end of file
+    app.include_router(promocodes.router)
+    app.include_router(recipes.router)
+    app.include_router(resources.router)
+    app.include_router(reviews.router)
+    app.include_router(sandwiches.router)
+    app.include_router(dashboard.router)
+    app.include_router(analytics.router)
+    app.include_router(system.router)
+    app.include_router(metrics.router)
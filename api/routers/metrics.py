@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..dependencies.admission import admission
+from ..dependencies.database import pool_stats
+from ..dependencies.jobs import queue
+from ..dependencies.metrics import registry
+
+router = APIRouter(
+    tags=['System']
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Ops function: Per-route request counts, latency histograms and DB usage (Prometheus format)"""
+    # async: rendered on the event loop, where the middleware records into the registry, not from the threadpool
+    return PlainTextResponse(registry.render(pool=pool_stats(), rejections=admission.rejected, jobs=queue.metrics()), media_type="text/plain; version=0.0.4")
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, FastAPI, status, Response
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import order_details as controller
 from ..schemas import order_details as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
+from ..dependencies.idempotency import IdempotentRoute
 
 router = APIRouter(
     tags=['Order Details'],
-    prefix="/orderdetails"
+    prefix="/orderdetails",
+    route_class=IdempotentRoute  # Retried POSTs with an Idempotency-Key replay the first response
 )
 
 
@@ -16,12 +21,24 @@ def create(request: schema.OrderDetailCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.OrderDetail])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fast: bool = False, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    # fast=true: same JSON, serialized straight from column tuples (for large lists)
+    # fields=id,amount,subtotal&expand=sandwich: only those columns/relationships are loaded and returned
+    if fast and fields is None and expand is None:
+        return controller.read_all_fast(db)
+    return controller.read_all(db, fields=fields, expand=expand)
+
+@router.get("/batch", response_model=BatchResult[schema.OrderDetail])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
 
 @router.get("/{item_id}", response_model=schema.OrderDetail)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand)
 
 @router.put("/{item_id}", response_model=schema.OrderDetail)
 def update(item_id: int, request: schema.OrderDetailUpdate, db: Session = Depends(get_db)):
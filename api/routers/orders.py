@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, FastAPI, status, Response
+from fastapi import APIRouter, Depends, FastAPI, status, Response, Header
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import orders as controller
 from ..schemas import orders as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
+from ..dependencies.idempotency import IdempotentRoute
 from datetime import datetime
 
 router = APIRouter(
     tags=['Orders'],
-    prefix="/orders"
+    prefix="/orders",
+    route_class=IdempotentRoute  # Retried POSTs with an Idempotency-Key replay the first response
 )
 
 @router.post("/", response_model=schema.Order)
@@ -15,28 +20,54 @@ def create(request: schema.OrderCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.Order])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fast: bool = False, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    # fast=true: same JSON, serialized straight from column tuples (for large lists)
+    # fields=id,status&expand=order_details.sandwich: only those columns/relationships are loaded and returned
+    if fast and fields is None and expand is None:
+        return controller.read_all_fast(db)
+    return controller.read_all(db, fields=fields, expand=expand)
 
 # SPECIFIC ROUTES FIRST (before the generic /{item_id})
 @router.get("/track/{tracking_number}", response_model=schema.Order)
-def track_order(tracking_number: str, db: Session = Depends(get_db)):
-    """Customer function: Track order by tracking number"""
-    return controller.read_by_tracking_number(db, tracking_number=tracking_number)
+def track_order(tracking_number: str, fields: Optional[str] = None, expand: Optional[str] = None,
+                db: Session = Depends(get_read_db)):
+    """Customer function: Track order by tracking number (e.g. ?fields=status for status polls)"""
+    return controller.read_by_tracking_number(db, tracking_number=tracking_number, fields=fields, expand=expand)
 
 @router.get("/date-range/", response_model=list[schema.Order])
-def get_orders_by_date_range(start_date: datetime, end_date: datetime, db: Session = Depends(get_db)):
+def get_orders_by_date_range(start_date: datetime, end_date: datetime, fast: bool = False,
+                             db: Session = Depends(get_read_db)):
     """Staff function: Get orders within specific date range for revenue reporting"""
+    if fast:
+        return controller.get_orders_by_date_range_fast(db, start_date=start_date, end_date=end_date)
     return controller.get_orders_by_date_range(db, start_date=start_date, end_date=end_date)
 
+@router.get("/export")
+def export_orders(start_date: datetime, end_date: datetime, format: str = "ndjson", include_details: bool = False,
+                  db: Session = Depends(get_read_db)):
+    """Staff function: Stream all orders in a date range as NDJSON or CSV (for accounting exports)"""
+    return controller.export_orders(db, start_date=start_date, end_date=end_date, format=format,
+                                    include_details=include_details)
+
+@router.get("/batch", response_model=BatchResult[schema.Order])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
+
 # GENERIC ROUTES LAST
 @router.get("/{item_id}", response_model=schema.Order)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    # ETag: the row version; send it back as If-Match to update only if nobody else has
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand, response=response)
 
 @router.put("/{item_id}", response_model=schema.Order)
-def update(item_id: int, request: schema.OrderUpdate, db: Session = Depends(get_db)):
-    return controller.update(db=db, request=request, item_id=item_id)
+def update(item_id: int, request: schema.OrderUpdate, response: Response, if_match: Optional[str] = Header(None),
+           db: Session = Depends(get_db)):
+    """If-Match: "<ETag>" makes this a no-lock optimistic update: 412 if the row changed since it was read"""
+    return controller.update(db=db, request=request, item_id=item_id, if_match=if_match, response=response)
 
 @router.put("/{item_id}/status", response_model=schema.Order)
 def update_status(item_id: int, new_status: str, db: Session = Depends(get_db)):
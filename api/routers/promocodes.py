@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, FastAPI, status, Response
+from fastapi import APIRouter, Depends, FastAPI, status, Response, Header
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import promocodes as controller
 from ..schemas import promocodes as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
 
 router = APIRouter(
     tags=['Promo Codes'],
@@ -14,16 +17,40 @@ def create(request: schema.PromoCodeCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.PromoCode])
-def read_all(db: Session = Depends(get_db)):
+def read_all(db: Session = Depends(get_read_db)):
     return controller.read_all(db)
 
+# SPECIFIC ROUTES FIRST (before the generic /{item_id})
+@router.post("/bulk", response_model=schema.PromoCodeBulkResult)
+def bulk_generate(request: schema.PromoCodeBulkCreate, db: Session = Depends(get_db)):
+    """Staff function: Generate many unique codes (e.g. single-use campaign codes) at once"""
+    return controller.bulk_generate(db=db, request=request)
+
+@router.post("/validate", response_model=schema.PromoCodeValidationResponse)
+def validate(request: schema.PromoCodeValidation, db: Session = Depends(get_db)):
+    """Customer function: Check whether a promo code applies to the current cart"""
+    return controller.validate_promo_code(db, promo_code=request.code, order_total=request.order_total)
+
+@router.post("/redeem/{code}", response_model=schema.PromoCode)
+def redeem(code: str, db: Session = Depends(get_db)):
+    """System function: Use up one redemption of a promo code at checkout"""
+    return controller.apply_promo_code(db, promo_code=code)
+
+@router.get("/batch", response_model=BatchResult[schema.PromoCode])
+def read_many(ids: list[int] = Depends(batch_ids), db: Session = Depends(get_read_db)):
+    """Staff function: Several promo codes by id (?ids=3,1,2), in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids)
+
+# GENERIC ROUTES LAST
 @router.get("/{item_id}", response_model=schema.PromoCode)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, response: Response, db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, response=response)
 
 @router.put("/{item_id}", response_model=schema.PromoCode)
-def update(item_id: int, request: schema.PromoCodeUpdate, db: Session = Depends(get_db)):
-    return controller.update(db=db, request=request, item_id=item_id)
+def update(item_id: int, request: schema.PromoCodeUpdate, response: Response, if_match: Optional[str] = Header(None),
+           db: Session = Depends(get_db)):
+    """If-Match: "<ETag>" makes this a no-lock optimistic update: 412 if the row changed since it was read"""
+    return controller.update(db=db, request=request, item_id=item_id, if_match=if_match, response=response)
 
 @router.delete("/{item_id}")
 def delete(item_id: int, db: Session = Depends(get_db)):
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, FastAPI, status, Response
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import recipes as controller
 from ..schemas import recipes as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
 
 router = APIRouter(
     tags=['Recipes'],
@@ -14,12 +17,33 @@ def create(request: schema.RecipeCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.Recipe])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fields: Optional[str] = None, expand: Optional[str] = None, db: Session = Depends(get_read_db)):
+    return controller.read_all(db, fields=fields, expand=expand)
 
+# SPECIFIC ROUTES FIRST (before the generic /{item_id})
+@router.get("/margins/", response_model=list[schema.SandwichMargin])
+# Primary on purpose: the recipe graph reloads rows right after writes invalidate them,
+# and a lagging replica would leave stale costs cached until the next invalidation
+def get_margin_report(db: Session = Depends(get_db)):
+    """Staff function: Ingredient cost, price and margin for the whole menu"""
+    return controller.get_margin_report(db)
+
+@router.get("/sandwich/{sandwich_id}/details", response_model=list[schema.RecipeIngredientDetail])
+def get_recipe_with_details(sandwich_id: int, db: Session = Depends(get_read_db)):
+    """Get complete recipe with ingredient names and current stock"""
+    return controller.get_recipe_with_details(db, sandwich_id=sandwich_id)
+
+@router.get("/batch", response_model=BatchResult[schema.Recipe])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
+
+# GENERIC ROUTES LAST
 @router.get("/{item_id}", response_model=schema.Recipe)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand)
 
 @router.put("/{item_id}", response_model=schema.Recipe)
 def update(item_id: int, request: schema.RecipeUpdate, db: Session = Depends(get_db)):
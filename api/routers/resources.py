@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, FastAPI, status, Response
+from fastapi import APIRouter, Depends, FastAPI, status, Response, Header
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import resources as controller
 from ..schemas import resources as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
 
 router = APIRouter(
     tags=['Resources'],
@@ -14,16 +17,25 @@ def create(request: schema.ResourceCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.Resource])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fields: Optional[str] = None, expand: Optional[str] = None, db: Session = Depends(get_read_db)):
+    return controller.read_all(db, fields=fields, expand=expand)
+
+@router.get("/batch", response_model=BatchResult[schema.Resource])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
 
 @router.get("/{item_id}", response_model=schema.Resource)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand, response=response)
 
 @router.put("/{item_id}", response_model=schema.Resource)
-def update(item_id: int, request: schema.ResourceUpdate, db: Session = Depends(get_db)):
-    return controller.update(db=db, request=request, item_id=item_id)
+def update(item_id: int, request: schema.ResourceUpdate, response: Response, if_match: Optional[str] = Header(None),
+           db: Session = Depends(get_db)):
+    """If-Match: "<ETag>" makes this a no-lock optimistic update: 412 if the row changed since it was read"""
+    return controller.update(db=db, request=request, item_id=item_id, if_match=if_match, response=response)
 
 @router.delete("/{item_id}")
 def delete(item_id: int, db: Session = Depends(get_db)):
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, FastAPI, status, Response
+from fastapi import APIRouter, Depends, FastAPI, status, Response, Header, Query
+from typing import Optional
 from sqlalchemy.orm import Session
 from ..controllers import reviews as controller
 from ..schemas import reviews as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
 
 router = APIRouter(
     tags=['Reviews'],
@@ -14,16 +17,59 @@ def create(request: schema.ReviewCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.Review])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fast: bool = False, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    # fast=true: same JSON, serialized straight from column tuples (for large lists)
+    # fields=id,rating,comment&expand=sandwich: only those columns/relationships are loaded and returned
+    if fast and fields is None and expand is None:
+        return controller.read_all_fast(db)
+    return controller.read_all(db, fields=fields, expand=expand)
 
+# SPECIFIC ROUTES FIRST (before the generic /{item_id})
+@router.get("/low-rated/", response_model=list[schema.LowRatedDish])
+def get_low_rated_dishes(max_rating: int = 2, db: Session = Depends(get_read_db)):
+    """Staff function: Dishes averaging max_rating or below, with their latest complaints"""
+    return controller.get_low_rated_dishes(db, max_rating=max_rating)
+
+@router.get("/queues/unanswered", response_model=schema.ReviewQueuePage)
+def get_unanswered_reviews(cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200),
+                           db: Session = Depends(get_read_db)):
+    """Staff function: Reviews without a staff response, newest first"""
+    return controller.get_unanswered_reviews(db, cursor=cursor, limit=limit)
+
+@router.get("/queues/attention", response_model=schema.ReviewQueuePage)
+def get_reviews_needing_attention(cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200),
+                                  db: Session = Depends(get_read_db)):
+    """Staff function: Unanswered reviews rated 2 stars or lower, newest first"""
+    return controller.get_reviews_needing_attention(db, cursor=cursor, limit=limit)
+
+@router.get("/sandwich/{sandwich_id}/summary", response_model=schema.ReviewSummary)
+def get_sandwich_rating_summary(sandwich_id: int, db: Session = Depends(get_read_db)):
+    """Average rating and star counts for one sandwich (updated in the background after each review)"""
+    return controller.get_sandwich_rating_summary(db, sandwich_id=sandwich_id)
+
+@router.get("/batch", response_model=BatchResult[schema.Review])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
+
+# GENERIC ROUTES LAST
 @router.get("/{item_id}", response_model=schema.Review)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand, response=response)
 
 @router.put("/{item_id}", response_model=schema.Review)
-def update(item_id: int, request: schema.ReviewUpdate, db: Session = Depends(get_db)):
-    return controller.update(db=db, request=request, item_id=item_id)
+def update(item_id: int, request: schema.ReviewUpdate, response: Response, if_match: Optional[str] = Header(None),
+           db: Session = Depends(get_db)):
+    """If-Match: "<ETag>" makes this a no-lock optimistic update: 412 if the row changed since it was read"""
+    return controller.update(db=db, request=request, item_id=item_id, if_match=if_match, response=response)
+
+@router.put("/{item_id}/response", response_model=schema.Review)
+def add_staff_response(item_id: int, request: schema.StaffResponseUpdate, db: Session = Depends(get_db)):
+    """Staff function: Respond to a review (removes it from the staff queues)"""
+    return controller.add_staff_response(db, review_id=item_id, staff_response=request.staff_response)
 
 @router.delete("/{item_id}")
 def delete(item_id: int, db: Session = Depends(get_db)):
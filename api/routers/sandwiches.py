@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, FastAPI, status, Response
+from fastapi import APIRouter, Depends, FastAPI, status, Response, Header
 from sqlalchemy.orm import Session
+from typing import Optional
 from ..controllers import sandwiches as controller
 from ..schemas import sandwiches as schema
-from ..dependencies.database import engine, get_db
+from ..schemas.batch import BatchResult
+from ..dependencies.database import engine, get_db, get_read_db
+from ..dependencies.batch import batch_ids
 
 router = APIRouter(
     tags=['Sandwiches'],
@@ -14,16 +17,41 @@ def create(request: schema.SandwichCreate, db: Session = Depends(get_db)):
     return controller.create(db=db, request=request)
 
 @router.get("/", response_model=list[schema.Sandwich])
-def read_all(db: Session = Depends(get_db)):
-    return controller.read_all(db)
+def read_all(fast: bool = False, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    # fast=true: same JSON, serialized straight from column tuples (for large lists)
+    # fields=id,sandwich_name,price: only those columns are loaded and returned (e.g. a compact menu)
+    if fast and fields is None and expand is None:
+        return controller.read_all_fast(db)
+    return controller.read_all(db, fields=fields, expand=expand)
+
+# SPECIFIC ROUTES FIRST (before the generic /{item_id})
+@router.get("/popular/")
+def get_popular_items(limit: int = 10, db: Session = Depends(get_read_db)):
+    """Staff function: Best sellers by quantity ordered"""
+    return controller.get_popular_items(db, limit=limit)
+
+@router.get("/unpopular/")
+def get_unpopular_items(db: Session = Depends(get_read_db)):
+    """Staff function: Rarely ordered items, with a recommendation"""
+    return controller.get_unpopular_items(db)
+
+@router.get("/batch", response_model=BatchResult[schema.Sandwich])
+def read_many(ids: list[int] = Depends(batch_ids), fields: Optional[str] = None, expand: Optional[str] = None,
+              db: Session = Depends(get_read_db)):
+    """Several by id (?ids=3,1,2) in one query, in that order, plus the ids not found"""
+    return controller.read_many(db, ids=ids, fields=fields, expand=expand)
 
 @router.get("/{item_id}", response_model=schema.Sandwich)
-def read_one(item_id: int, db: Session = Depends(get_db)):
-    return controller.read_one(db, item_id=item_id)
+def read_one(item_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None,
+             db: Session = Depends(get_read_db)):
+    return controller.read_one(db, item_id=item_id, fields=fields, expand=expand, response=response)
 
 @router.put("/{item_id}", response_model=schema.Sandwich)
-def update(item_id: int, request: schema.SandwichUpdate, db: Session = Depends(get_db)):
-    return controller.update(db=db, request=request, item_id=item_id)
+def update(item_id: int, request: schema.SandwichUpdate, response: Response, if_match: Optional[str] = Header(None),
+           db: Session = Depends(get_db)):
+    """If-Match: "<ETag>" makes this a no-lock optimistic update: 412 if the row changed since it was read"""
+    return controller.update(db=db, request=request, item_id=item_id, if_match=if_match, response=response)
 
 @router.delete("/{item_id}")
 def delete(item_id: int, db: Session = Depends(get_db)):
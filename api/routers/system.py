@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from ..dependencies.database import pool_stats, replica_engine, sessions
+
+router = APIRouter(
+    tags=['System'],
+    prefix="/system"
+)
+
+
+@router.get("/db-pool")
+def get_pool_stats():
+    """Ops function: Connection pool size and usage for this worker"""
+    stats = pool_stats()
+    if sessions.has_replica:
+        stats["replica"] = pool_stats(replica_engine)
+    return stats
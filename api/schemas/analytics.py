@@ -0,0 +1,22 @@
+from typing import Optional, Union
+from pydantic import BaseModel
+
+
+class SalesGroup(BaseModel):
+    key: Union[int, str]  # hour 0-23, weekday name, ISO date, sandwich id, category or order type
+    sandwich_name: Optional[str] = None  # group_by=sandwich only
+    lines: int
+    quantity: int
+    revenue: float
+
+
+class SalesCubeStats(BaseModel):
+    lines: int  # Order lines held in memory
+    last_line_id: int
+    bytes: int
+
+
+class SalesReport(SalesCubeStats):
+    """Schema for ad-hoc sales breakdowns"""
+    group_by: str
+    groups: list[SalesGroup]
@@ -0,0 +1,9 @@
+from typing import Generic, TypeVar
+from pydantic import BaseModel
+
+Item = TypeVar("Item")
+
+
+class BatchResult(BaseModel, Generic[Item]):
+    items: list[Item]  # In the order the ids were requested
+    missing: list[int]  # Requested ids that don't exist
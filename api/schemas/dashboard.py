@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel
+from .orders import RevenueSummary
+from .reviews import LowRatedDish, ReviewQueuePage
+
+
+class DashboardSections(BaseModel):
+    """Each section is None if it failed; see Dashboard.errors"""
+    todays_revenue: Optional[RevenueSummary] = None
+    low_stock_items: Optional[list[dict[str, Any]]] = None
+    unanswered_reviews: Optional[ReviewQueuePage] = None
+    inventory_summary: Optional[dict[str, Any]] = None
+    low_rated_dishes: Optional[list[LowRatedDish]] = None
+    popular_items: Optional[list[dict[str, Any]]] = None
+
+
+class Dashboard(BaseModel):
+    """Schema for the staff home screen"""
+    generated_at: datetime
+    sections: DashboardSections
+    cached: dict[str, float]  # section -> age in seconds, for sections served from cache
+    errors: dict[str, Any]  # section -> error detail
@@ -36,4 +36,11 @@ class Order(OrderBase):
     order_details: Optional[list[OrderDetail]] = None
 
     class ConfigDict:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class RevenueSummary(BaseModel):
+    """Order count and revenue for a date range"""
+    start_date: datetime
+    end_date: datetime
+    order_count: int
+    revenue: float
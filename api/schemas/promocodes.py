@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class PromoCodeBase(BaseModel):
@@ -36,6 +36,23 @@ class PromoCode(PromoCodeBase):
         from_attributes = True
 
 
+class PromoCodeBulkCreate(BaseModel):
+    """Schema for generating many unique codes with the same rules"""
+    count: int = Field(..., ge=1, le=500000)
+    prefix: str = ""  # e.g. "SUMMER-"
+    length: int = Field(12, ge=6, le=50)  # Total code length, including the prefix
+    discount_amount: float
+    expiration_date: datetime
+    usage_limit: int = 1  # Single-use by default
+    minimum_order_amount: float = 0.0
+    description: Optional[str] = None
+
+
+class PromoCodeBulkResult(BaseModel):
+    created: int
+    codes: list[str]
+
+
 class PromoCodeValidation(BaseModel):
     """Schema for validating promo codes during order placement"""
     code: str
@@ -30,4 +30,23 @@ class Recipe(RecipeBase):
     resource: Optional[Resource] = None
 
     class ConfigDict:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class RecipeIngredientDetail(BaseModel):
+    recipe_id: int
+    amount: int
+    unit: str
+    ingredient_name: str
+    available_stock: int
+
+
+class SandwichMargin(BaseModel):
+    """One row of the menu margin report"""
+    sandwich_id: int
+    sandwich_name: str
+    is_available: bool
+    price: float
+    ingredient_cost: float
+    margin: float
+    margin_percent: Optional[float] = None
+    has_unpriced_ingredients: bool
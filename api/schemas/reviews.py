@@ -49,4 +49,26 @@ class ReviewSummary(BaseModel):
     four_star_count: int
     three_star_count: int
     two_star_count: int
-    one_star_count: int
\ No newline at end of file
+    one_star_count: int
+
+class RecentComplaint(BaseModel):
+    rating: int
+    comment: Optional[str] = None
+    customer: str
+    date: datetime
+
+
+class LowRatedDish(BaseModel):
+    """Schema for the low-rated dishes report"""
+    sandwich_id: int
+    sandwich_name: str
+    average_rating: float
+    total_reviews: int
+    recent_complaints: list[RecentComplaint]
+
+
+class ReviewQueuePage(BaseModel):
+    """One page of a staff review queue; pass next_cursor back to get the next page"""
+    items: list[Review]
+    next_cursor: Optional[str] = None
+
@@ -2,17 +2,27 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from api.dependencies.database import get_db, Base
+from api.dependencies.config import conf
+from api.dependencies.database import get_db, get_read_db, get_read_sessions, Base
+from api.models import model_loader
+from api.dependencies.query_counter import assert_max_queries
+from api.dependencies.jobs import queue
+from api.dependencies import idempotency, snowflake
 from api.main import app
 import os
 
+# The app's own engine is never used in tests (get_db is overridden), so don't check its schema
+conf.verify_schema_on_startup = False
+# Tests run in one process, so a fixed node id is unique; leasing is tested in test_snowflake
+snowflake.generator = snowflake.SnowflakeGenerator(node_id=0)
+
 
 # Create a temporary SQLite database for testing
 @pytest.fixture(scope="session")
 def test_engine():
     # Use SQLite in-memory database for testing
     engine = create_engine("sqlite:///test.db", echo=False)
-    Base.metadata.create_all(engine)
+    model_loader.upgrade(engine)
     yield engine
     # Cleanup
     try:
@@ -35,7 +45,13 @@ def test_db(test_engine):
             session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_read_sessions] = lambda: TestingSessionLocal
+    # Background jobs open their own sessions on the test database too
+    queue.session_factory = TestingSessionLocal
+    idempotency.store.bind = test_engine
     yield session
+    queue.drain()
 
     # Clean up tables after each test - FIXED VERSION
     for table in reversed(Base.metadata.sorted_tables):
@@ -48,4 +64,10 @@ def test_db(test_engine):
 def client(test_db):
     # TestClient with database override
     with TestClient(app) as test_client:
-        yield test_client
\ No newline at end of file
+        yield test_client
+
+
+@pytest.fixture
+def query_budget():
+    # Usage: with query_budget(2): client.get(...) -- fails if more queries run
+    return assert_max_queries
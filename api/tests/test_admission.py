@@ -0,0 +1,87 @@
+import pytest
+from api.dependencies import admission as admission_module
+from api.dependencies.admission import CHECKOUT, KITCHEN, READ, REPORT, WRITE, admission, classify
+from api.dependencies.config import conf
+
+ORDER = {"customer_name": "Lunch Rush", "phone": "555-0160", "order_type": "takeout"}
+
+
+@pytest.fixture
+def admission_control(monkeypatch):
+    monkeypatch.setattr(conf, "admission_control", True)
+    monkeypatch.setattr(admission, "max_in_flight", 4)
+    admission.reset()
+    yield admission
+    admission.reset()
+
+
+@pytest.mark.parametrize("method, path, route_class", [
+    ("POST", "/orders/", CHECKOUT),
+    ("POST", "/orderdetails/", CHECKOUT),
+    ("POST", "/promocodes/redeem/SAVE5", CHECKOUT),
+    ("PUT", "/orders/12/status", KITCHEN),
+    ("GET", "/orders/track/ORD-1234ABCD", READ),
+    ("GET", "/sandwiches/", READ),
+    ("GET", "/orders/export", REPORT),
+    ("GET", "/recipes/margins/", REPORT),
+    ("DELETE", "/sandwiches/3", WRITE),
+    ("GET", "/metrics", None),
+    ("GET", "/system/db-pool", None),
+])
+def test_classify(method, path, route_class):
+    assert classify(method, path) == route_class
+
+
+def test_dashboards_count_by_the_connections_they_hold():
+    assert admission_module.fan_out("/dashboard/") == conf.dashboard_max_connections
+    assert admission_module.fan_out("/orders/") == 1
+
+
+def test_token_bucket_refills_at_the_class_rate():
+    controller = admission_module.AdmissionController()
+    for _ in range(REPORT.burst):
+        assert controller.take_token("client", REPORT, now=100.0) == 0
+    assert controller.take_token("client", REPORT, now=100.0) == pytest.approx(1 / REPORT.rate)
+    assert controller.take_token("client", REPORT, now=100.0 + 1 / REPORT.rate) == 0
+    # Other clients have their own bucket
+    assert controller.take_token("other", REPORT, now=100.0) == 0
+
+
+def test_rate_limited_reads_get_429_but_checkout_goes_through(client, admission_control):
+    # Tokens trickle back in at READ.rate while the loop runs, so go well past the burst
+    responses = [client.get("/sandwiches/") for _ in range(READ.burst * 2)]
+    assert [response.status_code for response in responses[:READ.burst]] == [200] * READ.burst
+    limited = [response for response in responses if response.status_code == 429]
+    assert limited
+    assert int(limited[0].headers["retry-after"]) >= 1
+
+    assert client.post("/orders/", json=ORDER).status_code == 200
+
+
+def test_overload_sheds_reads_and_reports_first(client, admission_control):
+    order = client.post("/orders/", json=ORDER).json()
+    admission_control.in_flight = 3  # 75% of max_in_flight
+
+    shed = client.get(f"/orders/track/{order['tracking_number']}")
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == str(conf.shed_retry_after_seconds)
+    assert client.get("/recipes/margins/").status_code == 503
+
+    # Checkout and kitchen routes are still served, and so are ordinary writes below full load
+    assert client.post("/orders/", json=ORDER).status_code == 200
+    assert client.put(f"/orders/{order['id']}/status", params={"new_status": "preparing"}).status_code == 200
+    assert client.delete(f"/orders/{order['id']}").status_code in (200, 204)
+
+    admission_control.in_flight = 0
+    assert client.get("/sandwiches/").status_code == 200
+
+    metrics = client.get("/metrics").text
+    assert 'http_admission_rejections_total{class="read",status="503"} 1' in metrics
+    assert 'http_admission_rejections_total{class="report",status="503"} 1' in metrics
+
+
+def test_disabled_by_default(client):
+    admission.reset()
+    assert conf.admission_control is False
+    for _ in range(READ.burst + 5):
+        assert client.get("/sandwiches/").status_code == 200
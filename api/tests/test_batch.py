@@ -0,0 +1,55 @@
+from api.dependencies import fast_json
+from api.dependencies.query_counter import count_queries
+
+
+def _create_orders(client, count):
+    return [
+        client.post("/orders/", json={"customer_name": f"Batch {number}", "phone": "555-0600", "order_type": "takeout"}).json()
+        for number in range(count)
+    ]
+
+
+def test_batch_returns_items_in_request_order_and_reports_missing(client):
+    first, second, third = _create_orders(client, 3)
+    ids = [third["id"], 999999, first["id"], third["id"], second["id"]]
+    with count_queries() as counter:
+        response = client.get("/orders/batch", params={"ids": ",".join(map(str, ids))})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [order["id"] for order in body["items"]] == [third["id"], first["id"], second["id"]]
+    assert body["missing"] == [999999]
+    assert body["items"][0] == client.get(f"/orders/{third['id']}").json()
+    assert counter.count == 2  # orders, then their (no) lines in one IN query
+
+
+def test_batch_splits_large_id_lists_into_chunks(client, monkeypatch):
+    monkeypatch.setattr("api.dependencies.batch.IN_CHUNK_SIZE", 2)
+    orders = _create_orders(client, 5)
+    ids = [order["id"] for order in reversed(orders)]
+    with count_queries() as counter:
+        body = client.get("/orders/batch", params={"ids": ",".join(map(str, ids)), "fields": "id"}).json()
+
+    assert body == {"items": [{"id": item_id} for item_id in ids], "missing": []}
+    assert sum("FROM orders" in statement for statement in counter.statements) == 3
+    assert fast_json.IN_CHUNK_SIZE == 500
+
+
+def test_batch_rejects_bad_ids(client, monkeypatch):
+    assert client.get("/sandwiches/batch", params={"ids": "1,two"}).status_code == 400
+    assert client.get("/sandwiches/batch", params={"ids": ","}).status_code == 400
+    monkeypatch.setattr("api.dependencies.batch.conf.batch_max_ids", 2)
+    assert client.get("/sandwiches/batch", params={"ids": "1,2,3"}).status_code == 400
+
+
+def test_batch_on_other_resources(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Batch Sub", "price": 7.0, "category": "classic"}).json()
+    body = client.get("/sandwiches/batch", params={"ids": f"{sandwich['id']},424242", "fields": "sandwich_name"}).json()
+    assert body == {"items": [{"sandwich_name": "Batch Sub"}], "missing": [424242]}
+
+    promo = client.post("/promocodes/", json={
+        "code": "BATCH10", "discount_amount": 10, "expiration_date": "2099-01-01T00:00:00",
+        "usage_limit": 5, "minimum_order_amount": 0
+    }).json()
+    body = client.get("/promocodes/batch", params={"ids": str(promo["id"])}).json()
+    assert [item["code"] for item in body["items"]] == ["BATCH10"] and body["missing"] == []
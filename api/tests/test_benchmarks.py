@@ -0,0 +1,35 @@
+import pytest
+from api.benchmarks import load_test
+from api.benchmarks.seed import seed, sqlite_engine
+from api.dependencies.promo_cache import cache as promo_cache
+from api.dependencies.recipe_graph import graph as recipe_graph
+
+
+@pytest.fixture
+def bench_engine(tmp_path):
+    engine = sqlite_engine(tmp_path / "bench.db")
+    yield engine
+    engine.dispose()
+    # The caches are per process; don't leak the benchmark's data into other tests
+    recipe_graph.reset()
+    promo_cache.clear()
+
+
+def test_load_test_smoke(bench_engine):
+    """Tiny seed + short run: every endpoint in the mix works and is reported"""
+    tracking_numbers = seed(bench_engine, sandwiches=5, resources=10, orders=200)
+    assert len(tracking_numbers) == 200
+
+    report = load_test.run(bench_engine, tracking_numbers, total_requests=200, concurrency=4, warmup=0)
+
+    assert report["total"]["count"] == 200
+    assert report["total"]["errors"] == 0
+    for stats in report["endpoints"].values():
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert load_test.percentile(values, 0.50) == 50
+    assert load_test.percentile(values, 0.99) == 99
+    assert load_test.percentile([], 0.5) is None
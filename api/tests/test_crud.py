@@ -0,0 +1,133 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+from api.controllers import resources as resource_controller
+from api.controllers import sandwiches as sandwich_controller
+from api.models import resources as resource_model
+from api.dependencies.query_counter import count_queries
+
+SANDWICH = {"sandwich_name": "Round Trip Sub", "price": 8.0, "category": "classic"}
+
+
+def _writes(counter):
+    return [statement.split()[0] for statement in counter.statements]
+
+
+def test_each_operation_is_one_statement(client, test_db):
+    with count_queries() as counter:
+        sandwich = client.post("/sandwiches/", json=SANDWICH).json()
+    assert _writes(counter) == ["INSERT"]
+    assert sandwich["created_date"] and sandwich["is_available"] is True  # defaults come back from the INSERT
+
+    with count_queries() as counter:
+        updated = client.put(f"/sandwiches/{sandwich['id']}", json={"price": 8.75})
+    assert _writes(counter) == ["UPDATE"] and updated.json()["price"] == 8.75
+
+    with count_queries() as counter:
+        toggled = sandwich_controller.toggle_availability(test_db, sandwich["id"])
+    assert _writes(counter) == ["UPDATE"] and toggled["sandwich"].is_available is False
+
+    with count_queries() as counter:
+        assert client.delete(f"/sandwiches/{sandwich['id']}").status_code == 204
+    assert _writes(counter) == ["DELETE"]
+
+
+def test_missing_rows_cost_one_statement(client):
+    with count_queries() as counter:
+        assert client.put("/sandwiches/424242", json={"price": 1}).status_code == 404
+        assert client.delete("/sandwiches/424242").status_code == 404
+        assert client.put("/orders/424242/total", params={"total_amount": 1}).json()["detail"] == "Order not found!"
+    assert _writes(counter) == ["UPDATE", "DELETE", "UPDATE"]
+
+
+def test_empty_update_writes_nothing(client):
+    url = f"/sandwiches/{client.post('/sandwiches/', json=SANDWICH).json()['id']}"
+    etag = client.get(url).headers["etag"]
+
+    with count_queries() as counter:
+        unchanged = client.put(url, json={}, headers={"If-Match": etag})
+    assert _writes(counter) == ["SELECT"]
+    assert unchanged.status_code == 200 and unchanged.headers["etag"] == etag
+
+    client.put(url, json={"price": 9})
+    assert client.put(url, json={}, headers={"If-Match": etag}).status_code == 412
+    assert client.put("/sandwiches/424242", json={}).status_code == 404
+
+
+def test_nested_relationships_load_with_one_query_each(client):
+    order = client.post("/orders/", json={"customer_name": "Crud", "phone": "555-0900", "order_type": "takeout"}).json()
+    sandwich = client.post("/sandwiches/", json=SANDWICH).json()
+    line = client.post("/orderdetails/", json={
+        "order_id": order["id"], "sandwich_id": sandwich["id"], "amount": 2, "unit_price": 8.0
+    }).json()
+
+    with count_queries() as counter:
+        updated = client.put(f"/orders/{order['id']}/status", params={"new_status": "preparing"}).json()
+    assert _writes(counter) == ["UPDATE", "SELECT", "SELECT"]  # the order, its lines, their sandwiches
+    assert updated["order_details"][0]["sandwich"]["sandwich_name"] == "Round Trip Sub"
+
+    # Subtotal is recomputed inside the UPDATE from the unchanged unit price
+    with count_queries() as counter:
+        line = client.put(f"/orderdetails/{line['id']}", json={"amount": 3}).json()
+    assert line["subtotal"] == 24.0 and _writes(counter)[0] == "UPDATE"
+
+
+def test_delete_returning_feeds_cache_invalidation(client):
+    promo = client.post("/promocodes/", json={
+        "code": "CRUD5", "discount_amount": 5, "expiration_date": "2099-01-01T00:00:00",
+        "usage_limit": 10, "minimum_order_amount": 0
+    }).json()
+    assert client.post("/promocodes/validate", json={"code": "CRUD5", "order_total": 20}).json()["is_valid"] is True
+
+    with count_queries() as counter:
+        assert client.delete(f"/promocodes/{promo['id']}").status_code == 204
+    assert _writes(counter) == ["DELETE"]
+    assert client.post("/promocodes/validate", json={"code": "CRUD5", "order_total": 20}).json()["is_valid"] is False
+
+
+@pytest.fixture
+def without_returning(test_db, monkeypatch):
+    # What MySQL does: no RETURNING, so writes read the row back (or look it up first)
+    dialect = test_db.get_bind().dialect
+    for flag in ("insert_returning", "update_returning", "delete_returning"):
+        monkeypatch.setattr(dialect, flag, False)
+
+
+def test_without_returning_rows_are_read_once(client, without_returning):
+    with count_queries() as counter:
+        sandwich = client.post("/sandwiches/", json=SANDWICH).json()
+        updated = client.put(f"/sandwiches/{sandwich['id']}", json={"price": 9.5}, headers={"If-Match": '"1"'})
+    assert _writes(counter) == ["INSERT", "SELECT", "UPDATE", "SELECT"]
+    assert updated.json()["price"] == 9.5 and updated.headers["etag"] == '"2"'
+
+    assert client.put(f"/sandwiches/{sandwich['id']}", json={"price": 1}, headers={"If-Match": '"1"'}).status_code == 412
+    assert client.delete(f"/sandwiches/{sandwich['id']}").status_code == 204
+
+
+def test_stock_changes_survive_a_concurrent_update(client, test_engine, test_db):
+    resource = client.post("/resources/", json={"item": "Crud Rolls", "amount": 20, "unit": "rolls", "minimum_stock": 2}).json()
+    other = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)()
+    try:
+        # Both sessions hold the row at version 1 before either writes
+        held = [session.get(resource_model.Resource, resource["id"]) for session in (test_db, other)]
+
+        resource_controller.update_stock(other, resource["id"], 10)
+        consumed = resource_controller.consume_stock(test_db, resource["id"], 4)
+        assert consumed["remaining_stock"] == 6
+        restocked = resource_controller.restock_item(other, resource["id"], 5)
+        assert restocked["new_stock_level"] == 11 and restocked["resource"].version == 4
+        assert held[0].amount == 6  # The guarded UPDATE's RETURNING refreshed what the session held
+    finally:
+        other.close()
+
+
+def test_consume_stock_never_overdraws(client, test_db):
+    resource = client.post("/resources/", json={"item": "Crud Cheese", "amount": 3, "unit": "slices", "minimum_stock": 1}).json()
+    with pytest.raises(HTTPException) as insufficient:
+        resource_controller.consume_stock(test_db, resource["id"], 4)
+    assert insufficient.value.status_code == 400
+    assert insufficient.value.detail == "Insufficient stock! Available: 3, Required: 4"
+    with pytest.raises(HTTPException) as missing:
+        resource_controller.consume_stock(test_db, 424242, 1)
+    assert missing.value.status_code == 404
+    assert client.get(f"/resources/{resource['id']}").json()["amount"] == 3
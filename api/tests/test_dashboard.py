@@ -0,0 +1,133 @@
+import threading
+import time
+import pytest
+from api.controllers.dashboard import dashboard
+from api.dependencies.dashboard import Dashboard, Section
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    dashboard.clear()
+    yield
+    dashboard.clear()
+
+
+def _order_with_total(client, total):
+    order = client.post("/orders/", json={"customer_name": "Dash", "phone": "555-0700", "order_type": "takeout"}).json()
+    client.put(f"/orders/{order['id']}/total", params={"total_amount": total})
+    return order
+
+
+def test_dashboard_combines_every_section(client):
+    _order_with_total(client, 12.5)
+    client.post("/resources/", json={"item": "Dash Bread", "amount": 1, "unit": "loaves", "minimum_stock": 5})
+
+    response = client.get("/dashboard/")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["errors"] == {} and body["cached"] == {}
+    sections = body["sections"]
+    assert sections["todays_revenue"]["order_count"] == 1
+    assert sections["todays_revenue"]["revenue"] == 12.5
+    assert [item["item"] for item in sections["low_stock_items"]] == ["Dash Bread"]
+    assert sections["inventory_summary"]["low_stock_count"] == 1
+    assert sections["unanswered_reviews"] == {"items": [], "next_cursor": None}
+    assert sections["low_rated_dishes"] == [] and sections["popular_items"] == []
+
+
+def test_sections_are_cached_until_refresh(client):
+    _order_with_total(client, 10)
+    assert client.get("/dashboard/").json()["sections"]["todays_revenue"]["revenue"] == 10
+
+    _order_with_total(client, 5)
+    cached = client.get("/dashboard/").json()
+    assert cached["sections"]["todays_revenue"]["revenue"] == 10
+    assert set(cached["cached"]) == {section.name for section in dashboard.sections}
+
+    fresh = client.get("/dashboard/", params={"refresh": True}).json()
+    assert fresh["sections"]["todays_revenue"]["revenue"] == 15 and fresh["cached"] == {}
+
+
+class _Session:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_sections_run_concurrently_on_their_own_sessions():
+    sessions, threads = [], set()
+
+    def factory():
+        sessions.append(_Session())
+        return sessions[-1]
+
+    def slow(db):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.2)
+        return "done"
+
+    board = Dashboard([Section(name, slow, ttl_seconds=60) for name in ("a", "b", "c")])
+    started = time.perf_counter()
+    document = board.render(factory)
+    assert time.perf_counter() - started < 0.5
+    assert document["sections"] == {"a": "done", "b": "done", "c": "done"}
+    assert len(threads) == 3 and len(sessions) == 3 and all(db.closed for db in sessions)
+
+
+def test_each_section_has_its_own_ttl_and_failures_stay_local():
+    calls = []
+
+    def counted(name):
+        def load(db):
+            calls.append(name)
+            return name
+        return load
+
+    def broken(db):
+        raise RuntimeError("replica down")
+
+    board = Dashboard([
+        Section("short", counted("short"), ttl_seconds=0),
+        Section("long", counted("long"), ttl_seconds=60),
+        Section("broken", broken, ttl_seconds=60),
+    ])
+    board.render(_Session)
+    document = board.render(_Session)
+    assert sorted(calls) == ["long", "short", "short"]
+    assert set(document["cached"]) == {"long"}
+    assert document["sections"]["broken"] is None
+    assert document["errors"] == {"broken": "RuntimeError: replica down"}
+
+
+def test_concurrent_requests_share_one_load_per_section_and_the_connection_cap():
+    loads, open_sessions, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    class Counted(_Session):
+        def __init__(self):
+            with lock:
+                open_sessions[0] += 1
+                peak[0] = max(peak[0], open_sessions[0])
+
+        def close(self):
+            with lock:
+                open_sessions[0] -= 1
+
+    def slow(db):
+        loads.append(1)
+        time.sleep(0.1)
+        return "done"
+
+    board = Dashboard([Section(name, slow, ttl_seconds=60) for name in "abcdef"], max_workers=2)
+    documents = []
+    requests = [threading.Thread(target=lambda: documents.append(board.render(Counted))) for _ in range(5)]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+
+    assert len(loads) == 6  # Not 30: the other requests waited for the same loads
+    assert peak[0] == 2
+    assert all(document["sections"] == {name: "done" for name in "abcdef"} for document in documents)
+    assert board._loading == {}
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool, StaticPool
+from api.dependencies.admission import pool_utilization
+from api.dependencies.config import conf
+from api.dependencies.database import create_db_engine, pool_stats
+
+
+@pytest.fixture
+def sqlite_file(tmp_path):
+    return f"sqlite:///{tmp_path / 'pool.db'}"
+
+
+def _pragma(engine, name):
+    with engine.connect() as connection:
+        return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_file_database_gets_a_sized_pool_and_pragmas(sqlite_file, monkeypatch):
+    monkeypatch.setattr(conf, "sqlite_synchronous", "full")
+    engine = create_db_engine(sqlite_file, pool_size=2)
+    try:
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool.size() == 2
+        assert _pragma(engine, "journal_mode") == "wal"
+        assert _pragma(engine, "synchronous") == 2  # FULL
+        assert _pragma(engine, "busy_timeout") == conf.sqlite_busy_timeout_ms
+    finally:
+        engine.dispose()
+
+
+def test_memory_database_shares_one_connection():
+    engine = create_db_engine("sqlite://")
+    try:
+        assert isinstance(engine.pool, StaticPool)
+        assert pool_stats(engine) == {"pool_class": "StaticPool"}
+        assert pool_utilization(engine) == 0.0
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize("setting,value", [
+    ("sqlite_synchronous", "NORMAL; PRAGMA journal_mode=DELETE"),
+    ("sqlite_synchronous", "sometimes"),
+    ("sqlite_busy_timeout_ms", "5000; PRAGMA journal_mode=DELETE"),
+])
+def test_bad_pragma_settings_are_refused(sqlite_file, monkeypatch, setting, value):
+    monkeypatch.setattr(conf, setting, value)
+    with pytest.raises(ValueError):
+        create_db_engine(sqlite_file)
+
+
+def test_pool_stats_and_utilization_count_checked_out_connections(sqlite_file, monkeypatch):
+    monkeypatch.setattr(conf, "db_max_overflow", 2)
+    engine = create_db_engine(sqlite_file, pool_size=2)
+    try:
+        with engine.connect():
+            stats = pool_stats(engine)
+            assert (stats["pool_class"], stats["pool_size"], stats["max_overflow"]) == ("QueuePool", 2, 2)
+            assert stats["checked_out"] == 1
+            assert pool_utilization(engine) == 0.25
+        assert pool_stats(engine)["checked_out"] == 0
+        assert pool_utilization(engine) == 0.0
+    finally:
+        engine.dispose()
@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, inspect, text
+from api.dependencies.query_counter import count_queries
+from api.models import model_loader
+
+
+def _sandwich(client):
+    return client.post("/sandwiches/", json={"sandwich_name": "Versioned Sub", "price": 9.0, "category": "classic"}).json()
+
+
+def test_get_sends_the_row_version_as_etag(client):
+    sandwich = _sandwich(client)
+    assert client.get(f"/sandwiches/{sandwich['id']}").headers["etag"] == '"1"'
+    sparse = client.get(f"/sandwiches/{sandwich['id']}", params={"fields": "price"})
+    assert sparse.json() == {"price": 9.0} and sparse.headers["etag"] == '"1"'
+
+
+def test_if_match_update_is_one_conditional_statement(client):
+    sandwich = _sandwich(client)
+    tag = client.get(f"/sandwiches/{sandwich['id']}").headers["etag"]
+
+    with count_queries() as counter:
+        response = client.put(f"/sandwiches/{sandwich['id']}", json={"price": 9.5}, headers={"If-Match": tag})
+    assert response.status_code == 200
+    assert response.json()["price"] == 9.5 and response.headers["etag"] == '"2"'
+    updates = [statement for statement in counter.statements if statement.startswith("UPDATE")]
+    assert len(updates) == 1 and "WHERE sandwiches.id = ? AND sandwiches.version = ?" in updates[0]
+    assert counter.count == 1  # UPDATE ... RETURNING: no SELECT before or after
+
+
+def test_stale_if_match_is_rejected_without_overwriting(client):
+    sandwich = _sandwich(client)
+    tag = client.get(f"/sandwiches/{sandwich['id']}").headers["etag"]
+    assert client.put(f"/sandwiches/{sandwich['id']}", json={"price": 10}, headers={"If-Match": tag}).status_code == 200
+
+    stale = client.put(f"/sandwiches/{sandwich['id']}", json={"price": 1}, headers={"If-Match": tag})
+    assert stale.status_code == 412
+    assert client.get(f"/sandwiches/{sandwich['id']}").json()["price"] == 10
+    assert client.put(f"/sandwiches/{sandwich['id']}", json={"price": 1}, headers={"If-Match": "*"}).status_code == 200
+
+
+def test_other_writes_move_the_version_too(client):
+    order = client.post("/orders/", json={"customer_name": "Etag", "phone": "555-0800", "order_type": "takeout"}).json()
+    tag = client.get(f"/orders/{order['id']}").headers["etag"]
+    client.put(f"/orders/{order['id']}/status", params={"new_status": "preparing"})
+    assert client.get(f"/orders/{order['id']}").headers["etag"] != tag
+    assert client.put(f"/orders/{order['id']}", json={"status": "ready"}, headers={"If-Match": tag}).status_code == 412
+
+
+def test_missing_row_and_bad_header(client):
+    assert client.put("/reviews/987654", json={"rating": 3}, headers={"If-Match": '"1"'}).status_code == 404
+    assert client.put("/promocodes/987654", json={"usage_limit": 3}).status_code == 404
+    resource = client.post("/resources/", json={"item": "Etag Ham", "amount": 5}).json()
+    assert client.put(f"/resources/{resource['id']}", json={"amount": 4}, headers={"If-Match": "abc"}).status_code == 400
+    assert client.put(f"/resources/{resource['id']}", json={"amount": 4}, headers={"If-Match": 'W/"1"'}).status_code == 412
+
+
+def test_migration_adds_version_to_existing_rows(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for version, _, migration in model_loader.MIGRATIONS[:3]:
+            migration(connection)
+        connection.execute(text("INSERT INTO sandwiches (sandwich_name, price) VALUES ('Old Sub', 5)"))
+    model_loader.upgrade(engine)
+    with engine.connect() as connection:
+        assert "version" in {column["name"] for column in inspect(connection).get_columns("sandwiches")}
+        assert connection.execute(text("SELECT version FROM sandwiches")).scalar() == 1
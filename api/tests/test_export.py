@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+RANGE = {"start_date": "2000-01-01T00:00:00", "end_date": (datetime.now() + timedelta(days=1)).isoformat()}
+
+
+def _seed_orders(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Export Melt", "price": 7.5, "category": "classic"}).json()
+    order = client.post("/orders/", json={"customer_name": "Export", "phone": "555-7777", "order_type": "takeout"}).json()
+    for amount in (1, 3):
+        client.post("/orderdetails/", json={
+            "order_id": order["id"], "sandwich_id": sandwich["id"], "amount": amount, "unit_price": 7.5
+        })
+    client.post("/orders/", json={"customer_name": "No Lines", "phone": "555-8888", "order_type": "takeout"})
+    return order
+
+
+def test_export_ndjson_one_order_per_line(client):
+    order = _seed_orders(client)
+    response = client.get("/orders/export", params={**RANGE, "include_details": "true"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in response.headers["content-disposition"]
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+    assert len(lines) == 2
+    exported = next(line for line in lines if line["id"] == order["id"])
+    assert exported["tracking_number"] == order["tracking_number"]
+    assert [detail["amount"] for detail in exported["order_details"]] == [1, 3]
+    assert next(line for line in lines if line["id"] != order["id"])["order_details"] == []
+
+
+def test_export_csv_one_row_per_order_line(client, query_budget):
+    _seed_orders(client)
+    with query_budget(1):
+        response = client.get("/orders/export", params={**RANGE, "format": "csv", "include_details": "true"})
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3  # two lines for the first order, an empty one for the second
+    assert sorted(row["detail_amount"] for row in rows) == ["", "1", "3"]
+
+
+def test_export_without_details_and_bad_format(client):
+    _seed_orders(client)
+    lines = client.get("/orders/export", params=RANGE).text.splitlines()
+    assert len(lines) == 2
+    assert "order_details" not in json.loads(lines[0])
+    assert client.get("/orders/export", params={**RANGE, "format": "xml"}).status_code == 400
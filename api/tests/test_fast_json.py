@@ -0,0 +1,55 @@
+import pytest
+from datetime import datetime
+from api.dependencies.fast_json import dumps
+
+
+@pytest.fixture
+def order_with_details(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Fast Club", "price": 9.25, "category": "classic"}).json()
+    order = client.post("/orders/", json={"customer_name": "Fast Path", "phone": "555-4444", "order_type": "takeout"}).json()
+    for amount in (1, 2):
+        client.post("/orderdetails/", json={
+            "order_id": order["id"], "sandwich_id": sandwich["id"], "amount": amount, "unit_price": 9.25
+        })
+    client.post("/orders/", json={"customer_name": "No Lines", "phone": "555-5555", "order_type": "takeout"})
+    return order
+
+
+@pytest.fixture
+def reviews(client, order_with_details):
+    # One review with a staff response and one without, so nulls and nested sandwiches are both covered
+    second = client.post("/sandwiches/", json={"sandwich_name": "Fast Melt", "price": 7.5, "category": "classic"}).json()
+    client.post("/orderdetails/", json={
+        "order_id": order_with_details["id"], "sandwich_id": second["id"], "amount": 1, "unit_price": 7.5
+    })
+    lines = client.get(f"/orders/{order_with_details['id']}").json()["order_details"]
+    sandwich_ids = sorted({line["sandwich_id"] for line in lines})
+    answered = client.post("/reviews/", json={
+        "order_id": order_with_details["id"], "sandwich_id": sandwich_ids[0], "rating": 2, "comment": "Soggy"
+    }).json()
+    client.put(f"/reviews/{answered['id']}/response", json={"staff_response": "Sorry about that"})
+    client.post("/reviews/", json={"order_id": order_with_details["id"], "sandwich_id": sandwich_ids[1], "rating": 5})
+
+
+@pytest.mark.parametrize("url", ["/orders/", "/orderdetails/", "/sandwiches/", "/reviews/"])
+def test_fast_path_returns_the_same_json(client, order_with_details, reviews, url):
+    """fast=true must not change the response shape or values"""
+    default = client.get(url)
+    fast = client.get(f"{url}?fast=true")
+    assert fast.status_code == 200
+    assert fast.headers["content-type"] == "application/json"
+    assert fast.json() == default.json()
+    assert fast.json()
+
+
+def test_fast_date_range_returns_the_same_json(client, order_with_details):
+    params = {"start_date": "2000-01-01T00:00:00", "end_date": datetime.now().isoformat()}
+    default = client.get("/orders/date-range/", params=params)
+    fast = client.get("/orders/date-range/", params={**params, "fast": "true"})
+    assert len(fast.json()) == 2
+    assert fast.json() == default.json()
+
+
+def test_dumps_handles_decimals_and_datetimes():
+    from decimal import Decimal
+    assert dumps({"price": Decimal("8.50"), "at": datetime(2024, 1, 2, 3, 4, 5)}) == b'{"price":8.5,"at":"2024-01-02T03:04:05"}'
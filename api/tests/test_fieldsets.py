@@ -0,0 +1,69 @@
+import pytest
+from api.dependencies.query_counter import count_queries
+
+
+@pytest.fixture
+def orders_with_lines(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Sparse Sub", "price": 8.5, "category": "classic"}).json()
+    orders = []
+    for number in range(3):
+        order = client.post("/orders/", json={
+            "customer_name": f"Kitchen {number}", "phone": "555-0500", "order_type": "takeout"
+        }).json()
+        for amount in (1, 2):
+            client.post("/orderdetails/", json={
+                "order_id": order["id"], "sandwich_id": sandwich["id"], "amount": amount, "unit_price": 8.5
+            })
+        orders.append(order)
+    return orders
+
+
+def test_fields_trims_the_response_and_the_select(client, orders_with_lines):
+    with count_queries() as counter:
+        response = client.get("/orders/", params={"fields": "id,status,tracking_number"})
+    assert response.status_code == 200
+    assert [set(order) for order in response.json()] == [{"id", "status", "tracking_number"}] * 3
+
+    select = next(statement for statement in counter.statements if "FROM orders" in statement)
+    assert counter.count == 1
+    assert "customer_name" not in select and "order_details" not in select
+
+
+def test_expand_loads_each_relationship_with_one_query(client, orders_with_lines):
+    default = client.get("/orders/").json()
+    with count_queries() as counter:
+        expanded = client.get("/orders/", params={"fields": "id", "expand": "order_details.sandwich"}).json()
+
+    assert counter.count == 3  # orders, their lines, the lines' sandwiches
+    for full, sparse in zip(default, expanded):
+        assert sparse == {"id": full["id"], "order_details": full["order_details"]}
+
+
+def test_expand_without_nested_relationship_drops_it(client, orders_with_lines):
+    lines = client.get(f"/orders/{orders_with_lines[0]['id']}", params={"expand": "order_details"}).json()["order_details"]
+    assert len(lines) == 2
+    assert all("sandwich" not in line for line in lines)
+
+
+def test_default_response_is_unchanged_and_has_no_n_plus_one(client, orders_with_lines):
+    with count_queries() as counter:
+        orders = client.get("/orders/").json()
+    assert counter.count == 3
+    assert all(len(order["order_details"]) == 2 for order in orders)
+    assert orders[0]["order_details"][0]["sandwich"]["sandwich_name"] == "Sparse Sub"
+
+
+def test_detail_and_tracking_routes(client, orders_with_lines):
+    order = orders_with_lines[0]
+    assert client.get(f"/orders/track/{order['tracking_number']}", params={"fields": "status"}).json() == {"status": "received"}
+    line_id = client.get(f"/orders/{order['id']}", params={"fields": "id", "expand": "order_details"}).json()["order_details"][0]["id"]
+    assert client.get(f"/orderdetails/{line_id}", params={"fields": "amount,subtotal"}).json() == {"amount": 1, "subtotal": 8.5}
+    assert client.get("/sandwiches/", params={"fields": "sandwich_name"}).json() == [{"sandwich_name": "Sparse Sub"}]
+
+
+def test_unknown_fields_and_relationships_are_rejected(client, orders_with_lines):
+    bad_field = client.get("/orders/", params={"fields": "id,secret"})
+    assert bad_field.status_code == 400
+    assert "secret" in bad_field.json()["detail"]
+    assert client.get("/orders/", params={"expand": "order_details.recipes"}).status_code == 400
+    assert client.get("/resources/", params={"expand": "recipes"}).status_code == 400
@@ -0,0 +1,108 @@
+import threading
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from api.benchmarks import group_commit as group_commit_benchmark
+from api.controllers import orders as order_controller
+from api.dependencies.group_commit import GroupCommitter, committer
+from api.models.orders import Order
+from api.schemas.orders import OrderCreate
+
+ORDER = {"customer_name": "Rush Hour", "phone": "555-0301", "order_type": "takeout"}
+
+
+@pytest.fixture
+def group_commit(monkeypatch):
+    monkeypatch.setattr(committer, "window_seconds", 0.05)
+
+
+@pytest.fixture
+def commits(test_engine):
+    seen = []
+    count = lambda connection: seen.append(1)
+    event.listen(test_engine, "commit", count)
+    yield seen
+    event.remove(test_engine, "commit", count)
+
+
+def test_concurrent_orders_share_one_commit(test_db, test_engine, group_commit, commits):
+    Session = sessionmaker(bind=test_engine)
+    results = []
+
+    def place_order(number):
+        db = Session()
+        try:
+            results.append(order_controller.create(db, OrderCreate(**ORDER, description=f"order {number}")))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=place_order, args=(number,)) for number in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(commits) == 1
+    assert len({order.id for order in results}) == 10
+    assert {order.version for order in results} == {1}
+    assert len({order.tracking_number for order in results}) == 10
+    stored = {order.id: order.description for order in test_db.query(Order).all()}
+    assert stored == {order.id: order.description for order in results}
+
+
+def test_group_committed_order_has_the_same_response(client, group_commit):
+    response = client.post("/orders/", json=ORDER)
+    assert response.status_code == 200
+    created = response.json()
+    assert created["order_details"] == []
+    assert client.get(f"/orders/{created['id']}").json() == created
+
+
+def test_group_committed_order_belongs_to_the_request_session(test_db, group_commit):
+    order = order_controller.create(test_db, OrderCreate(**ORDER))
+    assert order in test_db
+    assert order.version == 1 and order.promo_code_id is None
+    # Later changes in the same request go through the session as usual
+    order.status = "preparing"
+    test_db.commit()
+    assert test_db.query(Order.status, Order.version).filter(Order.id == order.id).one() == ("preparing", 2)
+
+
+def test_a_bad_row_only_fails_its_own_caller(test_engine, test_db):
+    table = Order.__table__
+    group = GroupCommitter(window_seconds=0.05)
+    good = {"customer_name": "Good", "phone": "1", "order_type": "takeout", "total_amount": 0,
+            "tracking_number": "ORD-GOOD0001", "status": "received", "payment_status": "pending"}
+    bad = dict(good, tracking_number=None)  # NOT NULL
+    outcomes = {}
+
+    def insert(name, row):
+        try:
+            outcomes[name] = group.insert(test_engine, table, row)
+        except Exception as error:
+            outcomes[name] = error
+
+    threads = [threading.Thread(target=insert, args=args) for args in (("good", good), ("bad", bad))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes["good"]["tracking_number"] == "ORD-GOOD0001" and outcomes["good"]["version"] == 1
+    assert isinstance(outcomes["bad"], Exception)
+    assert [order.tracking_number for order in test_db.query(Order).all()] == ["ORD-GOOD0001"]
+
+
+def test_benchmark_smoke(tmp_path):
+    from api.benchmarks.seed import sqlite_engine
+    from api.models import model_loader
+    engine = sqlite_engine(tmp_path / "intake.db")
+    model_loader.upgrade(engine)
+    try:
+        report = group_commit_benchmark.run(engine, windows=(0, 2), orders=60, concurrency=6)
+    finally:
+        engine.dispose()
+    assert [row["orders"] for row in report] == [60, 60]
+    assert report[0]["commits"] == 60
+    assert report[1]["commits"] < 60
+    assert committer.window_seconds == 0
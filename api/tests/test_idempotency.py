@@ -0,0 +1,146 @@
+import asyncio
+import time
+import httpx
+import pytest
+from datetime import timedelta
+from fastapi.responses import JSONResponse
+from api.controllers import orders as order_controller
+from api.dependencies.config import conf
+from api.dependencies.idempotency import IdempotencyStore, _utcnow, store
+from api.main import app
+from api.models.idempotency_keys import IdempotencyKey
+
+ORDER = {"customer_name": "Retry", "phone": "555-0142", "order_type": "takeout"}
+
+
+@pytest.fixture(autouse=True)
+def empty_store(test_db):
+    store.clear()
+    yield
+    store.clear()
+
+
+@pytest.fixture
+def counted_create(monkeypatch):
+    calls = []
+    original = order_controller.create
+
+    def create(db, request):
+        calls.append(request)
+        time.sleep(0.1)  # Long enough for the duplicates to arrive while it runs
+        return original(db=db, request=request)
+
+    monkeypatch.setattr(order_controller, "create", create)
+    return calls
+
+
+def test_retry_replays_the_stored_response(client, counted_create):
+    first = client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "checkout-1"})
+    retry = client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "checkout-1"})
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(counted_create) == 1
+    assert len(client.get("/orders/").json()) == 1
+
+
+def test_different_keys_and_no_key_run_every_time(client, counted_create):
+    client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "a"})
+    client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "b"})
+    client.post("/orders/", json=ORDER)
+    client.post("/orders/", json=ORDER)
+    assert len(counted_create) == 4
+
+
+def test_key_reused_with_another_body_is_rejected(client):
+    client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "reused"})
+    response = client.post("/orders/", json={**ORDER, "phone": "555-0143"}, headers={"Idempotency-Key": "reused"})
+    assert response.status_code == 422
+
+
+def test_keys_are_scoped_per_route(client):
+    order = client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "same"}).json()
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Retry Melt", "price": 8, "category": "classic"}).json()
+    detail = client.post("/orderdetails/", json={
+        "order_id": order["id"], "sandwich_id": sandwich["id"], "amount": 1, "unit_price": 8
+    }, headers={"Idempotency-Key": "same"})
+    assert detail.status_code == 200
+    assert detail.json()["order_id"] == order["id"]
+
+
+def test_concurrent_duplicates_run_once(client, counted_create):
+    async def send_duplicates():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(
+                async_client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "double-tap"})
+                for _ in range(5)
+            ))
+
+    responses = asyncio.run(send_duplicates())
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["tracking_number"] for response in responses}) == 1
+    assert len(counted_create) == 1
+
+
+def test_retry_from_another_address_is_replayed(client, counted_create, monkeypatch):
+    # e.g. a phone that moved from wifi to mobile data between the attempt and the retry
+    monkeypatch.setattr(conf, "trust_forwarded_for", True)
+    first = client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "k", "X-Forwarded-For": "203.0.113.1"})
+    retry = client.post("/orders/", json=ORDER, headers={"Idempotency-Key": "k", "X-Forwarded-For": "198.51.100.7"})
+
+    assert retry.json() == first.json() and retry.headers["idempotent-replayed"] == "true"
+    assert len(counted_create) == 1
+
+
+async def _respond(calls):
+    calls.append(1)
+    return JSONResponse({"call": len(calls)}, status_code=201)
+
+
+def test_another_worker_replays_the_stored_response(test_engine):
+    calls = []
+    first_worker = IdempotencyStore(ttl_seconds=60, bind=test_engine)
+    second_worker = IdempotencyStore(ttl_seconds=60, bind=test_engine)
+
+    first = asyncio.run(first_worker.run("POST /orders/", "key", "digest", lambda: _respond(calls)))
+    replay = asyncio.run(second_worker.run("POST /orders/", "key", "digest", lambda: _respond(calls)))
+
+    assert calls == [1]
+    assert replay.status_code == first.status_code == 201
+    assert replay.body == first.body and replay.headers["idempotent-replayed"] == "true"
+    assert replay.headers["content-type"] == "application/json"
+
+
+def test_failed_and_abandoned_requests_can_be_retried(test_engine, test_db):
+    calls = []
+    worker = IdempotencyStore(ttl_seconds=60, lock_seconds=60, bind=test_engine)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(worker.run("POST /orders/", "failed", "digest", fail))
+    asyncio.run(worker.run("POST /orders/", "failed", "digest", lambda: _respond(calls)))
+    assert calls == [1]
+
+    # A worker died while running the request: its claim stays until it runs out
+    test_db.execute(IdempotencyKey.__table__.insert().values(
+        scope="POST /orders/", key="abandoned", claim="dead", fingerprint="digest",
+        expires_at=_utcnow() - timedelta(seconds=1)
+    ))
+    test_db.commit()
+    taken_over = asyncio.run(worker.run("POST /orders/", "abandoned", "digest", lambda: _respond(calls)))
+    assert taken_over.status_code == 201 and calls == [1, 1]
+
+
+def test_expired_responses_are_cleaned_up(test_engine, test_db):
+    calls = []
+    worker = IdempotencyStore(ttl_seconds=0, bind=test_engine)
+    asyncio.run(worker.run("POST /orders/", "old", "digest", lambda: _respond(calls)))
+    worker._cleaned_at = 0  # CLEANUP_INTERVAL_SECONDS later
+    asyncio.run(worker.run("POST /orders/", "new", "digest", lambda: _respond(calls)))
+
+    assert [row.key for row in test_db.query(IdempotencyKey.key)] == ["new"]
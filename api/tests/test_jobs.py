@@ -0,0 +1,140 @@
+import logging
+import pytest
+from api.dependencies.jobs import JobQueue, MemoryBackend, SQLiteBackend, queue
+from api.controllers import resources as resource_controller
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_size=3)
+    return SQLiteBackend(str(tmp_path / "jobs.db"), max_size=3)
+
+
+@pytest.fixture
+def job_queue(backend, test_engine):
+    from sqlalchemy.orm import sessionmaker
+    job_queue = JobQueue(backend, workers=2, max_attempts=3, retry_delay=0.01,
+                         session_factory=sessionmaker(bind=test_engine))
+    yield job_queue
+    job_queue.stop(timeout=1)
+
+
+def test_jobs_run_in_the_background(job_queue):
+    seen = []
+    job_queue.job("record")(lambda db, value: seen.append(value))
+
+    assert job_queue.enqueue("record", value=1)
+    assert job_queue.enqueue("record", value=2)
+    assert job_queue.drain()
+    assert sorted(seen) == [1, 2]
+    assert job_queue.metrics() == {"enqueued": 2, "completed": 2, "retried": 0, "failed": 0, "dropped": 0, "queued": 0}
+
+
+def test_failing_jobs_are_retried_then_given_up(job_queue):
+    attempts = []
+
+    @job_queue.job("flaky")
+    def flaky(db, succeed_on):
+        attempts.append(succeed_on)
+        if attempts.count(succeed_on) < succeed_on:
+            raise RuntimeError("not yet")
+
+    job_queue.enqueue("flaky", succeed_on=2)
+    job_queue.enqueue("flaky", succeed_on=5)
+    assert job_queue.drain()
+
+    metrics = job_queue.metrics()
+    assert attempts.count(2) == 2
+    assert attempts.count(5) == 3  # max_attempts
+    assert (metrics["completed"], metrics["failed"], metrics["retried"]) == (1, 1, 3)
+    if isinstance(job_queue.backend, SQLiteBackend):
+        assert job_queue.backend.failed() == [("flaky", {"succeed_on": 5}, 3, "RuntimeError: not yet")]
+
+
+def test_full_queue_drops_new_jobs(job_queue):
+    job_queue.job("noop")(lambda db: None)
+    job_queue.start = lambda: None  # No workers, so nothing leaves the queue
+
+    assert [job_queue.enqueue("noop") for _ in range(4)] == [True, True, True, False]
+    assert job_queue.metrics()["dropped"] == 1
+    assert job_queue.metrics()["queued"] == 3
+
+
+def test_unknown_job_name_is_an_error(job_queue):
+    with pytest.raises(KeyError):
+        job_queue.enqueue("missing")
+
+
+def test_sqlite_jobs_survive_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    now = [1000.0]
+    first = SQLiteBackend(path, lease_seconds=30, clock=lambda: now[0])
+    first.put("record", {"value": 1})
+    first.put("record", {"value": 2})
+    interrupted = first.get(timeout=0)  # Claimed, then the process "dies"
+
+    second = SQLiteBackend(path, lease_seconds=30, clock=lambda: now[0])
+    assert second.unfinished() == 2
+    assert second.get(timeout=0).kwargs == {"value": 2}
+    assert second.get(timeout=0) is None  # Still leased by the first worker
+
+    now[0] += 31  # Nobody renewed it
+    assert second.get(timeout=0).kwargs == interrupted.kwargs == {"value": 1}
+
+
+def test_sqlite_jobs_of_a_live_sibling_are_left_alone(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    now = [1000.0]
+    sibling = SQLiteBackend(path, lease_seconds=30, clock=lambda: now[0])
+    sibling.put("record", {"value": 1})
+    running = sibling.get(timeout=0)
+
+    now[0] += 20
+    sibling.heartbeat()
+    restarted = SQLiteBackend(path, lease_seconds=30, clock=lambda: now[0])
+    now[0] += 20  # Past the first lease, not the renewed one
+    assert restarted.get(timeout=0) is None
+
+    sibling.done(running)
+    assert restarted.unfinished() == 0
+
+
+def test_low_stock_alert_leaves_the_request_path(client, test_db, caplog):
+    resource = client.post("/resources/", json={
+        "item": "Rye Bread", "amount": 10, "unit": "loaves", "minimum_stock": 5
+    }).json()
+
+    with caplog.at_level(logging.WARNING, logger="api.controllers.resources"):
+        result = resource_controller.consume_stock(test_db, resource["id"], 7)
+        assert result["warning"].startswith("LOW STOCK ALERT")
+        assert queue.drain()
+
+    assert "LOW STOCK ALERT: Rye Bread is at 3 loaves (minimum: 5)" in caplog.text
+
+
+def test_rating_breakdown_is_kept_by_a_background_job(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Job Reuben", "price": 9, "category": "classic"}).json()
+    reviews = []
+    for rating in (5, 4):
+        order = client.post("/orders/", json={"customer_name": "Rater", "phone": "555-0801", "order_type": "takeout"}).json()
+        client.post("/orderdetails/", json={"order_id": order["id"], "sandwich_id": sandwich["id"], "amount": 1, "unit_price": 9})
+        reviews.append(client.post("/reviews/", json={
+            "order_id": order["id"], "sandwich_id": sandwich["id"], "rating": rating
+        }).json())
+    assert queue.drain()
+
+    summary = client.get(f"/reviews/sandwich/{sandwich['id']}/summary").json()
+    assert summary["total_reviews"] == 2 and summary["average_rating"] == 4.5
+    assert summary["five_star_count"] == summary["four_star_count"] == 1
+
+    client.put(f"/reviews/{reviews[1]['id']}", json={"rating": 1})
+    client.delete(f"/reviews/{reviews[0]['id']}")
+    assert queue.drain()
+    summary = client.get(f"/reviews/sandwich/{sandwich['id']}/summary").json()
+    assert (summary["total_reviews"], summary["average_rating"], summary["one_star_count"]) == (1, 1.0, 1)
+
+    client.delete(f"/reviews/{reviews[1]['id']}")
+    assert queue.drain()
+    assert client.get(f"/reviews/sandwich/{sandwich['id']}/summary").json()["total_reviews"] == 0
+    assert client.get("/reviews/sandwich/424242/summary").status_code == 404
@@ -0,0 +1,35 @@
+from api.dependencies.metrics import registry
+
+
+def test_metrics_reports_route_templates(client):
+    """Requests are grouped by route template, with latency and query counts"""
+    registry.reset()
+    create_response = client.post("/orders/", json={
+        "customer_name": "Metrics Test",
+        "phone": "555-2222",
+        "order_type": "takeout"
+    })
+    assert create_response.status_code == 200
+    client.get(f"/orders/{create_response.json()['id']}")
+    client.get("/orders/99999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/orders/{item_id}",status="200"} 1' in body
+    assert 'http_requests_total{method="GET",route="/orders/{item_id}",status="404"} 1' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/orders/"} 1' in body
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/orders/",le="+Inf"} 1' in body
+
+
+def test_metrics_counts_db_queries(client):
+    """SQL statements run while serving a request are attributed to its route"""
+    registry.reset()
+    client.get("/orders/")
+
+    metrics = registry.routes[("GET", "/orders/")]
+    assert metrics.count == 1
+    assert metrics.query_count >= 1
+    assert metrics.db_seconds > 0
@@ -0,0 +1,38 @@
+from sqlalchemy import create_engine, inspect
+from api.dependencies.database import Base
+from api.models import model_loader
+
+
+def _schema(bind):
+    inspector = inspect(bind)
+    schema = {}
+    for table in inspector.get_table_names():
+        # A unique constraint can be a table constraint or a unique index, depending on how it was added
+        indexes = {(tuple(index["column_names"]), bool(index["unique"])) for index in inspector.get_indexes(table)}
+        indexes |= {(tuple(constraint["column_names"]), True) for constraint in inspector.get_unique_constraints(table)}
+        schema[table] = ({column["name"] for column in inspector.get_columns(table)}, indexes)
+    return schema
+
+
+def test_migrations_build_the_same_schema_as_the_models(tmp_path):
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    declared = create_engine(f"sqlite:///{tmp_path / 'declared.db'}")
+    try:
+        assert model_loader.upgrade(migrated) == model_loader.SCHEMA_VERSION
+        Base.metadata.create_all(declared)
+        migrated_schema = _schema(migrated)
+        assert migrated_schema.pop(model_loader.schema_version.name)
+        assert migrated_schema == _schema(declared)
+        # Migrating again changes nothing
+        assert model_loader.upgrade(migrated) == model_loader.SCHEMA_VERSION
+    finally:
+        migrated.dispose()
+        declared.dispose()
+
+
+def test_first_migration_creates_only_the_original_tables():
+    assert sorted(model_loader.initial_metadata.tables) == [
+        "order_details", "orders", "promo_codes", "recipes", "resources", "reviews", "sandwiches"
+    ]
+    for table in model_loader.initial_metadata.tables.values():
+        assert "version" not in table.columns
@@ -128,7 +128,7 @@ class TestOrderCreation:
         assert result.payment_status == "pending"
         assert result.total_amount == 0.00
         assert result.tracking_number is not None
-        assert len(result.tracking_number) > 8  # Should have ORD- prefix + UUID
+        assert len(result.tracking_number) > 8  # Should have ORD- prefix + encoded id
 
     @pytest.mark.parametrize("order_type,address", [
         ("delivery", "123 Main St"),
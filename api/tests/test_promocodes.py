@@ -0,0 +1,184 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from api.controllers import promocodes as promo_controller
+from api.dependencies.database import Base
+from api.dependencies.promo_cache import PromoRuleCache, cache
+from api.dependencies.query_counter import count_queries
+from api.models.promocodes import PromoCode
+
+
+@pytest.fixture
+def promo_sessions(tmp_path):
+    """Session factory on a file-backed SQLite database so threads get real, separate connections"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'promo.db'}",
+        poolclass=NullPool,
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def add_promo_code(Session, code="FLASH", usage_limit=10, expires_in=timedelta(days=1), is_active=True):
+    db = Session()
+    db.add(PromoCode(
+        code=code,
+        discount_amount=5.00,
+        expiration_date=datetime.now() + expires_in,
+        is_active=is_active,
+        usage_limit=usage_limit,
+        times_used=0,
+        minimum_order_amount=0.00,
+        created_date=datetime.now()
+    ))
+    db.commit()
+    db.close()
+
+
+def times_used(Session, code="FLASH"):
+    db = Session()
+    try:
+        return db.query(PromoCode).filter(PromoCode.code == code).first().times_used
+    finally:
+        db.close()
+
+
+def test_concurrent_redemptions_never_overshoot_usage_limit(promo_sessions):
+    """Stress test: many concurrent checkouts race for a code with only 10 uses"""
+    add_promo_code(promo_sessions, usage_limit=10)
+
+    def checkout(_):
+        db = promo_sessions()
+        try:
+            return promo_controller.redeem_promo_code(db, "flash")
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(checkout, range(100)))
+
+    assert results.count(True) == 10
+    assert times_used(promo_sessions) == 10
+
+
+@pytest.mark.parametrize("expires_in,is_active", [
+    (timedelta(days=-1), True),   # Expired
+    (timedelta(days=1), False),   # Deactivated
+])
+def test_redeem_rejects_unusable_codes(promo_sessions, expires_in, is_active):
+    """Expired or inactive codes are never redeemed"""
+    add_promo_code(promo_sessions, expires_in=expires_in, is_active=is_active)
+
+    db = promo_sessions()
+    assert promo_controller.redeem_promo_code(db, "FLASH") is False
+    db.close()
+
+    assert times_used(promo_sessions) == 0
+
+
+def test_redeem_unknown_code(promo_sessions):
+    """Unknown codes report failure instead of raising"""
+    db = promo_sessions()
+    assert promo_controller.redeem_promo_code(db, "NOPE") is False
+    db.close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def promo_cache():
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_cached_rules_skip_the_database_until_the_ttl(promo_sessions):
+    add_promo_code(promo_sessions)
+    clock = FakeClock()
+    rules = PromoRuleCache(ttl_seconds=60, clock=clock)
+    db = promo_sessions()
+    try:
+        with count_queries() as counter:
+            assert rules.get(db, "flash").discount_amount == 5.0
+            assert rules.get(db, "FLASH").discount_amount == 5.0
+            assert rules.get(db, "NOPE") is None
+            assert rules.get(db, "nope") is None
+        assert counter.count == 2  # One per code, unknown ones included
+
+        db.query(PromoCode).update({"discount_amount": 7})
+        db.commit()
+        clock.now += 59
+        assert rules.get(db, "FLASH").discount_amount == 5.0
+        clock.now += 1
+        assert rules.get(db, "FLASH").discount_amount == 7.0
+    finally:
+        db.close()
+
+
+def validate(client, code="SAVE5", order_total=20):
+    return client.post("/promocodes/validate", json={"code": code, "order_total": order_total}).json()
+
+
+def test_writes_invalidate_the_cached_rule(client, test_db, promo_cache):
+    promo = client.post("/promocodes/", json={
+        "code": "save5", "discount_amount": 5, "expiration_date": (datetime.now() + timedelta(days=1)).isoformat(),
+        "usage_limit": 10, "minimum_order_amount": 0
+    }).json()
+    assert validate(client)["discount_amount"] == 5
+
+    client.put(f"/promocodes/{promo['id']}", json={"discount_amount": 6})
+    assert validate(client)["discount_amount"] == 6
+
+    promo_controller.deactivate_code(test_db, promo["id"])
+    assert validate(client)["message"] == "Promo code is no longer active"
+
+    client.delete(f"/promocodes/{promo['id']}")
+    assert validate(client)["message"] == "Promo code not found"
+
+
+def test_created_and_generated_codes_replace_cached_unknowns(client, test_db, promo_cache, monkeypatch):
+    expires = (datetime.now() + timedelta(days=1)).isoformat()
+    assert validate(client, "LATE1")["message"] == "Promo code not found"
+    client.post("/promocodes/", json={"code": "late1", "discount_amount": 1, "expiration_date": expires, "usage_limit": 1,
+                                        "minimum_order_amount": 0})
+    assert validate(client, "LATE1")["is_valid"] is True
+
+    # The generator is made to produce a code that was looked up (and cached as unknown) before
+    assert validate(client, "BULK-AAAAAA")["message"] == "Promo code not found"
+    monkeypatch.setattr(promo_controller, "_random_code", lambda prefix, length: prefix + "A" * length)
+    client.post("/promocodes/bulk", json={"count": 1, "prefix": "bulk-", "length": 11, "discount_amount": 2, "expiration_date": expires})
+    assert validate(client, "BULK-AAAAAA")["is_valid"] is True
+
+
+def test_bulk_generate_makes_unique_codes_from_the_alphabet(client, test_db):
+    expires = (datetime.now() + timedelta(days=30)).isoformat()
+    request = {"count": 2000, "prefix": "sum-", "length": 10, "discount_amount": 3, "expiration_date": expires}
+    first = client.post("/promocodes/bulk", json=request).json()
+    second = client.post("/promocodes/bulk", json=request).json()
+
+    codes = first["codes"] + second["codes"]
+    assert first["created"] == second["created"] == 2000
+    assert len(set(codes)) == 4000
+    assert all(len(code) == 10 and code.startswith("SUM-") for code in codes)
+    assert set("".join(code[4:] for code in codes)) <= set(promo_controller.CODE_ALPHABET)
+    assert test_db.query(PromoCode).filter(PromoCode.code.startswith("SUM-")).count() == 4000
+    stored = test_db.query(PromoCode).filter(PromoCode.code == codes[0]).one()
+    assert (stored.usage_limit, stored.times_used, stored.is_active) == (1, 0, True)
+
+
+def test_bulk_generate_needs_six_random_characters(client):
+    response = client.post("/promocodes/bulk", json={
+        "count": 1, "prefix": "TOOLONG-", "length": 12, "discount_amount": 1, "expiration_date": "2099-01-01T00:00:00"
+    })
+    assert response.status_code == 400
@@ -0,0 +1,112 @@
+import pytest
+from datetime import datetime, timedelta
+from api.controllers import recipes as recipe_controller
+from api.dependencies.config import conf
+from api.dependencies.metrics import registry
+from api.dependencies.query_counter import QueryCounter, count_queries
+from api.models.orders import Order
+from api.models.order_details import OrderDetail
+from api.models.recipes import Recipe
+from api.models.resources import Resource
+from api.models.reviews import Review
+from api.models.sandwiches import Sandwich
+
+
+@pytest.fixture
+def reviewed_menu(test_db):
+    """10 sandwiches, each ordered and reviewed badly 3 times, each with 3 ingredients"""
+    now = datetime.now()
+    for resource_id in range(1, 4):
+        test_db.add(Resource(id=resource_id, item=f"ingredient {resource_id}", amount=5, cost_per_unit=1))
+    for sandwich_id in range(1, 11):
+        test_db.add(Sandwich(id=sandwich_id, sandwich_name=f"Sandwich {sandwich_id}", price=8, created_date=now))
+        for resource_id in range(1, 4):
+            test_db.add(Recipe(sandwich_id=sandwich_id, resource_id=resource_id, amount=2))
+        for n in range(3):
+            order_id = sandwich_id * 10 + n
+            test_db.add(Order(
+                id=order_id, customer_name="Budget Test", phone="555-3333", order_type="takeout",
+                order_date=now, total_amount=8, tracking_number=f"ORD-BUDGET{order_id}"
+            ))
+            test_db.add(OrderDetail(order_id=order_id, sandwich_id=sandwich_id, amount=1, unit_price=8, subtotal=8))
+            test_db.add(Review(
+                order_id=order_id, sandwich_id=sandwich_id, customer_name="Budget Test",
+                rating=1, comment="Cold", review_date=now - timedelta(minutes=order_id)
+            ))
+    test_db.commit()
+
+
+def test_low_rated_report_is_one_query(client, reviewed_menu, query_budget):
+    """The report stays at one query no matter how many dishes qualify"""
+    with query_budget(1):
+        response = client.get("/reviews/low-rated/")
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+    assert all(len(dish["recent_complaints"]) == 3 for dish in response.json())
+
+
+def test_review_queue_page_budget(client, reviewed_menu, query_budget):
+    """A queue page loads reviews and their sandwiches without one query per review"""
+    with query_budget(2):
+        response = client.get("/reviews/queues/attention?limit=25")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 25
+
+
+def test_recipe_details_budget(client, reviewed_menu, query_budget):
+    with query_budget(1):
+        response = client.get("/recipes/sandwich/1/details")
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+
+
+def test_ingredient_availability_budget(test_db, reviewed_menu, query_budget):
+    with query_budget(1):
+        result = recipe_controller.check_ingredient_availability(test_db, sandwich_id=1, quantity_needed=3)
+    assert result["can_fulfill"] is False
+    assert len(result["insufficient_ingredients"]) == 3
+
+
+def test_budget_failure_lists_repeated_statements(test_db, reviewed_menu, query_budget):
+    """Exceeding the budget fails with the statements and the repeated shape"""
+    with pytest.raises(AssertionError) as exc_info:
+        with query_budget(3):
+            for sandwich_id in range(1, 6):
+                test_db.query(Sandwich).filter(Sandwich.id == sandwich_id).first()
+    assert "Query budget of 3 exceeded" in str(exc_info.value)
+    assert "5x SELECT" in str(exc_info.value)
+
+
+def test_repeated_shapes_ignore_values():
+    counter = QueryCounter()
+    counter.statements = [
+        "SELECT * FROM resources WHERE resources.id = ?",
+        "SELECT * FROM resources WHERE resources.id = ?",
+        "SELECT * FROM recipes WHERE recipes.id IN (?, ?, ?)",
+        "SELECT * FROM recipes WHERE recipes.id IN (?)",
+        "SELECT * FROM orders LIMIT 10",
+    ]
+    assert counter.repeated() == [
+        ("SELECT * FROM resources WHERE resources.id = ?", 2),
+        ("SELECT * FROM recipes WHERE recipes.id IN (...)", 2),
+    ]
+
+
+def test_query_count_header_in_debug_mode(client, monkeypatch):
+    monkeypatch.setattr(conf, "debug", True)
+    with count_queries() as counter:
+        response = client.get("/orders/")
+    assert response.status_code == 200
+    assert int(response.headers["x-query-count"]) == counter.count
+
+
+def test_no_query_count_header_by_default(client):
+    response = client.get("/orders/")
+    assert "x-query-count" not in response.headers
+
+
+def test_query_count_header_matches_the_route_metrics(client, monkeypatch):
+    monkeypatch.setattr(conf, "debug", True)
+    registry.reset()
+    response = client.get("/orders/")
+    assert int(response.headers["x-query-count"]) == registry.routes[("GET", "/orders/")].query_count
@@ -0,0 +1,103 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from api.dependencies.database import LAST_WRITE_COOKIE, LAST_WRITE_HEADER, SessionRouter, get_db, get_read_db
+from api.models import model_loader
+from api.models.sandwiches import Sandwich
+from api.main import app
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    # Two SQLite files stand in for the primary and a replica that never catches up
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    model_loader.upgrade(primary)
+    model_loader.upgrade(replica)
+    router = SessionRouter(primary, replica, read_your_writes_seconds=30)
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = router.write
+    app.dependency_overrides[get_read_db] = router.read
+    yield primary, replica
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(overrides)
+    primary.dispose()
+    replica.dispose()
+
+
+def _create_order(client):
+    response = client.post("/orders/", json={"customer_name": "Replica", "phone": "555-0100", "order_type": "takeout"})
+    assert response.status_code == 200
+    return response
+
+
+def test_reads_go_to_the_replica(replicated):
+    _, replica = replicated
+    with Session(replica) as db:
+        db.add(Sandwich(sandwich_name="Replica Only", price=5, category="classic"))
+        db.commit()
+
+    with TestClient(app) as client:
+        assert [item["sandwich_name"] for item in client.get("/sandwiches/").json()] == ["Replica Only"]
+
+
+def test_client_reads_its_own_write_from_the_primary(replicated):
+    with TestClient(app) as client:
+        response = _create_order(client)
+        assert LAST_WRITE_COOKIE in response.cookies
+        tracked = client.get(f"/orders/track/{response.json()['tracking_number']}")
+        assert tracked.status_code == 200
+
+    # Another client has not written anything, so it reads the (lagging) replica
+    with TestClient(app) as other_client:
+        assert other_client.get(f"/orders/track/{response.json()['tracking_number']}").status_code == 404
+
+
+def test_stale_write_cookie_reads_the_replica(replicated):
+    with TestClient(app) as client:
+        tracking_number = _create_order(client).json()["tracking_number"]
+        client.cookies.set(LAST_WRITE_COOKIE, str(time.time() - 60))
+        assert client.get(f"/orders/track/{tracking_number}").status_code == 404
+
+
+def test_no_cookie_without_a_replica(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'single.db'}")
+    model_loader.upgrade(engine)
+    router = SessionRouter(engine)
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = router.write
+    app.dependency_overrides[get_read_db] = router.read
+    try:
+        with TestClient(app) as client:
+            response = _create_order(client)
+            assert LAST_WRITE_COOKIE not in response.cookies
+            assert client.get(f"/orders/track/{response.json()['tracking_number']}").status_code == 200
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+        engine.dispose()
+
+
+def test_clients_without_cookies_send_the_header_back(replicated):
+    with TestClient(app) as client:
+        response = _create_order(client)
+    tracking_number = response.json()["tracking_number"]
+    last_write = response.headers[LAST_WRITE_HEADER]
+
+    with TestClient(app) as cookieless:
+        assert cookieless.get(f"/orders/track/{tracking_number}").status_code == 404
+        tracked = cookieless.get(f"/orders/track/{tracking_number}", headers={LAST_WRITE_HEADER: last_write})
+        assert tracked.status_code == 200
+
+
+def test_routes_returning_their_own_response_still_mark_the_write(replicated):
+    with TestClient(app) as client:
+        sandwich = client.post("/sandwiches/", json={"sandwich_name": "Gone Sub", "price": 5, "category": "classic"}).json()
+        client.cookies.clear()
+        response = client.delete(f"/sandwiches/{sandwich['id']}")
+        assert response.status_code == 204
+        assert LAST_WRITE_COOKIE in response.cookies
+        assert LAST_WRITE_HEADER in response.headers
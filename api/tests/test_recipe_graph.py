@@ -0,0 +1,98 @@
+import pytest
+from api.dependencies.jobs import queue
+from api.dependencies.query_counter import count_queries
+from api.dependencies.recipe_graph import RecipeGraph, graph
+from api.models import recipes as recipe_model
+from api.models import resources as resource_model
+
+
+@pytest.fixture(autouse=True)
+def empty_graph():
+    graph.reset()
+    yield
+    graph.reset()
+
+
+@pytest.fixture
+def menu(client):
+    club = client.post("/sandwiches/", json={"sandwich_name": "Graph Club", "price": 10, "category": "classic"}).json()
+    blt = client.post("/sandwiches/", json={"sandwich_name": "Graph BLT", "price": 8, "category": "classic"}).json()
+    bread = client.post("/resources/", json={"item": "Graph Bread", "amount": 50, "unit": "slices", "cost_per_unit": 0.5}).json()
+    bacon = client.post("/resources/", json={"item": "Graph Bacon", "amount": 50, "unit": "strips", "cost_per_unit": 1.25}).json()
+    sauce = client.post("/resources/", json={"item": "Graph Sauce", "amount": 50, "unit": "oz"}).json()
+    for sandwich, resource, amount in ((club, bread, 3), (club, bacon, 2), (blt, bread, 2), (blt, sauce, 1)):
+        client.post("/recipes/", json={"sandwich_id": sandwich["id"], "resource_id": resource["id"], "amount": amount})
+    return club, blt, bread, bacon, sauce
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_costs_come_from_one_load(test_db, menu):
+    club, blt, bread, bacon, _ = menu
+    local = RecipeGraph(ttl_seconds=60)
+    with count_queries() as counter:
+        costs = local.ingredient_costs(test_db, [club["id"], blt["id"], 424242])
+    assert counter.count == 2  # Recipes, then resource costs
+    assert costs == {club["id"]: (4.0, False), blt["id"]: (1.0, True), 424242: (0.0, False)}
+    assert sorted(local.ingredients(test_db, club["id"])) == sorted([(bread["id"], 3), (bacon["id"], 2)])
+
+    with count_queries() as counter:
+        local.ingredient_costs(test_db, [club["id"]])
+    assert counter.count == 0
+
+
+def test_invalidation_reloads_only_the_dirty_rows(test_db, menu):
+    club, blt, bread, bacon, _ = menu
+    local = RecipeGraph(ttl_seconds=60)
+    local.ingredient_costs(test_db, [club["id"]])
+
+    test_db.query(recipe_model.Recipe).filter(recipe_model.Recipe.sandwich_id == club["id"],
+                                              recipe_model.Recipe.resource_id == bacon["id"]).delete()
+    test_db.query(resource_model.Resource).filter(resource_model.Resource.id == bread["id"]).update({"cost_per_unit": 1})
+    test_db.commit()
+    local.invalidate_sandwich(club["id"])
+    local.invalidate_resource(bread["id"])
+    queue.drain()  # The refresh job is for the app's graph, not this one
+
+    with count_queries() as counter:
+        costs = local.ingredient_costs(test_db, [club["id"], blt["id"]])
+    assert counter.count == 2
+    assert all("IN (" in statement for statement in counter.statements)
+    assert costs == {club["id"]: (3.0, False), blt["id"]: (2.0, True)}
+
+
+def test_edits_from_other_workers_show_up_after_the_ttl(test_db, menu):
+    club, _, bread, _, _ = menu
+    clock = FakeClock()
+    local = RecipeGraph(ttl_seconds=60, clock=clock)
+    assert local.ingredient_costs(test_db, [club["id"]])[club["id"]] == (4.0, False)
+
+    # Another worker changed the cost: nothing invalidated this process's copy
+    test_db.query(resource_model.Resource).filter(resource_model.Resource.id == bread["id"]).update({"cost_per_unit": 1})
+    test_db.commit()
+    clock.now += 59
+    assert local.ingredient_costs(test_db, [club["id"]])[club["id"]] == (4.0, False)
+    clock.now += 1
+    assert local.ingredient_costs(test_db, [club["id"]])[club["id"]] == (5.5, False)
+
+
+def test_margin_report_follows_recipe_and_cost_edits(client, menu):
+    club, blt, bread, bacon, _ = menu
+    report = {row["sandwich_id"]: row for row in client.get("/recipes/margins/").json()}
+    assert report[club["id"]] == {
+        "sandwich_id": club["id"], "sandwich_name": "Graph Club", "is_available": True, "price": 10.0,
+        "ingredient_cost": 4.0, "margin": 6.0, "margin_percent": 60.0, "has_unpriced_ingredients": False
+    }
+    assert report[blt["id"]]["has_unpriced_ingredients"] is True
+
+    client.put(f"/resources/{bacon['id']}", json={"cost_per_unit": 2})
+    client.post("/recipes/", json={"sandwich_id": blt["id"], "resource_id": bacon["id"], "amount": 1})
+    report = {row["sandwich_id"]: row for row in client.get("/recipes/margins/").json()}
+    assert report[club["id"]]["ingredient_cost"] == 5.5
+    assert report[blt["id"]]["ingredient_cost"] == 3.0
@@ -0,0 +1,167 @@
+import base64
+import threading
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from api.controllers import reviews as review_controller
+from api.dependencies.database import unique_violation
+from api.models import model_loader
+from api.models.promocodes import PromoCode
+from api.models.reviews import Review
+from api.schemas import reviews as review_schema
+
+DUPLICATE = "You have already reviewed this sandwich from this order!"
+
+
+@pytest.fixture
+def ordered_sandwich(client):
+    sandwich = client.post("/sandwiches/", json={"sandwich_name": "Dupe Melt", "price": 7, "category": "classic"}).json()
+    order = client.post("/orders/", json={"customer_name": "Twice", "phone": "555-0901", "order_type": "takeout"}).json()
+    client.post("/orderdetails/", json={"order_id": order["id"], "sandwich_id": sandwich["id"], "amount": 1, "unit_price": 7})
+    return order, sandwich
+
+
+def test_second_review_of_the_same_order_line_is_rejected(client, ordered_sandwich):
+    order, sandwich = ordered_sandwich
+    review = {"order_id": order["id"], "sandwich_id": sandwich["id"], "rating": 4}
+    assert client.post("/reviews/", json=review).status_code == 200
+
+    response = client.post("/reviews/", json=dict(review, rating=1))
+    assert response.status_code == 400
+    assert response.json()["detail"] == DUPLICATE
+
+
+def test_concurrent_duplicate_reviews_leave_one(test_engine, test_db, ordered_sandwich):
+    order, sandwich = ordered_sandwich
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+    request = review_schema.ReviewCreate(order_id=order["id"], sandwich_id=sandwich["id"], rating=5)
+    # Both verify the order before either inserts, as two simultaneous requests would
+    verified = threading.Barrier(2)
+    original_create = review_controller.crud.create
+    outcomes = []
+
+    def create_after_both_verified(db, values):
+        verified.wait(timeout=5)
+        return original_create(db, values)
+
+    def post_review():
+        db = sessions()
+        try:
+            review_controller.create(db, request)
+            outcomes.append("created")
+        except HTTPException as error:
+            outcomes.append(error.detail)
+        finally:
+            db.close()
+
+    review_controller.crud.create = create_after_both_verified
+    try:
+        threads = [threading.Thread(target=post_review) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        review_controller.crud.create = original_create
+
+    assert sorted(outcomes) == sorted(["created", DUPLICATE])
+    assert test_db.query(Review).filter(Review.order_id == order["id"]).count() == 1
+
+
+def test_other_integrity_errors_are_not_reported_as_duplicates(test_db):
+    code = dict(code="TWICE", discount_amount=1, expiration_date=datetime(2099, 1, 1), usage_limit=1, minimum_order_amount=0)
+    test_db.add(PromoCode(**code))
+    test_db.commit()
+    test_db.add(PromoCode(**code))
+    with pytest.raises(IntegrityError) as error:
+        test_db.commit()
+    test_db.rollback()
+    assert not unique_violation(error.value, Review.__table__, "uq_reviews_order_sandwich")
+
+
+def test_migration_stops_on_duplicate_reviews_without_deleting_any(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        # A database from before the unique constraint
+        model_loader.MIGRATIONS[0][2](connection)
+        for review_id, order_id, sandwich_id in ((1, 1, 1), (2, 1, 1), (3, 1, 2), (4, 2, 1), (5, 1, 1)):
+            connection.execute(text(
+                "INSERT INTO reviews (id, order_id, sandwich_id, customer_name, rating, review_date) "
+                f"VALUES ({review_id}, {order_id}, {sandwich_id}, 'Legacy', 3, '2024-01-01 00:00:00')"
+            ))
+
+    with pytest.raises(RuntimeError) as error:
+        model_loader.upgrade(engine)
+    assert "order 1, sandwich 1: review ids 1, 2, 5" in str(error.value)
+    assert model_loader.current_version(engine) == 0  # Rolled back as a whole
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM reviews")).scalar() == 5
+        connection.execute(text("DELETE FROM reviews WHERE id IN (2, 5)"))
+
+    assert model_loader.upgrade(engine) == model_loader.SCHEMA_VERSION
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id FROM reviews ORDER BY id")).scalars().all() == [1, 3, 4]
+        assert "uq_reviews_order_sandwich" in {index["name"] for index in inspect(connection).get_indexes("reviews")}
+    engine.dispose()
+
+
+@pytest.fixture
+def review_queue(client):
+    """Five unanswered reviews of one order, oldest first; ratings 1 to 5"""
+    order = client.post("/orders/", json={"customer_name": "Queue", "phone": "555-0902", "order_type": "takeout"}).json()
+    reviews = []
+    for rating in range(1, 6):
+        sandwich = client.post("/sandwiches/", json={"sandwich_name": f"Queue {rating}", "price": 5, "category": "classic"}).json()
+        client.post("/orderdetails/", json={"order_id": order["id"], "sandwich_id": sandwich["id"], "amount": 1, "unit_price": 5})
+        reviews.append(client.post("/reviews/", json={
+            "order_id": order["id"], "sandwich_id": sandwich["id"], "rating": rating
+        }).json())
+    return reviews
+
+
+def _queue_pages(client, path, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit} if cursor is None else {"limit": limit, "cursor": cursor}
+        page = client.get(path, params=params).json()
+        pages.append([item["id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_queue_pages_through_every_review_once(client, review_queue):
+    newest_first = [review["id"] for review in reversed(review_queue)]
+    # Same review_date throughout, so the pages only hold together through the id tie-break
+    assert _queue_pages(client, "/reviews/queues/unanswered", limit=2) == [
+        newest_first[0:2], newest_first[2:4], newest_first[4:]
+    ]
+    assert _queue_pages(client, "/reviews/queues/unanswered", limit=5) == [newest_first]
+    assert _queue_pages(client, "/reviews/queues/attention", limit=1) == [[newest_first[3]], [newest_first[4]]]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00").decode(),
+    base64.urlsafe_b64encode(b"yesterday|3").decode(),
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00|three").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_tampered_cursor_is_rejected(client, cursor):
+    response = client.get("/reviews/queues/unanswered", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor!"
+
+
+def test_staff_response_takes_a_review_out_of_the_queues(client, review_queue):
+    lowest = review_queue[0]
+    response = client.put(f"/reviews/{lowest['id']}/response", json={"staff_response": "Sorry, on us next time"})
+    assert response.status_code == 200
+    assert response.json()["response_date"] is not None
+
+    unanswered = [item["id"] for item in client.get("/reviews/queues/unanswered").json()["items"]]
+    assert lowest["id"] not in unanswered and len(unanswered) == 4
+    assert [item["id"] for item in client.get("/reviews/queues/attention").json()["items"]] == [review_queue[1]["id"]]
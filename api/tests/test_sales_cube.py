@@ -0,0 +1,185 @@
+import threading
+from datetime import datetime
+import pytest
+from api.dependencies.sales_cube import SalesCube
+from api.models import order_details as order_detail_model
+from api.models import orders as order_model
+from api.models import sandwiches as sandwich_model
+
+pytest.importorskip("numpy")
+
+MONDAY_NOON = datetime(2024, 3, 4, 12, 30)
+TUESDAY_EVENING = datetime(2024, 3, 5, 18, 5)
+
+
+def _sandwich(db, name, price, category):
+    sandwich = sandwich_model.Sandwich(sandwich_name=name, price=price, category=category)
+    db.add(sandwich)
+    db.commit()
+    return sandwich
+
+
+def _order(db, order_date, order_type, lines):
+    order = order_model.Order(customer_name="Cube", phone="555-0900", order_type=order_type, order_date=order_date,
+                              total_amount=0, tracking_number=f"CUBE-{order_date.isoformat()}-{order_type}")
+    db.add(order)
+    db.flush()
+    for sandwich, amount in lines:
+        db.add(order_detail_model.OrderDetail(order_id=order.id, sandwich_id=sandwich.id, amount=amount,
+                                              unit_price=sandwich.price, subtotal=sandwich.price * amount))
+    db.commit()
+    return order
+
+
+@pytest.fixture
+def menu(test_db):
+    club = _sandwich(test_db, "Cube Club", 8, "classic")
+    veggie = _sandwich(test_db, "Cube Veggie", 6.5, "vegetarian, spicy")
+    _order(test_db, MONDAY_NOON, "takeout", [(club, 2), (veggie, 1)])
+    _order(test_db, TUESDAY_EVENING, "delivery", [(veggie, 3)])
+    return club, veggie
+
+
+def _by_key(groups):
+    return {group["key"]: (group["lines"], group["quantity"], group["revenue"]) for group in groups}
+
+
+def test_group_bys_match_the_order_lines(test_db, menu):
+    club, veggie = menu
+    cube = SalesCube(capacity=1)
+    assert cube.sync(test_db) == 3
+
+    assert _by_key(cube.query("hour")) == {12: (2, 3, 22.5), 18: (1, 3, 19.5)}
+    assert _by_key(cube.query("weekday")) == {"Monday": (2, 3, 22.5), "Tuesday": (1, 3, 19.5)}
+    assert _by_key(cube.query("date")) == {"2024-03-04": (2, 3, 22.5), "2024-03-05": (1, 3, 19.5)}
+    assert _by_key(cube.query("order_type")) == {"takeout": (2, 3, 22.5), "delivery": (1, 3, 19.5)}
+    assert _by_key(cube.query("category")) == {"classic": (1, 2, 16.0), "spicy": (2, 4, 26.0), "vegetarian": (2, 4, 26.0)}
+    sandwiches = cube.query("sandwich")
+    assert _by_key(sandwiches) == {club.id: (1, 2, 16.0), veggie.id: (2, 4, 26.0)}
+    assert sandwiches[0]["sandwich_name"] == "Cube Club"
+
+
+def test_filters_combine(test_db, menu):
+    club, veggie = menu
+    cube = SalesCube()
+    cube.sync(test_db)
+
+    assert _by_key(cube.query("sandwich", start=datetime(2024, 3, 5))) == {veggie.id: (1, 3, 19.5)}
+    assert _by_key(cube.query("sandwich", end=datetime(2024, 3, 4, 23))) == {club.id: (1, 2, 16.0), veggie.id: (1, 1, 6.5)}
+    assert _by_key(cube.query("order_type", sandwich_ids=[club.id])) == {"takeout": (1, 2, 16.0)}
+    assert _by_key(cube.query("hour", category="vegetarian", order_type="delivery")) == {18: (1, 3, 19.5)}
+    assert cube.query("hour", order_type="catering") == []
+    with pytest.raises(ValueError):
+        cube.query("month")
+
+
+def test_sync_appends_only_new_lines_and_rebuild_picks_up_edits(test_db, menu):
+    club, _ = menu
+    cube = SalesCube(refresh_seconds=0)
+    cube.sync(test_db)
+    _order(test_db, TUESDAY_EVENING, "takeout", [(club, 1)])
+
+    assert cube.sync(test_db) == 1
+    assert cube.sync(test_db) == 0
+    assert len(cube) == 4
+
+    test_db.query(order_detail_model.OrderDetail).filter(order_detail_model.OrderDetail.sandwich_id == club.id).delete()
+    test_db.commit()
+    assert len(cube.query("sandwich", sandwich_ids=[club.id])) == 1  # Appended lines are never revisited...
+    assert cube.rebuild(test_db) == 2
+    assert cube.query("sandwich", sandwich_ids=[club.id]) == []  # ...until the rebuild
+
+
+def test_sales_route_reads_from_the_cube(client, test_db, menu, monkeypatch):
+    _, veggie = menu
+    monkeypatch.setattr("api.controllers.analytics.cube", SalesCube())
+
+    response = client.get("/analytics/sales", params={"group_by": "weekday", "sandwich_id": [veggie.id]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["lines"] == 3 and body["group_by"] == "weekday"
+    assert _by_key(body["groups"]) == {"Monday": (1, 1, 6.5), "Tuesday": (1, 3, 19.5)}
+
+    assert client.get("/analytics/sales", params={"group_by": "month"}).status_code == 400
+    assert client.post("/analytics/sales/rebuild").json()["lines"] == 3
+
+
+def test_sales_route_needs_numpy(client, monkeypatch):
+    monkeypatch.setattr("api.controllers.analytics.cube", None)
+    assert client.get("/analytics/sales").status_code == 503
+
+
+def _line(db, line_id, order_date, sandwich):
+    order = _order(db, order_date, "takeout", [])
+    db.add(order_detail_model.OrderDetail(id=line_id, order_id=order.id, sandwich_id=sandwich.id, amount=1,
+                                          unit_price=sandwich.price, subtotal=sandwich.price))
+    db.commit()
+
+
+def test_lines_committed_out_of_id_order_are_picked_up(test_db, menu):
+    club, _ = menu
+    cube = SalesCube(refresh_seconds=0)
+    cube.sync(test_db)
+    last = cube.stats()["last_line_id"]
+
+    _line(test_db, last + 3, datetime(2024, 3, 6, 9), club)
+    assert cube.sync(test_db) == 1
+    # Committed after the higher id was already loaded (concurrent checkouts, replica lag)
+    _line(test_db, last + 1, datetime(2024, 3, 6, 10), club)
+    assert cube.sync(test_db) == 1
+    assert _by_key(cube.query("hour", start=datetime(2024, 3, 6))) == {9: (1, 1, 8.0), 10: (1, 1, 8.0)}
+
+    cube.gap_seconds = 0  # Ids still missing are given up on (the rebuild has the final word)
+    assert cube.sync(test_db) == 0 and cube._lines.gaps == {}
+
+
+def test_queries_and_syncs_do_not_wait_for_a_rebuild(test_db, menu):
+    cube = SalesCube()
+    cube.sync(test_db)
+    loading, release = threading.Event(), threading.Event()
+    load = cube._load
+
+    def slow_load(db, lines, now):
+        loading.set()
+        release.wait(5)
+        return load(db, lines, now)
+
+    cube._load = slow_load
+    rebuild = threading.Thread(target=cube.rebuild, args=(test_db,))
+    rebuild.start()
+    try:
+        assert loading.wait(5)
+        assert cube.sync(test_db, force=True) == 0  # Another sync is running: answer from what is loaded
+        assert sum(group["lines"] for group in cube.query("hour")) == 3
+    finally:
+        release.set()
+        rebuild.join()
+    assert len(cube) == 3
+
+
+def test_due_rebuild_runs_in_the_background(test_db, menu, test_engine):
+    from sqlalchemy.orm import sessionmaker
+    club, _ = menu
+    cube = SalesCube(rebuild_seconds=3600)
+    cube.sync(test_db)
+    test_db.query(order_detail_model.OrderDetail).filter(order_detail_model.OrderDetail.sandwich_id == club.id).delete()
+    test_db.commit()
+
+    release = threading.Event()
+    load = cube._load
+    cube._load = lambda db, lines, now: release.wait(5) and load(db, lines, now)
+    cube.rebuild_seconds = 0
+    try:
+        assert cube.sync(test_db, session_factory=sessionmaker(bind=test_engine)) == 0
+        assert len(cube) == 3  # Still the old lines until the rebuild is swapped in
+    finally:
+        release.set()
+        cube._rebuilder.join(5)
+    assert len(cube) == 2 and cube.query("sandwich", sandwich_ids=[club.id]) == []
+
+
+def test_unknown_group_by_is_rejected_before_syncing(client, menu, monkeypatch):
+    cube = SalesCube()
+    monkeypatch.setattr("api.controllers.analytics.cube", cube)
+    assert client.get("/analytics/sales", params={"group_by": "month"}).status_code == 400
+    assert cube.stats()["last_line_id"] == 0 and len(cube) == 0
@@ -0,0 +1,217 @@
+import threading
+from datetime import timedelta
+import pytest
+from api.dependencies import snowflake
+from api.dependencies.config import conf
+from api.dependencies.database import create_db_engine
+from api.dependencies.query_counter import count_queries
+from api.dependencies.snowflake import (
+    EPOCH_MS, MAX_SEQUENCE, NodeIdLease, SnowflakeGenerator, _utcnow, decode, encode, timestamp_ms, tracking_number
+)
+from api.models import model_loader
+from api.models.node_leases import NodeLease
+
+
+class FakeClock:
+    def __init__(self, now=EPOCH_MS + 1000):
+        self.now = now
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.now
+
+
+def test_ids_increase_and_carry_their_timestamp():
+    clock = FakeClock()
+    generator = SnowflakeGenerator(node_id=7, clock=clock)
+    first, second = generator.next_id(), generator.next_id()
+    clock.now += 5
+    third = generator.next_id()
+
+    assert first < second < third
+    assert timestamp_ms(first) == timestamp_ms(second) == EPOCH_MS + 1000
+    assert timestamp_ms(third) == EPOCH_MS + 1005
+
+
+def test_nodes_never_collide_in_the_same_millisecond():
+    clock = FakeClock()
+    ids = set()
+    for node_id in (0, 1, 1023):
+        generator = SnowflakeGenerator(node_id=node_id, clock=clock)
+        ids.update(generator.next_id() for _ in range(100))
+    assert len(ids) == 300
+
+
+def test_sequence_overflow_waits_for_the_next_millisecond():
+    clock = FakeClock()
+    generator = SnowflakeGenerator(node_id=1, clock=clock)
+    ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 1)]
+
+    def tick():
+        clock.now += 1
+        return clock.now
+
+    generator._clock = tick
+    overflow = generator.next_id()
+    assert overflow > ids[-1]
+    assert timestamp_ms(overflow) == EPOCH_MS + 1001
+
+
+def test_clock_going_backwards_never_repeats_an_id():
+    clock = FakeClock()
+    generator = SnowflakeGenerator(node_id=1, clock=clock)
+    before = generator.next_id()
+    clock.now -= 50
+    assert generator.next_id() > before
+
+
+def test_overflow_after_the_clock_stepped_back_sleeps_instead_of_spinning():
+    clock = FakeClock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += round(seconds * 1000)
+
+    generator = SnowflakeGenerator(node_id=1, clock=clock, sleep=sleep)
+    generator.next_id()
+    clock.now -= 50
+    ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 1)]
+
+    assert sleeps == [0.051]
+    assert clock.calls < 10 + len(ids)
+    assert ids == sorted(set(ids))
+    assert timestamp_ms(ids[-1]) == EPOCH_MS + 1001
+
+
+def test_unique_across_threads():
+    generator = SnowflakeGenerator(node_id=3)
+    ids = []
+
+    def take():
+        ids.extend(generator.next_id() for _ in range(2000))
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 8000
+
+
+def test_encoding_is_fixed_width_and_sorts_like_the_ids():
+    values = [0, 1, 31, 32, 2 ** 40, 2 ** 63 - 1]
+    encoded = [encode(value) for value in values]
+    assert {len(text) for text in encoded} == {13}
+    assert encoded == sorted(encoded)
+    assert [decode(text) for text in encoded] == values
+
+
+def test_node_id_is_validated():
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(node_id=1024)
+
+
+@pytest.fixture
+def lease_engine():
+    engine = create_db_engine("sqlite://")
+    model_loader.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+def _leases(engine):
+    with engine.connect() as connection:
+        return dict(connection.execute(NodeLease.__table__.select().with_only_columns(
+            NodeLease.node_id, NodeLease.owner)).all())
+
+
+def test_workers_lease_different_node_ids(lease_engine):
+    leases = [NodeIdLease(lease_engine) for _ in range(8)]
+    for lease in leases:
+        lease.start()
+    node_ids = [lease.node_id() for lease in leases]
+
+    assert len(set(node_ids)) == 8
+    assert set(_leases(lease_engine)) == set(node_ids)
+    leases[0].start()
+    assert leases[0].node_id() == node_ids[0]  # Held, not claimed again
+
+    for lease in leases:
+        lease.release()
+    assert _leases(lease_engine) == {}
+
+
+def test_expired_lease_is_taken_over_and_renewed_lease_is_not(lease_engine):
+    now = [0.0]
+    crashed = NodeIdLease(lease_engine, lease_seconds=60, clock=lambda: now[0])
+    node_id = crashed._claim()  # Claimed without the renewal thread, so the test renews by hand
+    with lease_engine.begin() as connection:
+        connection.execute(NodeLease.__table__.update().values(expires_at=_utcnow() - timedelta(seconds=1)))
+    with lease_engine.begin() as connection:
+        for other in range(1024):  # Every other node id is taken
+            if other != node_id:
+                connection.execute(NodeLease.__table__.insert().values(
+                    node_id=other, owner="busy", expires_at=_utcnow() + timedelta(hours=1)))
+
+    successor = NodeIdLease(lease_engine)
+    assert successor._claim() == node_id
+
+    # The old owner's renewal fails, there is no other id to claim, and it stops handing out the old one
+    with pytest.raises(RuntimeError):
+        crashed.renew()
+    with pytest.raises(RuntimeError):
+        crashed.node_id()
+    assert _leases(lease_engine)[node_id] == successor._owner
+
+    assert successor.renew() == node_id
+
+
+def test_node_id_is_refused_once_the_lease_ran_out_unrenewed(lease_engine):
+    now = [0.0]
+    lease = NodeIdLease(lease_engine, lease_seconds=60, clock=lambda: now[0])
+    node_id = lease._claim()
+    now[0] += 59
+    assert lease.node_id() == node_id
+    now[0] += 1  # Every renewal failed for a whole lease: another worker may have the id by now
+    with pytest.raises(RuntimeError):
+        lease.node_id()
+    assert lease.renew() == node_id and lease.node_id() == node_id
+
+
+def test_generator_reads_its_lease_without_queries(lease_engine):
+    generator = SnowflakeGenerator(lease=NodeIdLease(lease_engine))
+    with pytest.raises(RuntimeError):
+        generator.next_id()  # Not started
+
+    generator.start()
+    with count_queries() as counter:
+        values = [generator.next_id() for _ in range(100)]
+    assert counter.count == 0
+    node_id = (values[0] >> 12) & 1023
+    assert _leases(lease_engine).keys() == {node_id}
+    generator.release()
+    assert _leases(lease_engine) == {}
+
+
+def test_configured_node_id_needs_no_lease(monkeypatch):
+    monkeypatch.setattr(conf, "node_id", 7)
+    generator = SnowflakeGenerator(lease=NodeIdLease(bind=object()))  # Any database access would fail
+    generator.start()
+    assert (generator.next_id() >> 12) & 1023 == 7
+    generator.release()
+
+
+def test_order_is_refused_while_the_node_id_is_not_held(client, lease_engine, monkeypatch):
+    monkeypatch.setattr(snowflake, "generator", SnowflakeGenerator(lease=NodeIdLease(lease_engine)))
+    response = client.post("/orders/", json={"customer_name": "A", "phone": "555-0401", "order_type": "takeout"})
+    assert response.status_code == 503
+    assert client.get("/orders/").json() == []
+
+
+def test_tracking_numbers_are_time_ordered(client):
+    first = client.post("/orders/", json={"customer_name": "A", "phone": "555-0401", "order_type": "takeout"}).json()
+    second = client.post("/orders/", json={"customer_name": "B", "phone": "555-0402", "order_type": "takeout"}).json()
+    assert first["tracking_number"].startswith("ORD-") and len(first["tracking_number"]) == 17
+    assert first["tracking_number"] < second["tracking_number"] < tracking_number()